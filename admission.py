@@ -0,0 +1,211 @@
+"""
+Admission control and backpressure for the Flask API routes.
+
+Each expensive route belongs to a route class with its own limits:
+
+- ``concurrency`` requests run at once
+- up to ``queue`` more wait, each for at most ``timeout`` seconds
+- anything beyond that is rejected at once with 503 and a Retry-After
+  estimated from recent service times
+
+so a slow upstream model turns into fast, explicit rejections instead of
+requests piling up in gunicorn until they time out. A streamed response
+keeps its slot until the server closes it; a view whose work outlives its
+response (the SSE producer thread) takes the slot over with
+``detach_admission()`` and releases it itself. Defaults are below;
+ADMISSION_LIMITS overrides them per class. Admitted and queued requests
+both hold a gthread worker thread, so the classes' concurrency plus queue
+must add up to no more than GUNICORN_THREADS, or requests would queue in
+gunicorn again, past admission control.
+
+    @app.route("/api/query", methods=["POST"])
+    @admit("query")
+    def api_query(): ...
+"""
+import functools
+import json
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from flask import g, jsonify, make_response
+
+from config import ADMISSION_ENABLED, ADMISSION_LIMITS, GUNICORN_THREADS
+
+logger = logging.getLogger(__name__)
+
+# 28 of the default 32 threads; the rest serve the unadmitted routes
+ROUTE_CLASSES: Dict[str, Dict[str, float]] = {
+    "query":  {"concurrency": 6, "queue": 3, "timeout": 5},
+    "stream": {"concurrency": 8, "queue": 4, "timeout": 5},
+    # SSE reconnects only replay a buffer, but each holds a thread while it reads
+    "resume": {"concurrency": 4, "queue": 0, "timeout": 0},
+    # dev evaluation: one request can run dozens of RAG calls
+    "eval":   {"concurrency": 2, "queue": 1, "timeout": 2},
+}
+
+try:
+    for _name, _limits in json.loads(ADMISSION_LIMITS or "{}").items():
+        ROUTE_CLASSES[_name] = {**ROUTE_CLASSES.get(_name, ROUTE_CLASSES["query"]), **_limits}
+except (ValueError, AttributeError):
+    logger.error("Ignoring invalid ADMISSION_LIMITS: %r", ADMISSION_LIMITS)
+
+_threads_needed = sum(int(c["concurrency"]) + int(c["queue"]) for c in ROUTE_CLASSES.values())
+if _threads_needed > GUNICORN_THREADS:
+    logger.warning(
+        "Admission limits allow %d active and queued requests but GUNICORN_THREADS is %d",
+        _threads_needed, GUNICORN_THREADS,
+    )
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded, deadline-limited wait queue."""
+
+    def __init__(self, name: str, concurrency: int, queue: int, timeout: float) -> None:
+        self.name = name
+        self.concurrency = max(int(concurrency), 1)
+        self.queue = max(int(queue), 0)
+        self.timeout = float(timeout)
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+        # moving average of how long an admitted request holds its slot
+        self.service_time = 1.0
+        # statistics
+        self.counters = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_timeout": 0}
+        self.max_waiting = 0
+
+    def enter(self) -> Optional[float]:
+        """Take a slot and return the admission time, or None when rejected."""
+        with self._cond:
+            if self.active < self.concurrency and not self.waiting:
+                return self._admit()
+            if self.waiting >= self.queue:
+                self.counters["rejected_full"] += 1
+                return None
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            self.counters["queued"] += 1
+            deadline = time.monotonic() + self.timeout
+            try:
+                while self.active >= self.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters["rejected_timeout"] += 1
+                        return None
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            return self._admit()
+
+    def _admit(self) -> float:
+        self.active += 1
+        self.counters["admitted"] += 1
+        return time.monotonic()
+
+    def leave(self, admitted_at: float) -> None:
+        with self._cond:
+            self.active -= 1
+            self.service_time = 0.8 * self.service_time + 0.2 * (time.monotonic() - admitted_at)
+            self._cond.notify()
+
+    def retry_after(self) -> int:
+        """Whole seconds until the current backlog has likely drained."""
+        with self._cond:
+            backlog = self.active + self.waiting + 1
+            return max(1, math.ceil(self.service_time * backlog / self.concurrency))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self.counters,
+                "concurrency": self.concurrency,
+                "queue": self.queue,
+                "timeout_s": self.timeout,
+                "active": self.active,
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "service_time_s": round(self.service_time, 2),
+            }
+
+
+_controllers: Dict[str, AdmissionController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller(route_class: str) -> AdmissionController:
+    with _controllers_lock:
+        controller = _controllers.get(route_class)
+        if controller is None:
+            limits = ROUTE_CLASSES.get(route_class, ROUTE_CLASSES["query"])
+            controller = _controllers[route_class] = AdmissionController(route_class, **limits)
+        return controller
+
+
+def busy_response(wait: int) -> Any:
+    """503 telling the client to retry in ``wait`` seconds."""
+    response = make_response(jsonify({
+        "error": f"The server is busy, please retry in {wait} seconds.",
+        "retry_after": wait,
+    }), 503)
+    response.headers["Retry-After"] = str(wait)
+    return response
+
+
+def detach_admission() -> Optional[Callable[[], None]]:
+    """
+    Take over the current request's admission slot: ``admit`` no longer
+    releases it with the response, the returned function does (once). None
+    when the request holds no slot.
+    """
+    slot = g.pop("admission_slot", None)
+    if slot is None:
+        return None
+    controller, admitted_at = slot
+    once = threading.Lock()
+
+    def release() -> None:
+        if once.acquire(blocking=False):
+            controller.leave(admitted_at)
+
+    return release
+
+
+def admit(route_class: str) -> Callable:
+    """Decorator: run the view under ``route_class``'s admission controller."""
+    def decorator(view: Callable) -> Callable:
+        @functools.wraps(view)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not ADMISSION_ENABLED:
+                return view(*args, **kwargs)
+            controller = get_controller(route_class)
+            admitted_at = controller.enter()
+            if admitted_at is None:
+                wait = controller.retry_after()
+                logger.warning("Rejected %s request (%s busy), retry after %ds", view.__name__, route_class, wait)
+                return busy_response(wait)
+            g.admission_slot = (controller, admitted_at)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                if g.pop("admission_slot", None) is not None:
+                    controller.leave(admitted_at)
+                raise
+            if g.pop("admission_slot", None) is None:
+                # detached: the view releases the slot itself
+                return response
+            if response.is_streamed:
+                response.call_on_close(lambda: controller.leave(admitted_at))
+            else:
+                controller.leave(admitted_at)
+            return response
+        return wrapper
+    return decorator
+
+
+def get_admission_stats() -> Dict[str, Dict[str, Any]]:
+    with _controllers_lock:
+        controllers = dict(_controllers)
+    return {name: c.stats() for name, c in controllers.items()}
@@ -0,0 +1,529 @@
+"""
+Asyncio counterpart of FlaskRAGAssistant.
+
+Same public surface as coroutines and async generators, built on
+AsyncAzureOpenAI and the async SearchClient, so one process can keep hundreds
+of RAG requests in flight without a thread per request:
+
+    assistant = AsyncFlaskRAGAssistant()
+    results = await asyncio.gather(*(assistant.generate_rag_response(q) for q in queries))
+
+    async for piece in assistant.stream_rag_response(query, settings):
+        ...
+
+Settings resolution, the caches, rerank/dedup/compression/packing and citation
+handling are inherited from FlaskRAGAssistant; only the network calls differ.
+The sync private helpers that do network I/O (``_retrieve``, ``_rerank``,
+``_compress``, ``_chat_answer``, ...) raise TypeError on this class: they
+would call the coroutine overrides without awaiting them. Use their
+``_a``-prefixed counterparts. Cache and
+embedding store reads and writes are blocking (SQLite, Redis, the on-disk
+store), so they run in worker threads via ``asyncio.to_thread`` rather than
+on the event loop.
+"""
+import asyncio
+import copy
+import json
+import logging
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple, Union
+
+from openai import AsyncAzureOpenAI
+
+from cache import normalize_text
+from config import BATCH_RUN_CONCURRENCY
+from clients import get_async_openai_client, get_async_search_client, aclose_async_clients
+from compression import split_sentences
+from embedding_batcher import get_async_embedding_batcher
+from resilience import dependency
+from rate_governor import get_governor, estimate_chat_tokens, estimate_embedding_tokens
+from scheduler import scheduler
+from streaming import record_stream
+from citations import CitationRewriter
+from rag_assistant import FlaskRAGAssistant, response_cache, COMPRESSION_ENABLED
+
+logger = logging.getLogger(__name__)
+
+
+def _async_only(name: str, replacement: str) -> Callable[..., Any]:
+    """Stand-in for an inherited sync helper that the async class replaces."""
+    def method(self, *args: Any, **kwargs: Any) -> Any:
+        raise TypeError(f"{type(self).__name__}.{name} is sync; await {replacement} instead")
+    method.__name__ = name
+    return method
+
+
+class AsyncFlaskRAGAssistant(FlaskRAGAssistant):
+    """Retrieval-Augmented Generation assistant on the async Azure SDKs."""
+
+    # inherited sync helpers that do network I/O
+    _openai_call = _async_only("_openai_call", "_aopenai_call")
+    _chat_completion = _async_only("_chat_completion", "_achat_completion")
+    _embed_batch = _async_only("_embed_batch", "_aembed_batch")
+    _semantic_lookup = _async_only("_semantic_lookup", "_asemantic_lookup")
+    _retrieve = _async_only("_retrieve", "_aretrieve")
+    _rerank = _async_only("_rerank", "_arerank")
+    _pack_context = _async_only("_pack_context", "_apack_context")
+    _compress = _async_only("_compress", "_acompress")
+    _chat_answer = _async_only("_chat_answer", "_achat_answer")
+
+    @property
+    def async_openai_client(self) -> AsyncAzureOpenAI:
+        """AsyncAzureOpenAI client shared by everything on the running event loop."""
+        return get_async_openai_client(
+            self.openai_endpoint,
+            self.openai_key,
+            self.openai_api_version or "2023-05-15",
+        )
+
+    # ───────────── embeddings ─────────────
+    async def _aopenai_call(self, deployment: str, tokens: int, fn: Callable, **kwargs: Any) -> Any:
+        return await dependency(f"openai:{deployment}").acall(
+            scheduler.arun, get_governor(deployment).arun, tokens, fn, **kwargs
+        )
+
+    async def _achat_completion(
+        self, messages: List[Dict[str, str]], cfg: Dict[str, Any], stream: bool = False
+    ) -> Any:
+        return await self._aopenai_call(
+            cfg["deployment_name"],
+            estimate_chat_tokens(messages, cfg["max_tokens"]),
+            self.async_openai_client.chat.completions.create,
+            messages=messages,
+            stream=stream,
+            **self._completion_params(cfg),
+        )
+
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        resp = await self._aopenai_call(
+            self.embedding_deployment,
+            estimate_embedding_tokens(texts),
+            self.async_openai_client.embeddings.create,
+            model=self.embedding_deployment,
+            input=texts,
+        )
+        return [item.embedding for item in sorted(resp.data, key=lambda d: d.index)]
+
+    async def generate_embedding(self, text: str, use_cache: bool = True) -> Optional[List[float]]:
+        if not text:
+            return None
+        normalized = normalize_text(text)
+        if use_cache:
+            cached = await asyncio.to_thread(self._cached_embedding, normalized)
+            if cached is not None:
+                return cached
+        # concurrent requests within the batching window share one API call
+        batcher = get_async_embedding_batcher(self.embedding_deployment, self._aembed_batch)
+        if batcher is not None:
+            embedding = await batcher.embed(normalized)
+        else:
+            embedding = (await self._aembed_batch([normalized]))[0]
+        if use_cache:
+            await asyncio.to_thread(self._remember_embedding, normalized, embedding)
+        return embedding
+
+    async def generate_embeddings(
+        self, texts: List[str], use_cache: bool = True, persist: bool = True
+    ) -> List[Optional[List[float]]]:
+        """Like FlaskRAGAssistant.generate_embeddings, with the batches sent concurrently."""
+        normalized = [normalize_text(t) if t else "" for t in texts]
+        unique = list(dict.fromkeys(text for text in normalized if text))
+
+        def lookup() -> Dict[str, Optional[List[float]]]:
+            return {text: self._cached_embedding(text, persist) for text in unique}
+
+        vectors = await asyncio.to_thread(lookup) if use_cache else dict.fromkeys(unique)
+        pending = [text for text in unique if vectors[text] is None]
+
+        batches = list(self._embedding_batches(pending))
+        responses = await asyncio.gather(
+            *(self._aembed_batch(batch) for batch in batches), return_exceptions=True
+        )
+        fresh: Dict[str, List[float]] = {}
+        for batch, embeddings in zip(batches, responses):
+            if isinstance(embeddings, BaseException):
+                logger.error("Batch embedding error (%d inputs): %s", len(batch), embeddings)
+                continue
+            fresh.update(zip(batch, embeddings))
+        vectors.update(fresh)
+        if use_cache and fresh:
+            def remember() -> None:
+                for text, embedding in fresh.items():
+                    self._remember_embedding(text, embedding, persist)
+
+            await asyncio.to_thread(remember)
+
+        return [vectors.get(text) if text else None for text in normalized]
+
+    async def _asemantic_lookup(
+        self, query: str, cfg: Dict[str, Any], metadata: Dict[str, Any]
+    ) -> Tuple[Optional[List[float]], Optional[Dict[str, Any]]]:
+        if not self._semantic_enabled(cfg, metadata):
+            return None, None
+        q_vec = await self.generate_embedding(
+            query, use_cache=cfg["settings"].get("embedding_cache", True)
+        )
+        return q_vec, self._semantic_match(query, cfg, q_vec, metadata)
+
+    # ───────────── Azure Search ───────────
+    async def search_knowledge_base(self, query: str, settings: Optional[Dict] = None) -> List[Dict]:
+        results, _ = await self._aretrieve(query, settings)
+        return results
+
+    async def _aretrieve(
+        self, query: str, settings: Optional[Dict] = None, q_vec: Optional[List[float]] = None
+    ) -> Tuple[List[Dict], Dict[str, Any]]:
+        cfg = self.resolve_settings(settings)
+        key, top, meta = self._retrieval_plan(query, cfg)
+        results = await asyncio.to_thread(self._cached_results, key, cfg, meta)
+        if results is None:
+            client = get_async_search_client(
+                self.search_endpoint, cfg["search_index"], self.search_key
+            )
+            if q_vec is None:
+                q_vec = await self.generate_embedding(
+                    query, use_cache=cfg["settings"].get("embedding_cache", True)
+                )
+            if not q_vec:
+                return [], meta
+
+            async def search():
+                hits = await client.search(**self._search_kwargs(query, q_vec, top))
+                return self._hit_dicts([hit async for hit in hits])
+
+            results = await dependency("search").acall(search)
+            await asyncio.to_thread(self._store_results, key, results, cfg, meta)
+
+        meta["results"] = len(results)
+        if cfg["rerank_mode"] != "off" and results:
+            results = await self._arerank(query, results, cfg, q_vec, meta)
+        return results, meta
+
+    async def _arerank(
+        self, query: str, results: List[Dict], cfg: Dict[str, Any],
+        q_vec: Optional[List[float]], meta: Dict[str, Any]
+    ) -> List[Dict]:
+        start = time.perf_counter()
+        doc_vecs = None
+        if cfg["rerank_mode"] in ("mmr", "both"):
+            use_cache = cfg["settings"].get("embedding_cache", True)
+            if q_vec is None:
+                q_vec = await self.generate_embedding(query, use_cache=use_cache)
+            doc_vecs = await self.generate_embeddings(
+                [r["chunk"] for r in results], use_cache=use_cache, persist=False
+            )
+        return self._apply_rerank(query, results, cfg, q_vec, doc_vecs, meta, start)
+
+    # ───────── context ────────
+    async def _apack_context(
+        self, query: str, results: List[Dict], cfg: Dict[str, Any]
+    ) -> Tuple[str, Dict, Dict[str, Any]]:
+        results, removed = self._dedup(results, cfg)
+        compression = None
+        if cfg["settings"].get("compression", COMPRESSION_ENABLED):
+            results, compression = await self._acompress(query, results[:int(cfg["rerank_top_k"])], cfg)
+        return self._fit_context(query, results, cfg, removed, compression)
+
+    async def _acompress(
+        self, query: str, results: List[Dict], cfg: Dict[str, Any]
+    ) -> Tuple[List[Dict], Optional[Dict[str, Any]]]:
+        start = time.perf_counter()
+        use_cache = cfg["settings"].get("embedding_cache", True)
+        split = [split_sentences(r["chunk"]) for r in results]
+        sentences = [s for chunk in split for s in chunk]
+        if not sentences:
+            return results, None
+        try:
+            q_vec, vectors = await asyncio.gather(
+                self.generate_embedding(query, use_cache=use_cache),
+                self.generate_embeddings(sentences, use_cache=use_cache, persist=False),
+            )
+        except Exception as exc:
+            logger.error("Compression error: %s", exc)
+            return results, None
+        return self._apply_compression(results, split, q_vec, vectors, start)
+
+    async def _achat_answer(
+        self, query: str, context: str, cfg: Dict[str, Any], metadata: Dict[str, Any]
+    ) -> str:
+        messages = self._build_messages(query, context, cfg)
+        params = self._completion_params(cfg)
+        cache_key, cached = await asyncio.to_thread(self._cached_answer, messages, cfg, metadata)
+        if cached is not None:
+            return cached
+
+        logger.info("========== OPENAI RAW PAYLOAD ==========")
+        logger.info(json.dumps({**params, "messages": messages}, indent=2))
+        resp = await self._achat_completion(messages, cfg)
+        answer = resp.choices[0].message.content
+        logger.info("DEBUG - OpenAI response content: %s", answer)
+        if cache_key is not None and answer:
+            await asyncio.to_thread(response_cache.set, cache_key, answer)
+        return answer
+
+    # ─────────── public API ───────────────
+    async def generate_rag_response(
+        self, query: str, settings: Optional[Dict] = None
+    ) -> Tuple[str, List[Dict], List[Dict], Dict[str, Any], str]:
+        """Returns: answer, cited_sources, [], evaluation, context"""
+        result = await self.generate_rag_result(query, settings)
+        return result["answer"], result["sources"], [], result["evaluation"], result["context"]
+
+    async def generate_rag_result(self, query: str, settings: Optional[Dict] = None) -> Dict[str, Any]:
+        """Returns: {"answer", "sources", "evaluation", "context", "metadata"}"""
+        cfg = self.resolve_settings(settings)
+        metadata: Dict[str, Any] = {}
+        try:
+            q_vec, hit = await self._asemantic_lookup(query, cfg, metadata)
+            if hit is not None:
+                return {
+                    "answer": hit["answer"],
+                    "sources": copy.deepcopy(hit["sources"]),
+                    "evaluation": {},
+                    "context": hit["context"],
+                    "metadata": metadata,
+                }
+
+            kb_results, metadata["retrieval"] = await self._aretrieve(query, settings, q_vec)
+            if not kb_results:
+                return {
+                    "answer": "No relevant information found in the knowledge base.",
+                    "sources": [],
+                    "evaluation": {},
+                    "context": "",
+                    "metadata": metadata,
+                }
+
+            context, src_map, metadata["prompt"] = await self._apack_context(query, kb_results, cfg)
+            answer = await self._achat_answer(query, context, cfg, metadata)
+            answer, cited_sources = self._cite_sources(answer, src_map)
+
+            evaluation = self.fact_checker.evaluate_response(
+                query=query,
+                answer=answer,
+                context=context,
+                deployment=cfg["deployment_name"],
+            )
+
+            answer = "[RAG3] " + answer
+            self._semantic_store(q_vec, cfg, query, answer, cited_sources, context)
+            return {
+                "answer": answer,
+                "sources": cited_sources,
+                "evaluation": evaluation,
+                "context": context,
+                "metadata": metadata,
+            }
+
+        except Exception as exc:
+            logger.error("RAG generation error: %s", exc)
+            return {
+                "answer": "[RAG3] I encountered an error while generating the response.",
+                "sources": [],
+                "evaluation": {},
+                "context": "",
+                "metadata": {**metadata, **self._error_metadata(exc)},
+            }
+
+    async def _astream_text(
+        self, stream: Any, cfg: Dict[str, Any], collected: List[str],
+        deadline: Optional[float], state: Dict[str, Any],
+    ) -> AsyncGenerator[str, None]:
+        """
+        Async ``_stream_text``. Async generators cannot return a value, so a
+        deadline stop is reported as ``state["cancelled"]``; callers must
+        ``aclose()`` this generator themselves when they are closed early.
+        Every read is bounded by the time left, so a stalled upstream is cut
+        off at the deadline too.
+        """
+        outcome = "completed"
+        chunks = stream.__aiter__()
+        try:
+            while True:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    outcome = state["cancelled"] = "deadline"
+                    break
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), remaining)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    outcome = state["cancelled"] = "deadline"
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    collected.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        except GeneratorExit:
+            outcome = "disconnect"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            await stream.close()
+            record_stream(collected, outcome, cfg["max_tokens"])
+
+    async def stream_rag_response(
+        self, query: str, settings: Optional[Dict] = None, candidates: bool = False
+    ) -> AsyncGenerator[Union[str, Dict], None]:
+        """
+        Yields string chunks of the answer, then a dictionary with metadata;
+        with ``candidates``, first a ``{"candidates": [...]}`` dictionary.
+        """
+        cfg = self.resolve_settings(settings)
+        deadline = self._deadline(cfg)
+        metadata: Dict[str, Any] = {}
+        try:
+            q_vec, hit = await self._asemantic_lookup(query, cfg, metadata)
+            if hit is not None:
+                if candidates:
+                    yield {"candidates": self._candidate_sources(hit["sources"])}
+                # stored with the [RAG3] marker, which live streams only add
+                # to the final answer
+                yield hit["answer"].removeprefix("[RAG3] ")
+                yield {
+                    "sources": copy.deepcopy(hit["sources"]),
+                    "evaluation": {},
+                    "metadata": metadata
+                }
+                return
+
+            kb_results, metadata["retrieval"] = await self._aretrieve(query, settings, q_vec)
+            if not kb_results:
+                if candidates:
+                    yield {"candidates": []}
+                yield "No relevant information found in the knowledge base."
+                yield {
+                    "sources": [],
+                    "evaluation": {},
+                    "metadata": metadata
+                }
+                return
+
+            context, src_map, metadata["prompt"] = await self._apack_context(query, kb_results, cfg)
+            if candidates:
+                yield {"candidates": self._candidate_sources(src_map)}
+            messages = self._build_messages(query, context, cfg)
+
+            rewriter = CitationRewriter(src_map)
+            collected: List[str] = []
+            state: Dict[str, Any] = {"cancelled": None}
+            cache_key, cached = await asyncio.to_thread(self._cached_answer, messages, cfg, metadata)
+            if cached is not None:
+                collected.append(cached)
+                for piece in rewriter.rewrite(self._replay_chunks(cached)):
+                    yield piece
+            else:
+                stream = await self._achat_completion(messages, cfg, stream=True)
+                pieces = self._astream_text(stream, cfg, collected, deadline, state)
+                try:
+                    async for piece in pieces:
+                        out = rewriter.feed(piece)
+                        if out:
+                            yield out
+                finally:
+                    await pieces.aclose()
+            tail = rewriter.flush()
+            if tail:
+                yield tail
+
+            collected_answer = "".join(collected)
+            if state["cancelled"] is not None:
+                logger.info("Stream stopped at the %ss deadline", cfg["stream_deadline"])
+                metadata["cancelled"] = state["cancelled"]
+            elif cache_key is not None and cached is None and collected_answer:
+                await asyncio.to_thread(response_cache.set, cache_key, collected_answer)
+
+            collected_answer, cited_sources = "[RAG3] " + rewriter.text(), rewriter.sources()
+            evaluation = self.fact_checker.evaluate_response(
+                query=query,
+                answer=collected_answer,
+                context=context,
+                deployment=cfg["deployment_name"],
+            )
+            if state["cancelled"] is None:
+                self._semantic_store(q_vec, cfg, query, collected_answer, cited_sources, context)
+
+            yield {
+                "sources": cited_sources,
+                "evaluation": evaluation,
+                "metadata": metadata
+            }
+
+        except Exception as exc:
+            logger.error("RAG streaming error: %s", exc)
+            yield "[RAG3] I encountered an error while generating the response."
+            yield {
+                "sources": [],
+                "evaluation": {},
+                "metadata": metadata,
+                **self._error_metadata(exc)
+            }
+
+    # ─────────── direct completions (no retrieval) ───────────
+    async def complete(
+        self, prompt: str, system_prompt: Optional[str] = None, settings: Optional[Dict] = None
+    ) -> str:
+        cfg = self.resolve_settings(settings)
+        messages = self._direct_messages(prompt, system_prompt)
+        cache_key = self._response_cache_key(messages, cfg)
+        if cache_key is not None:
+            cached = await asyncio.to_thread(response_cache.get, cache_key)
+            if cached is not None:
+                return cached
+
+        resp = await self._achat_completion(messages, cfg)
+        answer = resp.choices[0].message.content or ""
+        if cache_key is not None and answer:
+            await asyncio.to_thread(response_cache.set, cache_key, answer)
+        return answer
+
+    async def stream_complete(
+        self, prompt: str, system_prompt: Optional[str] = None, settings: Optional[Dict] = None
+    ) -> AsyncGenerator[str, None]:
+        cfg = self.resolve_settings(settings)
+        messages = self._direct_messages(prompt, system_prompt)
+        cache_key = self._response_cache_key(messages, cfg)
+        cached = await asyncio.to_thread(response_cache.get, cache_key) if cache_key is not None else None
+        if cached is not None:
+            for piece in self._replay_chunks(cached):
+                yield piece
+            return
+
+        stream = await self._achat_completion(messages, cfg, stream=True)
+        collected: List[str] = []
+        state: Dict[str, Any] = {"cancelled": None}
+        pieces = self._astream_text(stream, cfg, collected, self._deadline(cfg), state)
+        try:
+            async for piece in pieces:
+                yield piece
+        finally:
+            await pieces.aclose()
+        if cache_key is not None and collected and state["cancelled"] is None:
+            await asyncio.to_thread(response_cache.set, cache_key, "".join(collected))
+
+
+def gather_rag_responses(
+    queries: List[str], settings: Optional[Dict] = None, concurrency: Optional[int] = None
+) -> List[Union[Tuple[str, List[Dict], List[Dict], Dict[str, Any], str], BaseException]]:
+    """
+    Run generate_rag_response for every query concurrently, from sync code
+    such as the batch runners, at most ``concurrency`` (BATCH_RUN_CONCURRENCY)
+    at a time. Results are in query order; a failed query yields its
+    exception instead of a tuple.
+    """
+    async def run():
+        assistant = AsyncFlaskRAGAssistant(settings=settings)
+        limit = asyncio.Semaphore(max(concurrency or BATCH_RUN_CONCURRENCY, 1))
+
+        async def one(query):
+            async with limit:
+                return await assistant.generate_rag_response(query)
+
+        try:
+            return await asyncio.gather(*(one(q) for q in queries), return_exceptions=True)
+        finally:
+            await aclose_async_clients()
+
+    return asyncio.run(run())
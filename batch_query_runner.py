@@ -2,6 +2,8 @@ import logging
 import traceback
 import json
 from rag_assistant import FlaskRAGAssistant
+from async_rag_assistant import gather_rag_responses
+from config import BATCH_RUN_CONCURRENCY
 
 # Try to import the summary module if present
 try:
@@ -47,7 +49,10 @@ def run_batch(query, system_prompt, params, logger, batch_label="batch"):
     settings = {
         "temperature": params["temperature"],
         "top_p": params["top_p"],
-        "max_tokens": params["max_tokens"]
+        "max_tokens": params["max_tokens"],
+        # each run must reach the model
+        "semantic_cache": False,
+        "response_cache": False
     }
     if system_prompt:
         settings["system_prompt"] = system_prompt
@@ -56,10 +61,16 @@ def run_batch(query, system_prompt, params, logger, batch_label="batch"):
     actual_prompt = getattr(assistant, "DEFAULT_SYSTEM_PROMPT", "")
     logger.info(f"{batch_label}: System prompt sent to AzureOpenAI: {actual_prompt!r}")
     results = []
-    for i in range(params["n_runs"]):
+    # runs go out concurrently on the async assistant
+    responses = gather_rag_responses(
+        [query] * params["n_runs"], settings, concurrency=BATCH_RUN_CONCURRENCY
+    )
+    for i, response in enumerate(responses):
         try:
             logger.info(f"{batch_label} Run {i+1}: Query: {query!r}")
-            answer, sources, _, evaluation, context = assistant.generate_rag_response(query)
+            if isinstance(response, BaseException):
+                raise response
+            answer, sources, _, evaluation, context = response
             logger.info(f"{batch_label} Run {i+1}: Answer: {answer!r}")
             logger.info(f"{batch_label} Run {i+1}: Sources: {sources!r}")
             print(f"\n{batch_label} Run {i+1}:")
@@ -153,13 +164,17 @@ def main():
             # Developer evaluation
             if HAS_SUMMARY:
                 print("\n=== Developer Evaluation (LLM Suggestions) ===\n")
-                suggestions = developer_evaluate_job(
-                    query=query,
-                    prompt=system_prompt,
-                    parameters=params,
-                    result=answer
-                )
-                print(suggestions)
+                try:
+                    suggestions = developer_evaluate_job(
+                        query=query,
+                        prompt=system_prompt,
+                        parameters=params,
+                        result=answer
+                    )
+                    print(suggestions)
+                except Exception as e:
+                    suggestions = None
+                    print(f"Developer evaluation failed: {e}")
             else:
                 print("\n[LLM Summary module not available. Skipping developer evaluation.]")
             # Save output
@@ -281,7 +296,10 @@ def main():
         settings = {
             "temperature": temperature,
             "top_p": top_p,
-            "max_tokens": max_tokens
+            "max_tokens": max_tokens,
+            # each run must reach the model
+            "semantic_cache": False,
+            "response_cache": False
         }
         if system_prompt:
             settings["system_prompt"] = system_prompt
@@ -292,10 +310,14 @@ def main():
         logger.info(f"System prompt sent to AzureOpenAI: {actual_prompt!r}")
 
         results = []
-        for i in range(n_runs):
+        # runs go out concurrently on the async assistant
+        responses = gather_rag_responses([query] * n_runs, settings, concurrency=BATCH_RUN_CONCURRENCY)
+        for i, response in enumerate(responses):
             try:
                 logger.info(f"Run {i+1}: Query: {query!r}")
-                answer, sources, _, evaluation, context = assistant.generate_rag_response(query)
+                if isinstance(response, BaseException):
+                    raise response
+                answer, sources, _, evaluation, context = response
                 logger.info(f"Run {i+1}: Answer: {answer!r}")
                 logger.info(f"Run {i+1}: Sources: {sources!r}")
                 print(f"\nRun {i+1}:")
@@ -0,0 +1,167 @@
+"""
+Cache layer benchmark: serializers and backends (cache.py).
+
+Measures encode/decode cost and payload size for each serializer on the
+values we actually cache (a 1536-d embedding, a retrieval result list, an
+answer string), then get/set latency for the memory, sqlite and redis
+backends. The redis backend runs against a local Redis-protocol stand-in
+server unless --redis-url points at a real one.
+
+    python bench_cache.py
+    python bench_cache.py -n 5000 --redis-url redis://localhost:6379/0
+"""
+import argparse
+import fnmatch
+import os
+import random
+import socketserver
+import statistics
+import tempfile
+import threading
+import time
+
+from cache import LRUCache, SQLiteCache, RedisCache, SERIALIZERS
+
+
+class _RespStandIn(socketserver.ThreadingTCPServer):
+    """Just enough of the Redis protocol for cache.RedisCache."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RespHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def _read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    @staticmethod
+    def _bulk(value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        server = self.server
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            cmd = args[0].upper()
+            now = time.monotonic()
+            with server.lock:
+                if cmd in (b"PING", b"AUTH", b"SELECT"):
+                    reply = b"+OK\r\n"
+                elif cmd == b"GET":
+                    item = server.data.get(args[1])
+                    if item and item[1] is not None and item[1] <= now:
+                        del server.data[args[1]]
+                        item = None
+                    reply = self._bulk(item[0] if item else None)
+                elif cmd == b"SET":
+                    expires = None
+                    if len(args) >= 5 and args[3].upper() == b"PX":
+                        expires = now + int(args[4]) / 1000
+                    server.data[args[1]] = (args[2], expires)
+                    reply = b"+OK\r\n"
+                elif cmd == b"DEL":
+                    count = sum(1 for k in args[1:] if server.data.pop(k, None) is not None)
+                    reply = b":%d\r\n" % count
+                elif cmd == b"SCAN":
+                    pattern = args[args.index(b"MATCH") + 1].decode() if b"MATCH" in args else "*"
+                    keys = [k for k in server.data if fnmatch.fnmatchcase(k.decode(), pattern)]
+                    reply = b"*2\r\n$1\r\n0\r\n*%d\r\n" % len(keys) + b"".join(self._bulk(k) for k in keys)
+                else:
+                    reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+
+def _values():
+    rng = random.Random(0)
+    embedding = tuple(rng.uniform(-1, 1) for _ in range(1536))
+    results = [[{"chunk": "lorem ipsum " * 80, "title": f"Doc {i}", "relevance": 1.0}
+                for i in range(10)], time.time()]
+    answer = "The proposed method increases efficiency by 20% [1]. " * 20
+    return {"embedding": embedding, "retrieval": results, "answer": answer}
+
+
+def bench_serializers(n):
+    print(f"\nSerializers ({n} round trips each)")
+    print(f"{'value':<10} {'codec':<8} {'bytes':>8} {'dumps us':>10} {'loads us':>10}")
+    for label, value in _values().items():
+        for name, codec in SERIALIZERS.items():
+            if name == "float32" and label != "embedding":
+                continue
+            data = codec.dumps(value)
+            start = time.perf_counter()
+            for _ in range(n):
+                codec.dumps(value)
+            dumps_us = (time.perf_counter() - start) / n * 1e6
+            start = time.perf_counter()
+            for _ in range(n):
+                codec.loads(data)
+            loads_us = (time.perf_counter() - start) / n * 1e6
+            print(f"{label:<10} {name:<8} {len(data):>8} {dumps_us:>10.1f} {loads_us:>10.1f}")
+
+
+def _time_ops(fn, n):
+    timings = []
+    for i in range(n):
+        start = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(timings), sorted(timings)[int(n * 0.95) - 1]
+
+
+def bench_backends(n, redis_url):
+    tmp = tempfile.mkdtemp()
+    embedding = _values()["embedding"]
+    backends = {
+        "memory": LRUCache(maxsize=n * 2, ttl=600, namespace="bench"),
+        "sqlite": SQLiteCache(os.path.join(tmp, "bench.sqlite"), maxsize=n * 2, ttl=600,
+                              namespace="bench", serializer=SERIALIZERS["float32"]),
+        "redis": RedisCache(redis_url, ttl=600, namespace="bench", serializer=SERIALIZERS["float32"]),
+    }
+    print(f"\nBackends ({n} embedding sets + gets each, {redis_url} for redis)")
+    print(f"{'backend':<8} {'set p50 us':>11} {'set p95 us':>11} {'get p50 us':>11} {'get p95 us':>11}")
+    for name, cache in backends.items():
+        set_p50, set_p95 = _time_ops(lambda i: cache.set(f"k{i}", embedding), n)
+        get_p50, get_p95 = _time_ops(lambda i: cache.get(f"k{i}"), n)
+        print(f"{name:<8} {set_p50:>11.1f} {set_p95:>11.1f} {get_p50:>11.1f} {get_p95:>11.1f}")
+        assert cache.get("k0") is not None, f"{name} lost a value"
+        cache.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cache serializers and backends")
+    parser.add_argument("-n", type=int, default=2000)
+    parser.add_argument("--redis-url", help="real Redis-protocol server (default: local stand-in)")
+    args = parser.parse_args()
+
+    server = None
+    redis_url = args.redis_url
+    if not redis_url:
+        server = _RespStandIn()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        redis_url = f"redis://127.0.0.1:{server.server_address[1]}/0"
+
+    bench_serializers(args.n)
+    bench_backends(args.n, redis_url)
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
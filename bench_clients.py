@@ -0,0 +1,107 @@
+"""
+Before/after benchmark for the shared client registry (clients.py).
+
+"before" builds a fresh AzureOpenAI client per request, which is what every
+/api/* call used to do via FlaskRAGAssistant(settings=...). "after" reuses the
+process-wide pooled client.
+
+By default the benchmark runs against a local stand-in for the embeddings
+endpoint so it is reproducible anywhere. Pass --live to hit the real Azure
+OpenAI endpoint from config (TLS handshakes make the difference much larger).
+
+    python bench_clients.py -n 200
+    python bench_clients.py -n 50 --live
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai import AzureOpenAI
+
+import clients
+from config import OPENAI_ENDPOINT, OPENAI_KEY, OPENAI_API_VERSION, EMBEDDING_DEPLOYMENT
+
+
+class _EmbeddingsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        body = json.dumps({
+            "object": "list",
+            "data": [{"object": "embedding", "index": 0, "embedding": [0.0] * 1536}],
+            "model": "stand-in",
+            "usage": {"prompt_tokens": 1, "total_tokens": 1},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EmbeddingsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def _time_calls(n, make_client, deployment):
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client = make_client()
+        client.embeddings.create(model=deployment, input="benchmark query")
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _report(label, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<8} mean={statistics.mean(timings):8.2f} ms  "
+          f"p50={statistics.median(timings):8.2f} ms  p95={p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", type=int, default=200, help="requests per variant")
+    parser.add_argument("--live", action="store_true", help="use the configured Azure endpoint")
+    args = parser.parse_args()
+
+    server = None
+    if args.live:
+        endpoint, key, version = OPENAI_ENDPOINT, OPENAI_KEY, OPENAI_API_VERSION or "2023-05-15"
+        deployment = EMBEDDING_DEPLOYMENT
+    else:
+        server, endpoint = _start_stand_in()
+        key, version, deployment = "stand-in", "2023-05-15", "stand-in"
+
+    def fresh_client():
+        return AzureOpenAI(azure_endpoint=endpoint, api_key=key, api_version=version)
+
+    def shared_client():
+        return clients.get_openai_client(endpoint, key, version)
+
+    # warm up imports and the shared pool so we measure steady state
+    _time_calls(3, shared_client, deployment)
+
+    print(f"{args.n} embedding calls against {endpoint}")
+    _report("before", _time_calls(args.n, fresh_client, deployment))
+    _report("after", _time_calls(args.n, shared_client, deployment))
+
+    clients.reset_clients()
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,539 @@
+"""
+Pluggable cache layer used by the RAG assistant.
+
+Each cache namespace (embeddings, retrieval, responses, ...) gets its own
+backend instance with its own size limit and TTL:
+
+- ``memory``: in-process LRU (fastest, private to one worker)
+- ``sqlite``: a local SQLite file shared by every worker on a host
+- ``redis``: any Redis-protocol server, shared by every host
+
+All backends expose the same interface (get / set / delete / delete_prefix /
+clear / stats) and keys are strings. Shared backends serialize values with a
+per-namespace serializer; backend errors are logged and treated as misses so
+a cache outage never fails a request. A failed delete returns False, a
+failed delete_prefix / clear returns None.
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+from config import CACHE_BACKEND, CACHE_SQLITE_PATH, CACHE_REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used in cache keys: NFC, collapsed whitespace, stripped."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+# ───────────── serializers ─────────────
+class JSONSerializer:
+    name = "json"
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        return json.loads(data)
+
+
+class Float32Serializer:
+    """Compact codec for embedding vectors: raw little-endian float32."""
+    name = "float32"
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        return np.asarray(value, dtype="<f4").tobytes()
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        return tuple(np.frombuffer(data, dtype="<f4").tolist())
+
+
+SERIALIZERS = {s.name: s for s in (JSONSerializer, Float32Serializer)}
+
+
+class _Counters:
+    """Hit/miss bookkeeping shared by every backend."""
+
+    def _init_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.errors = 0
+
+    def _counter_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "sets": self.sets,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "errors": self.errors,
+        }
+
+
+# ───────────── in-process LRU ─────────────
+class LRUCache(_Counters):
+    """
+    In-process LRU cache with a per-entry TTL and hit/miss counters.
+
+    Safe to share between Flask threads. ``maxsize <= 0`` disables the cache.
+    Values are stored as-is (no serialization).
+    """
+
+    backend = "memory"
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, namespace: str = "") -> None:
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._init_counters()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            self.sets += 1
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def delete_matching(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key satisfies ``predicate``; returns the count."""
+        with self._lock:
+            doomed = [key for key in self._data if predicate(key)]
+            for key in doomed:
+                del self._data[key]
+            return len(doomed)
+
+    def delete_prefix(self, prefix: str) -> int:
+        return self.delete_matching(lambda key: isinstance(key, str) and key.startswith(prefix))
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._data)
+            self._data.clear()
+            return count
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                **self._counter_stats(),
+            }
+
+
+# ───────────── SQLite ─────────────
+class SQLiteCache(_Counters):
+    """
+    Disk-backed cache shared by every worker on a host.
+
+    One table per namespace in a single SQLite file (WAL mode). Size is
+    bounded by evicting the least recently read entries. Connections are
+    reopened after fork.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, maxsize: int = 10000, ttl: Optional[float] = None,
+                 namespace: str = "default", serializer=JSONSerializer) -> None:
+        self.path = path
+        self.namespace = namespace
+        self.table = "cache_" + "".join(c if c.isalnum() else "_" for c in namespace)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.serializer = serializer
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._init_counters()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                row = conn.execute(
+                    f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] is not None and row[1] <= now:
+                    conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    self.expirations += 1
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return default
+                conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+                value = self.serializer.loads(row[0])
+            except (sqlite3.Error, ValueError) as exc:
+                self.errors += 1
+                self.misses += 1
+                logger.warning("SQLite cache %s read failed: %s", self.namespace, exc)
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                    (key, self.serializer.dumps(value), now + ttl if ttl else None, now),
+                )
+                self.sets += 1
+                excess = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.maxsize
+                if excess > 0:
+                    conn.execute(
+                        f"DELETE FROM {self.table} WHERE key IN "
+                        f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)", (excess,)
+                    )
+                    self.evictions += excess
+            except (sqlite3.Error, TypeError, ValueError) as exc:
+                self.errors += 1
+                logger.warning("SQLite cache %s write failed: %s", self.namespace, exc)
+
+    def _delete_where(self, where: str, params: tuple) -> Optional[int]:
+        with self._lock:
+            try:
+                return self._connection().execute(f"DELETE FROM {self.table}{where}", params).rowcount
+            except sqlite3.Error as exc:
+                self.errors += 1
+                logger.warning("SQLite cache %s delete failed: %s", self.namespace, exc)
+                return None
+
+    def delete(self, key: str) -> bool:
+        return bool(self._delete_where(" WHERE key = ?", (key,)))
+
+    def delete_prefix(self, prefix: str) -> Optional[int]:
+        return self._delete_where(" WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def clear(self) -> Optional[int]:
+        return self._delete_where("", ())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            size = len(self)
+        except sqlite3.Error:
+            size = None
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "path": self.path,
+                "size": size,
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                **self._counter_stats(),
+            }
+
+
+# ───────────── Redis protocol ─────────────
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server."""
+
+
+class _RespConnection:
+    """One socket speaking RESP2."""
+
+    def __init__(self, host: str, port: int, password: Optional[str], db: int, timeout: float) -> None:
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if password:
+            self.execute("AUTH", password)
+        if db:
+            self.execute("SELECT", db)
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def _read(self) -> Any:
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise ConnectionError(f"unexpected reply {line!r}")
+
+    def execute(self, *args) -> Any:
+        self.sock.sendall(self._encode(args))
+        return self._read()
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCache(_Counters):
+    """
+    Cache on any Redis-protocol server (Redis, Valkey, KeyDB, Azure Cache).
+
+    Keys are prefixed with ``<prefix>:<namespace>:``. TTLs use ``PX``; size is
+    bounded by TTL and the server's maxmemory policy, not by ``maxsize``.
+    Connections are pooled per process and reopened after fork.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str, ttl: Optional[float] = None, namespace: str = "default",
+                 serializer=JSONSerializer, maxsize: int = 0, pool_size: int = 16,
+                 timeout: float = 1.0, prefix: str = "rag") -> None:
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.namespace = namespace
+        self.key_prefix = f"{prefix}:{namespace}:"
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.serializer = serializer
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[_RespConnection]" = queue.LifoQueue(maxsize=pool_size)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._init_counters()
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+    def _command(self, *args) -> Any:
+        if self._pid != os.getpid():
+            # never share sockets with the parent process
+            self._pool = queue.LifoQueue(maxsize=self._pool.maxsize)
+            self._pid = os.getpid()
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = _RespConnection(self.host, self.port, self.password, self.db, self.timeout)
+        try:
+            result = conn.execute(*args)
+        except (OSError, ConnectionError):
+            conn.close()
+            raise
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        return result
+
+    def _count(self, attr: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + n)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            data = self._command("GET", self.key_prefix + key)
+            value = default if data is None else self.serializer.loads(data)
+        except (OSError, ConnectionError, RedisError, ValueError) as exc:
+            self._count("errors")
+            self._count("misses")
+            logger.warning("Redis cache %s read failed: %s", self.namespace, exc)
+            return default
+        self._count("misses" if data is None else "hits")
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        args = ["SET", self.key_prefix + key, self.serializer.dumps(value)]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        try:
+            self._command(*args)
+            self._count("sets")
+        except (OSError, ConnectionError, RedisError) as exc:
+            self._count("errors")
+            logger.warning("Redis cache %s write failed: %s", self.namespace, exc)
+
+    def delete(self, key: str) -> bool:
+        try:
+            return bool(self._command("DEL", self.key_prefix + key))
+        except (OSError, ConnectionError, RedisError) as exc:
+            self._count("errors")
+            logger.warning("Redis cache %s delete failed: %s", self.namespace, exc)
+            return False
+
+    def _scan(self, pattern: str) -> List[bytes]:
+        keys, cursor = [], b"0"
+        while True:
+            cursor, batch = self._command("SCAN", cursor, "MATCH", pattern, "COUNT", 500)
+            keys.extend(batch)
+            if cursor in (b"0", "0", 0):
+                return keys
+
+    def delete_prefix(self, prefix: str) -> Optional[int]:
+        pattern = "".join("\\" + c if c in "*?[]\\" else c for c in self.key_prefix + prefix) + "*"
+        try:
+            keys = self._scan(pattern)
+            for i in range(0, len(keys), 500):
+                self._command("DEL", *keys[i:i + 500])
+        except (OSError, ConnectionError, RedisError) as exc:
+            self._count("errors")
+            logger.warning("Redis cache %s delete failed: %s", self.namespace, exc)
+            return None
+        return len(keys)
+
+    def clear(self) -> Optional[int]:
+        return self.delete_prefix("")
+
+    def __len__(self) -> int:
+        return len(self._scan(self.key_prefix + "*"))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "server": f"{self.host}:{self.port}/{self.db}",
+                "ttl": self.ttl,
+                **self._counter_stats(),
+            }
+
+
+# ───────────── namespace registry ─────────────
+_caches: Dict[str, Any] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(namespace: str, backend: Optional[str] = None, maxsize: int = 1024,
+              ttl: Optional[float] = None, serializer: str = "json"):
+    """
+    Cache for ``namespace``, created on first use and shared process-wide.
+
+    ``backend`` defaults to CACHE_BACKEND; the SQLite file and Redis server
+    come from CACHE_SQLITE_PATH and CACHE_REDIS_URL.
+    """
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is not None:
+            return cache
+        backend = backend or CACHE_BACKEND
+        codec = SERIALIZERS[serializer]
+        if backend == "memory":
+            cache = LRUCache(maxsize=maxsize, ttl=ttl, namespace=namespace)
+        elif backend == "sqlite":
+            cache = SQLiteCache(CACHE_SQLITE_PATH, maxsize=maxsize, ttl=ttl,
+                                namespace=namespace, serializer=codec)
+        elif backend == "redis":
+            cache = RedisCache(CACHE_REDIS_URL, ttl=ttl, namespace=namespace,
+                               serializer=codec, maxsize=maxsize)
+        else:
+            raise ValueError(f"Unknown cache backend: {backend!r}")
+        logger.info("Cache namespace %s using %s backend", namespace, backend)
+        _caches[namespace] = cache
+        return cache
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-namespace metrics for the metrics endpoint."""
+    with _caches_lock:
+        caches = dict(_caches)
+    return {name: cache.stats() for name, cache in caches.items()}
@@ -0,0 +1,105 @@
+"""
+Single-pass citation renumbering for streamed answers.
+
+The model cites the prompt's sources as ``[n]`` with n the <source id>. The
+answer keeps only the cited sources, renumbered 1, 2, 3… in the order they
+are first cited. ``CitationRewriter`` does that while the answer streams:
+
+    rewriter = CitationRewriter(src_map)
+    for piece in pieces:
+        yield rewriter.feed(piece)
+    yield rewriter.flush()
+    answer, sources = rewriter.text(), rewriter.sources()
+
+A citation split across chunks (``"[1"`` + ``"2]"``) is held back until it
+is complete, so at most a few characters are delayed; every character is
+scanned once. Ids that are not in the source map are left as they are.
+"""
+import re
+from typing import Any, Dict, Generator, Iterable, List, Tuple
+
+# "[" plus up to this many digits may be the start of a citation
+MAX_ID_DIGITS = 4
+_CITATION_RE = re.compile(r"\[(\d{1,%d})\]" % MAX_ID_DIGITS)
+
+
+class CitationRewriter:
+    """Renumbers ``[n]`` citations in first-cited order as text streams through."""
+
+    def __init__(self, src_map: Dict[str, Dict[str, Any]]) -> None:
+        self.src_map = src_map
+        self._new_ids: Dict[str, str] = {}
+        self._held = ""
+        self._out: List[str] = []
+
+    def _renumber(self, match: "re.Match[str]") -> str:
+        old_id = match.group(1)
+        if old_id not in self.src_map:
+            return match.group(0)
+        new_id = self._new_ids.get(old_id)
+        if new_id is None:
+            new_id = self._new_ids[old_id] = str(len(self._new_ids) + 1)
+        return f"[{new_id}]"
+
+    def feed(self, piece: str) -> str:
+        """Rewrite the next piece; an unfinished citation at its end is held back."""
+        text = self._held + piece
+        cut = text.rfind("[", max(len(text) - MAX_ID_DIGITS - 1, 0))
+        if cut != -1 and (cut == len(text) - 1 or text[cut + 1:].isdigit()):
+            text, self._held = text[:cut], text[cut:]
+        else:
+            self._held = ""
+        out = _CITATION_RE.sub(self._renumber, text)
+        self._out.append(out)
+        return out
+
+    def flush(self) -> str:
+        """Whatever is still held back, at the end of the stream."""
+        out, self._held = self._held, ""
+        self._out.append(out)
+        return out
+
+    def rewrite(self, pieces: Iterable[str]) -> Generator[str, None, Any]:
+        """
+        Rewrite a stream of pieces, skipping those held back entirely; returns
+        what ``pieces`` returns. Closing this generator closes ``pieces``.
+        """
+        pieces = iter(pieces)
+        try:
+            while True:
+                try:
+                    piece = next(pieces)
+                except StopIteration as stop:
+                    return stop.value
+                out = self.feed(piece)
+                if out:
+                    yield out
+        finally:
+            close = getattr(pieces, "close", None)
+            if close is not None:
+                close()
+
+    def text(self) -> str:
+        """The rewritten answer so far."""
+        return "".join(self._out)
+
+    def sources(self) -> List[Dict[str, Any]]:
+        """The cited sources with their new ids, in citation order."""
+        cited = []
+        for old_id, new_id in self._new_ids.items():
+            src = self.src_map[old_id]
+            entry = {"id": new_id, "title": src["title"], "content": src["content"]}
+            if "url" in src:
+                entry["url"] = src["url"]
+            if "merged_titles" in src:
+                entry["merged_titles"] = src["merged_titles"]
+            cited.append(entry)
+        return cited
+
+
+def cite_sources(answer: str, src_map: Dict[str, Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+    """Renumber a complete answer; returns it with its cited sources."""
+    rewriter = CitationRewriter(src_map)
+    rewriter.feed(answer)
+    rewriter.flush()
+    return rewriter.text(), rewriter.sources()
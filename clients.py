@@ -0,0 +1,245 @@
+"""
+Process-wide registry of Azure OpenAI and Azure Search clients.
+
+Building a client per request means a fresh connection pool (and a fresh TLS
+handshake) every time. The registry keeps one pooled, keep-alive HTTP stack per
+process and hands out shared clients:
+
+- one ``AzureOpenAI`` client per (endpoint, key, api version)
+- one ``SearchClient`` per (endpoint, index), kept in a bounded LRU so the
+  ``search_index`` setting override keeps working without unbounded growth
+
+All clients are safe to share between Flask threads. The SDKs' own retries
+are turned off; resilience.py retries every call instead.
+
+The async clients used by AsyncFlaskRAGAssistant are bound to the event loop
+they were created on, so they are kept per running loop instead; call
+``aclose_async_clients()`` before a loop shuts down.
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
+from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+
+from config import (
+    HTTP_POOL_MAXSIZE,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_TIMEOUT,
+    SEARCH_CLIENT_CACHE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_http_client = None
+_search_session = None
+_search_transport = None
+_openai_clients: Dict[Tuple[str, str, str], AzureOpenAI] = {}
+_search_clients: "OrderedDict[Tuple[str, str], SearchClient]" = OrderedDict()
+# event loop -> {"http": httpx.AsyncClient, "openai": {...}, "search": OrderedDict}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = weakref.WeakKeyDictionary()
+_stats = {
+    "openai_clients_created": 0,
+    "search_clients_created": 0,
+    "search_clients_evicted": 0,
+    "async_openai_clients_created": 0,
+    "async_search_clients_created": 0,
+}
+
+
+def _get_http_client() -> httpx.Client:
+    """Shared httpx client with a keep-alive connection pool for OpenAI."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=HTTP_POOL_MAXSIZE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=10.0),
+        )
+    return _http_client
+
+
+def _get_search_transport() -> RequestsTransport:
+    """Shared requests session/transport for every SearchClient."""
+    global _search_session, _search_transport
+    if _search_transport is None:
+        _search_session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=SEARCH_CLIENT_CACHE_SIZE,
+            pool_maxsize=HTTP_POOL_MAXSIZE,
+        )
+        _search_session.mount("https://", adapter)
+        _search_session.mount("http://", adapter)
+        _search_transport = RequestsTransport(session=_search_session, session_owner=False)
+    return _search_transport
+
+
+def search_endpoint_url(endpoint: str) -> str:
+    """Accept either a bare service name or a full URL."""
+    if endpoint.startswith("http://") or endpoint.startswith("https://"):
+        return endpoint
+    return f"https://{endpoint}.search.windows.net"
+
+
+def get_openai_client(endpoint: str, api_key: str, api_version: str) -> AzureOpenAI:
+    """Return the shared AzureOpenAI client for this endpoint/key/version."""
+    key = (endpoint, api_key, api_version)
+    client = _openai_clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            client = AzureOpenAI(
+                azure_endpoint=endpoint,
+                api_key=api_key,
+                api_version=api_version,
+                http_client=_get_http_client(),
+                max_retries=0,  # retried by resilience.py
+            )
+            _openai_clients[key] = client
+            _stats["openai_clients_created"] += 1
+            logger.info("Created shared AzureOpenAI client for %s", endpoint)
+    return client
+
+
+def get_search_client(endpoint: str, index_name: str, api_key: str) -> SearchClient:
+    """Return the shared SearchClient for (endpoint, index), LRU-bounded."""
+    key = (endpoint, index_name)
+    with _lock:
+        client = _search_clients.get(key)
+        if client is not None:
+            _search_clients.move_to_end(key)
+            return client
+        client = SearchClient(
+            endpoint=search_endpoint_url(endpoint),
+            index_name=index_name,
+            credential=AzureKeyCredential(api_key),
+            transport=_get_search_transport(),
+            retry_total=0,  # retried by resilience.py
+        )
+        _search_clients[key] = client
+        _stats["search_clients_created"] += 1
+        while len(_search_clients) > SEARCH_CLIENT_CACHE_SIZE:
+            # the transport is shared and not owned by the client, so eviction
+            # just drops the reference; pooled connections stay open
+            _search_clients.popitem(last=False)
+            _stats["search_clients_evicted"] += 1
+        logger.info("Created shared SearchClient for %s/%s", endpoint, index_name)
+    return client
+
+
+def _loop_clients() -> Dict:
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.get(loop)
+        if clients is None:
+            clients = _async_clients[loop] = {
+                "http": httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=HTTP_POOL_MAXSIZE,
+                        max_keepalive_connections=HTTP_POOL_MAXSIZE,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                    ),
+                    timeout=httpx.Timeout(HTTP_TIMEOUT, connect=10.0),
+                ),
+                "openai": {},
+                "search": OrderedDict(),
+            }
+    return clients
+
+
+def get_async_openai_client(endpoint: str, api_key: str, api_version: str) -> AsyncAzureOpenAI:
+    """Shared AsyncAzureOpenAI client for the running event loop."""
+    clients = _loop_clients()
+    key = (endpoint, api_key, api_version)
+    client = clients["openai"].get(key)
+    if client is None:
+        client = clients["openai"][key] = AsyncAzureOpenAI(
+            azure_endpoint=endpoint,
+            api_key=api_key,
+            api_version=api_version,
+            http_client=clients["http"],
+            max_retries=0,
+        )
+        with _lock:
+            _stats["async_openai_clients_created"] += 1
+        logger.info("Created shared AsyncAzureOpenAI client for %s", endpoint)
+    return client
+
+
+def get_async_search_client(endpoint: str, index_name: str, api_key: str) -> AsyncSearchClient:
+    """Shared async SearchClient for (endpoint, index) on the running event loop, LRU-bounded."""
+    clients = _loop_clients()["search"]
+    key = (endpoint, index_name)
+    client = clients.get(key)
+    if client is not None:
+        clients.move_to_end(key)
+        return client
+    client = clients[key] = AsyncSearchClient(
+        endpoint=search_endpoint_url(endpoint),
+        index_name=index_name,
+        credential=AzureKeyCredential(api_key),
+        retry_total=0,
+    )
+    with _lock:
+        _stats["async_search_clients_created"] += 1
+    while len(clients) > SEARCH_CLIENT_CACHE_SIZE:
+        # each async SearchClient owns its aiohttp session; close it in the background
+        _, evicted = clients.popitem(last=False)
+        asyncio.get_running_loop().create_task(evicted.close())
+        with _lock:
+            _stats["search_clients_evicted"] += 1
+    logger.info("Created shared async SearchClient for %s/%s", endpoint, index_name)
+    return client
+
+
+async def aclose_async_clients() -> None:
+    """Close the running loop's async clients and their connection pools."""
+    with _lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), None)
+    if clients is None:
+        return
+    for client in clients["search"].values():
+        await client.close()
+    await clients["http"].aclose()
+
+
+def get_client_stats() -> Dict[str, int]:
+    """Counters for the metrics endpoint."""
+    with _lock:
+        return {
+            **_stats,
+            "openai_clients": len(_openai_clients),
+            "search_clients": len(_search_clients),
+            "event_loops": len(_async_clients),
+        }
+
+
+def reset_clients() -> None:
+    """Close pooled connections and forget all clients (tests, benchmarks, post-fork)."""
+    global _http_client, _search_session, _search_transport
+    with _lock:
+        _openai_clients.clear()
+        _search_clients.clear()
+        if _http_client is not None:
+            _http_client.close()
+        if _search_session is not None:
+            _search_session.close()
+        _http_client = None
+        _search_session = None
+        _search_transport = None
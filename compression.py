@@ -0,0 +1,108 @@
+"""
+Extractive context compression.
+
+Each retrieved chunk is split into sentences; sentences are scored by cosine
+similarity to the query embedding (one matrix-vector product per chunk) and
+the best ones are kept, with COMPRESSION_NEIGHBORS sentences of surrounding
+context, until the chunk reaches COMPRESSION_CHUNK_TOKENS. Kept sentences stay
+in their original order, with an ellipsis marking each gap, and each chunk
+stays one <source> entry so citations are unaffected.
+"""
+import re
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from config import COMPRESSION_CHUNK_TOKENS, COMPRESSION_NEIGHBORS, COMPRESSION_MIN_SENTENCES
+from token_utils import count_tokens
+
+GAP = "…"
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])|\n{2,}|\n(?=\s*[-*•]|\s*\d+[.)])")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s and s.strip()]
+
+
+def select_sentences(
+    sentences: List[str],
+    scores: np.ndarray,
+    budget: int = COMPRESSION_CHUNK_TOKENS,
+    neighbors: int = COMPRESSION_NEIGHBORS,
+) -> List[int]:
+    """Indices of the sentences to keep, in document order."""
+    tokens = [count_tokens(s) for s in sentences]
+    keep = set()
+    used = 0
+    for best in np.argsort(-scores, kind="stable"):
+        best = int(best)
+        if best in keep:
+            continue
+        span = [i for i in range(best - neighbors, best + neighbors + 1)
+                if 0 <= i < len(sentences) and i not in keep]
+        cost = sum(tokens[i] for i in span)
+        if used + cost > budget:
+            # the neighbours don't fit; try the sentence on its own
+            span, cost = [best], tokens[best]
+        if used + cost > budget and keep:
+            continue
+        keep.update(span)
+        used += cost
+        if used >= budget:
+            break
+    return sorted(keep)
+
+
+def join_kept(sentences: List[str], kept: List[int]) -> str:
+    parts: List[str] = []
+    for pos, i in enumerate(kept):
+        if pos and i != kept[pos - 1] + 1:
+            parts.append(GAP)
+        parts.append(sentences[i])
+    text = " ".join(parts)
+    if kept and kept[0] > 0:
+        text = f"{GAP} {text}"
+    if kept and kept[-1] < len(sentences) - 1:
+        text = f"{text} {GAP}"
+    return text
+
+
+def compress(
+    results: List[Dict],
+    split: List[List[str]],
+    query_vec: Sequence[float],
+    sentence_vecs: Sequence[Sequence[float]],
+    budget: int = COMPRESSION_CHUNK_TOKENS,
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Compressed copies of ``results``.
+
+    ``split`` holds each result's sentences and ``sentence_vecs`` their
+    embeddings, flattened in the same order.
+    """
+    q = np.asarray(query_vec, dtype=np.float32)
+    q /= max(float(np.linalg.norm(q)), 1e-12)
+    matrix = np.asarray(sentence_vecs, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    scores = matrix @ q
+
+    stats = {"sentences_in": 0, "sentences_kept": 0, "tokens_before": 0, "tokens_after": 0}
+    out, offset = [], 0
+    for res, sentences in zip(results, split):
+        chunk_scores = scores[offset:offset + len(sentences)]
+        offset += len(sentences)
+        before = count_tokens(res["chunk"])
+        stats["sentences_in"] += len(sentences)
+        stats["tokens_before"] += before
+        if len(sentences) <= COMPRESSION_MIN_SENTENCES or before <= budget:
+            stats["sentences_kept"] += len(sentences)
+            stats["tokens_after"] += before
+            out.append(res)
+            continue
+        kept = select_sentences(sentences, chunk_scores, budget)
+        chunk = join_kept(sentences, kept)
+        stats["sentences_kept"] += len(kept)
+        stats["tokens_after"] += count_tokens(chunk)
+        out.append({**res, "chunk": chunk})
+    return out, stats
@@ -35,4 +35,159 @@ POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")      # Look for POSTGRES_PORT
 POSTGRES_DB = os.getenv("POSTGRES_DB", "postgres")      # Look for POSTGRES_DB
 POSTGRES_USER = os.getenv("POSTGRES_USER", "postgres")    # Look for POSTGRES_USER
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")        # Look for POSTGRES_PASSWORD
-POSTGRES_SSL_MODE = os.getenv("POSTGRES_SSL_MODE", "require") # Default to 'require' for Render
\ No newline at end of file
+POSTGRES_SSL_MODE = os.getenv("POSTGRES_SSL_MODE", "require") # Default to 'require' for Render
+# --- Shared HTTP client configuration ---
+# One pooled keep-alive connection stack per process (see clients.py)
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+SEARCH_CLIENT_CACHE_SIZE = int(os.getenv("SEARCH_CLIENT_CACHE_SIZE", "8"))
+# --- Cache layer (see cache.py) ---
+# Default backend for every cache namespace: "memory", "sqlite" or "redis"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", os.path.join("cache", "cache.sqlite"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Shared secret for admin routes such as /api/cache/invalidate, sent as the
+# X-Admin-Token header; unset disables those routes
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# --- Embedding cache ---
+# Keyed on (embedding deployment, normalized text); size 0 disables
+EMBEDDING_CACHE_BACKEND = os.getenv("EMBEDDING_CACHE_BACKEND", CACHE_BACKEND)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+# --- Persistent embedding store ---
+# Shared by all workers on a host (see embedding_store.py); empty dir disables
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "embedding_store")
+EMBEDDING_STORE_MAX_ROWS = int(os.getenv("EMBEDDING_STORE_MAX_ROWS", "200000"))
+# --- Batched embeddings ---
+# Azure accepts up to 2048 inputs per embeddings request
+EMBEDDING_BATCH_MAX_INPUTS = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "256"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+# Cross-request micro-batching window for query embeddings; 0 disables
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "10"))
+# A caller whose batch has not come back after this many seconds embeds its
+# text with a call of its own
+EMBEDDING_BATCH_WAIT_TIMEOUT = float(os.getenv("EMBEDDING_BATCH_WAIT_TIMEOUT", "30"))
+# --- Retrieval cache ---
+# Search results keyed on (index, normalized query, top, fields); size 0 disables
+RETRIEVAL_CACHE_BACKEND = os.getenv("RETRIEVAL_CACHE_BACKEND", CACHE_BACKEND)
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+# --- Semantic answer cache ---
+# Serves stored answers to near-duplicate questions; off unless enabled
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_MAX_SCOPES = int(os.getenv("SEMANTIC_CACHE_MAX_SCOPES", "32"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+# --- Exact-match response cache ---
+# Reuses answers for byte-identical requests
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", CACHE_BACKEND)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Only cache temperature 0 requests unless explicitly relaxed
+RESPONSE_CACHE_DETERMINISTIC_ONLY = os.getenv("RESPONSE_CACHE_DETERMINISTIC_ONLY", "true").lower() in ("1", "true", "yes")
+# --- Local reranking ---
+# "off", "bm25", "mmr" or "both"; over-fetches RERANK_CANDIDATES hits and
+# keeps RERANK_TOP_K chunks for the prompt (see rerank.py)
+RERANK_MODE = os.getenv("RERANK_MODE", "off").lower()
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "5"))
+# MMR: 1.0 is pure relevance, lower values favour diversity
+RERANK_MMR_LAMBDA = float(os.getenv("RERANK_MMR_LAMBDA", "0.7"))
+# Weight of BM25 against the normalized @search.score
+RERANK_BM25_WEIGHT = float(os.getenv("RERANK_BM25_WEIGHT", "0.5"))
+RERANK_BM25_K1 = float(os.getenv("RERANK_BM25_K1", "1.2"))
+RERANK_BM25_B = float(os.getenv("RERANK_BM25_B", "0.75"))
+# --- Context packing ---
+# Token budget for the whole prompt (system prompt, sources and query);
+# lower-ranked chunks are trimmed or dropped to fit. 0 disables packing
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# A chunk that would be trimmed below this many tokens is dropped instead
+CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", "64"))
+# tiktoken encoding for counting (token_utils.py); estimated without tiktoken
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+# --- Near-duplicate chunk elimination ---
+# MinHash over word shingles (see dedup.py); chunks at or above the
+# estimated Jaccard threshold collapse into the higher-ranked one
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "64"))
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "3"))  # words per shingle, 1-16
+# --- Extractive context compression ---
+# Keeps the sentences of each chunk closest to the query (see compression.py);
+# costs one batched embeddings call for uncached sentences, no LLM call
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "false").lower() in ("1", "true", "yes")
+COMPRESSION_CHUNK_TOKENS = int(os.getenv("COMPRESSION_CHUNK_TOKENS", "200"))
+COMPRESSION_NEIGHBORS = int(os.getenv("COMPRESSION_NEIGHBORS", "1"))
+# Chunks with this many sentences or fewer are left alone
+COMPRESSION_MIN_SENTENCES = int(os.getenv("COMPRESSION_MIN_SENTENCES", "3"))
+# --- Retries and circuit breaking (see resilience.py) ---
+# Replaces the SDKs' own retries for Azure OpenAI and Azure Search calls
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))  # including the first call
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))
+# Fail instead of waiting when a 429's Retry-After is longer than this
+RETRY_MAX_RETRY_AFTER = float(os.getenv("RETRY_MAX_RETRY_AFTER", "10"))
+# Retries per dependency are capped at this fraction of calls, plus a burst allowance
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_BURST = int(os.getenv("RETRY_BUDGET_BURST", "10"))
+# Consecutive failures that open a dependency's breaker, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+# --- Client-side rate governor (see rate_governor.py) ---
+# Per deployment and per process: divide the Azure quota by the worker count.
+# 0 leaves RPM/TPM unlimited; concurrency still adapts to 429s
+GOVERNOR_ENABLED = os.getenv("GOVERNOR_ENABLED", "true").lower() in ("1", "true", "yes")
+GOVERNOR_RPM = int(os.getenv("GOVERNOR_RPM", "0"))
+GOVERNOR_TPM = int(os.getenv("GOVERNOR_TPM", "0"))
+# JSON overrides per deployment, e.g. {"gpt-4o": {"rpm": 300, "tpm": 50000, "concurrency": 16}}
+GOVERNOR_LIMITS = os.getenv("GOVERNOR_LIMITS", "{}")
+GOVERNOR_MAX_CONCURRENCY = int(os.getenv("GOVERNOR_MAX_CONCURRENCY", "32"))
+GOVERNOR_MIN_CONCURRENCY = int(os.getenv("GOVERNOR_MIN_CONCURRENCY", "1"))
+# Multiplicative decrease of the concurrency limit on a 429
+GOVERNOR_BACKOFF = float(os.getenv("GOVERNOR_BACKOFF", "0.5"))
+# Give up (and fail the call) after waiting this long for a permit
+GOVERNOR_MAX_WAIT = float(os.getenv("GOVERNOR_MAX_WAIT", "30"))
+# --- Priority lanes (see scheduler.py) ---
+# Upstream calls in flight per process, in total and per lane
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "32"))
+SCHEDULER_INTERACTIVE_CONCURRENCY = int(os.getenv("SCHEDULER_INTERACTIVE_CONCURRENCY", "32"))
+SCHEDULER_BATCH_CONCURRENCY = int(os.getenv("SCHEDULER_BATCH_CONCURRENCY", "8"))
+# RAG requests the batch runners keep in flight at once (gather_rag_responses)
+BATCH_RUN_CONCURRENCY = int(os.getenv("BATCH_RUN_CONCURRENCY", "8"))
+# Batch concurrency is halved while interactive p95 call latency exceeds this
+SCHEDULER_INTERACTIVE_P95_MS = float(os.getenv("SCHEDULER_INTERACTIVE_P95_MS", "8000"))
+SCHEDULER_ADJUST_INTERVAL = float(os.getenv("SCHEDULER_ADJUST_INTERVAL", "5"))
+# --- Admission control for the API routes (see admission.py) ---
+# Requests beyond a route class's concurrency wait in a bounded queue for at
+# most its timeout, then get a 503 with Retry-After. Active plus queued
+# requests of all classes must fit in GUNICORN_THREADS (a queued request
+# holds a worker thread too), with some left for the unadmitted routes; the
+# defaults take 28 of 32 and admission.py warns when overrides exceed it
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", "32"))
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# JSON overrides per route class ("query", "stream", "resume", "eval"), e.g.
+# {"stream": {"concurrency": 10, "queue": 2, "timeout": 5}}
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "{}")
+# --- Streaming ---
+# Seconds a streamed answer may run (retrieval included) before the upstream
+# completion is closed and the partial answer is finalized; 0 disables.
+# Per request with the "deadline" setting
+STREAM_DEADLINE = float(os.getenv("STREAM_DEADLINE", "120"))
+# Server-Sent Events mode of /api/stream_query (see streaming.py)
+# Comment line sent while no event is ready, so proxies keep the connection
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "15"))
+# A disconnected SSE stream keeps generating this long, waiting for the client
+# to resume with Last-Event-ID, before the upstream completion is closed
+SSE_RESUME_GRACE = float(os.getenv("SSE_RESUME_GRACE", "15"))
+# Finished streams stay resumable this long; at most this many are kept
+SSE_RESUME_TTL = float(os.getenv("SSE_RESUME_TTL", "60"))
+SSE_RESUME_MAX_STREAMS = int(os.getenv("SSE_RESUME_MAX_STREAMS", "256"))
+# Answers generating at once in SSE mode, per process; each runs on its own
+# thread, which holds the request's "stream" admission slot until it is done
+SSE_MAX_PRODUCERS = int(os.getenv("SSE_MAX_PRODUCERS", "16"))
+# Streamed text is sent in frames: the first token at once, later ones grouped
+# for this many milliseconds or until this many bytes are held; 0 ms disables
+STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", "30"))
+STREAM_COALESCE_BYTES = int(os.getenv("STREAM_COALESCE_BYTES", "512"))
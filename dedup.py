@@ -0,0 +1,94 @@
+"""
+Near-duplicate chunk elimination before context packing.
+
+The index holds the same paragraph in several documents and in overlapping
+chunk windows. Each chunk gets a MinHash signature over word shingles; two
+chunks whose estimated Jaccard similarity reaches DEDUP_THRESHOLD are
+collapsed into the one ranked higher, which records the titles of the chunks
+it absorbed so citations can still name them.
+"""
+import re
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from config import DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_SHINGLE_SIZE
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_MASK = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _permutations(num_perm: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(1)
+    # odd multipliers keep multiply-shift hashing a bijection on uint64
+    a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+_PERMS = _permutations(DEDUP_NUM_PERM)
+_SHINGLE_MULTS = np.random.default_rng(2).integers(1, 2**63, size=16, dtype=np.uint64) | np.uint64(1)
+
+
+def shingles(text: str, size: int = DEDUP_SHINGLE_SIZE) -> np.ndarray:
+    """Distinct 64-bit hashes of the word ``size``-grams in ``text``."""
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    # str hashes are salted per process, which is fine: signatures are
+    # only compared within one request
+    ids = np.array([hash(w) for w in words], dtype=np.int64).view(np.uint64)
+    size = min(size, len(ids))
+    n = len(ids) - size + 1
+    grams = np.zeros(n, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset, mult in enumerate(_SHINGLE_MULTS[:size]):
+            grams = (grams ^ ids[offset:offset + n]) * mult
+    return np.unique(grams)
+
+
+def minhash(text: str) -> np.ndarray:
+    a, b = _PERMS
+    hashes = shingles(text)
+    if hashes.size == 0:
+        return np.full(len(a), _MASK, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        permuted = hashes[:, None] * a[None, :] + b[None, :]
+    return permuted.min(axis=0)
+
+
+def similarity_matrix(texts: List[str]) -> np.ndarray:
+    """Estimated pairwise Jaccard similarity of ``texts``."""
+    sigs = np.stack([minhash(t) for t in texts])
+    return (sigs[:, None, :] == sigs[None, :, :]).mean(axis=2)
+
+
+def dedup(results: List[Dict], threshold: float = DEDUP_THRESHOLD) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Collapse near-duplicate chunks in best-first ``results``.
+
+    Each kept result lists the distinct titles it absorbed under
+    ``merged_titles``. Returns the kept results and the number removed.
+    """
+    if len(results) < 2:
+        return results, 0
+    sims = similarity_matrix([r["chunk"] for r in results])
+    kept: List[int] = []
+    merged: Dict[int, List[str]] = {}
+    for i in range(len(results)):
+        rep = next((k for k in kept if sims[i, k] >= threshold), None)
+        if rep is None:
+            kept.append(i)
+            continue
+        title = results[i]["title"]
+        titles = merged.setdefault(rep, [])
+        if title != results[rep]["title"] and title not in titles:
+            titles.append(title)
+
+    out = []
+    for i in kept:
+        entry = results[i]
+        if merged.get(i):
+            entry = {**entry, "merged_titles": entry.get("merged_titles", []) + merged[i]}
+        out.append(entry)
+    return out, len(results) - len(kept)
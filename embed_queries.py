@@ -0,0 +1,52 @@
+"""
+Offline job: embed a list of queries in bulk and warm the embedding caches.
+
+Reads one query per line (or a JSON list of strings) and embeds them with
+FlaskRAGAssistant.generate_embeddings, so thousands of queries take a handful
+of API round trips. Vectors land in the persistent embedding store, which lets
+freshly deployed workers serve the hot query set without re-embedding it.
+
+    python embed_queries.py queries.txt
+    python embed_queries.py queries.json --no-cache
+"""
+import argparse
+import json
+import logging
+import time
+
+from rag_assistant import FlaskRAGAssistant, embedding_cache
+from embedding_store import get_store_stats
+
+
+def load_queries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read()
+    if path.endswith(".json"):
+        return [q for q in json.loads(raw) if isinstance(q, str)]
+    return [line.strip() for line in raw.splitlines() if line.strip()]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Bulk-embed queries and warm the caches")
+    parser.add_argument("path", help="text file (one query per line) or JSON list")
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="recompute every vector instead of reading cached ones (results are still stored)",
+    )
+    args = parser.parse_args()
+
+    queries = load_queries(args.path)
+    assistant = FlaskRAGAssistant()
+    start = time.perf_counter()
+    vectors = assistant.generate_embeddings(queries, refresh=args.no_cache)
+    elapsed = time.perf_counter() - start
+
+    embedded = sum(1 for v in vectors if v is not None)
+    print(f"Embedded {embedded}/{len(queries)} queries in {elapsed:.2f}s")
+    print(f"Embedding cache: {embedding_cache.stats()}")
+    print(f"Embedding store: {get_store_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Cross-request micro-batching of embedding calls.
+
+Concurrent callers that arrive within a short window (EMBEDDING_BATCH_WINDOW_MS)
+are merged into a single embeddings request. The first caller of a window
+becomes the leader: it waits for the window to close (or the batch to fill),
+sends one request for the distinct texts, and hands every caller its own
+vector. No background thread is involved, so the batcher is fork-safe.
+
+A window only opens while another request of the batcher is in flight; an
+idle batcher sends at once, so a lone caller pays no batching delay.
+
+A batch is sent in the highest scheduler lane among its callers, so an
+interactive query never waits behind a batch-lane permit because a batch
+caller happened to lead. A caller whose batch has not come back within
+EMBEDDING_BATCH_WAIT_TIMEOUT seconds embeds its text with a call of its own.
+
+AsyncEmbeddingBatcher does the same for coroutines on one event loop: the
+first caller of a window schedules the flush (at the end of the current
+loop iteration when idle), and every caller awaits a future for its own
+text.
+"""
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from config import EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_BATCH_MAX_INPUTS, EMBEDDING_BATCH_WAIT_TIMEOUT
+from scheduler import BATCH, INTERACTIVE, current_lane, lane
+
+logger = logging.getLogger(__name__)
+
+
+def _top_lane(lanes: Set[str]) -> str:
+    return INTERACTIVE if INTERACTIVE in lanes else BATCH
+
+
+class _Batch:
+    def __init__(self) -> None:
+        self.texts: List[str] = []
+        self.lanes: Set[str] = set()
+        self.closed = False
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results: Dict[str, List[float]] = {}
+        self.error: Optional[BaseException] = None
+
+
+class EmbeddingBatcher:
+    """Merge concurrent ``embed`` calls into one ``embed_fn`` request per window."""
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+        max_batch: int = EMBEDDING_BATCH_MAX_INPUTS,
+        wait_timeout: float = EMBEDDING_BATCH_WAIT_TIMEOUT,
+    ) -> None:
+        self.embed_fn = embed_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._open: Optional[_Batch] = None
+        self._in_flight = 0
+        # statistics
+        self.requests = 0
+        self.batches = 0
+        self.wait_timeouts = 0
+        self.inputs_sent = 0
+        self.max_batch_seen = 0
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self._sizes: Deque[int] = deque(maxlen=1000)
+
+    def embed(self, text: str) -> List[float]:
+        start = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+                # nothing to wait for when no other request is in flight
+                window = self.window if self._in_flight else 0.0
+            if text not in batch.texts:
+                batch.texts.append(text)
+            batch.lanes.add(current_lane.get())
+            if len(batch.texts) >= self.max_batch:
+                # close it now so later callers start a fresh window
+                self._close(batch)
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(window)
+            with self._lock:
+                if not batch.closed:
+                    self._close(batch)
+            self._flush(batch)
+        elif not batch.done.wait(self.wait_timeout):
+            logger.warning("Embedding batch of %d texts timed out, embedding alone", len(batch.texts))
+            with self._lock:
+                self.wait_timeouts += 1
+            return self.embed_fn([text])[0]
+
+        with self._lock:
+            self._waits.append(time.monotonic() - start)
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[text]
+
+    def _close(self, batch: _Batch) -> None:
+        """No more callers join ``batch``; it counts as in flight from now on (lock held)."""
+        if self._open is batch:
+            self._open = None
+        batch.closed = True
+        self._in_flight += 1
+
+    def _flush(self, batch: _Batch) -> None:
+        try:
+            with lane(_top_lane(batch.lanes)):
+                vectors = self.embed_fn(batch.texts)
+            batch.results = dict(zip(batch.texts, vectors))
+        except BaseException as exc:
+            batch.error = exc
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.batches += 1
+                self.inputs_sent += len(batch.texts)
+                self.max_batch_seen = max(self.max_batch_seen, len(batch.texts))
+                self._sizes.append(len(batch.texts))
+            batch.done.set()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            waits = sorted(self._waits)
+            sizes = list(self._sizes)
+            return {
+                "window_ms": self.window * 1000,
+                "requests": self.requests,
+                "batches": self.batches,
+                "wait_timeouts": self.wait_timeouts,
+                "inputs_sent": self.inputs_sent,
+                "mean_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "mean_wait_ms": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                "p95_wait_ms": round(waits[int(len(waits) * 0.95) - 1] * 1000, 2) if len(waits) >= 20 else None,
+            }
+
+
+class AsyncEmbeddingBatcher:
+    """Merge concurrent ``await embed`` calls on one event loop into one request per window."""
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+        max_batch: int = EMBEDDING_BATCH_MAX_INPUTS,
+        wait_timeout: float = EMBEDDING_BATCH_WAIT_TIMEOUT,
+    ) -> None:
+        self.embed_fn = embed_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.wait_timeout = wait_timeout
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._lanes: Set[str] = set()
+        self._timer: Optional[asyncio.Handle] = None
+        self._in_flight = 0
+        # statistics
+        self.requests = 0
+        self.batches = 0
+        self.wait_timeouts = 0
+        self.inputs_sent = 0
+        self.max_batch_seen = 0
+
+    async def embed(self, text: str) -> List[float]:
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        self._lanes.add(current_lane.get())
+        future = self._pending.get(text)
+        if future is None:
+            future = self._pending[text] = loop.create_future()
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                # idle: flush once the callers of this loop iteration are in
+                self._timer = (
+                    loop.call_later(self.window, self._flush) if self._in_flight
+                    else loop.call_soon(self._flush)
+                )
+        # shield: one cancelled caller must not cancel the shared result
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.wait_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Embedding batch timed out, embedding alone")
+            self.wait_timeouts += 1
+            return (await self.embed_fn([text]))[0]
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        lanes, self._lanes = self._lanes, set()
+        if batch:
+            self._in_flight += 1
+            asyncio.get_running_loop().create_task(self._send(batch, _top_lane(lanes)))
+
+    async def _send(self, batch: Dict[str, asyncio.Future], lane_name: str) -> None:
+        texts = list(batch)
+        self.batches += 1
+        self.inputs_sent += len(texts)
+        self.max_batch_seen = max(self.max_batch_seen, len(texts))
+        try:
+            # the task has its own context, so this lane applies to it alone
+            with lane(lane_name):
+                vectors = await self.embed_fn(texts)
+            for text, vector in zip(texts, vectors):
+                if not batch[text].done():
+                    batch[text].set_result(vector)
+        except BaseException as exc:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(exc)
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "window_ms": self.window * 1000,
+            "requests": self.requests,
+            "batches": self.batches,
+            "wait_timeouts": self.wait_timeouts,
+            "inputs_sent": self.inputs_sent,
+            "mean_batch_size": round(self.inputs_sent / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+        }
+
+
+_batchers: Dict[str, EmbeddingBatcher] = {}
+_batchers_lock = threading.Lock()
+# event loop -> {deployment: AsyncEmbeddingBatcher}
+_async_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncEmbeddingBatcher]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_embedding_batcher(
+    deployment: str, embed_fn: Callable[[List[str]], List[List[float]]]
+) -> Optional[EmbeddingBatcher]:
+    """Process-wide batcher for a deployment, or None when batching is disabled."""
+    if EMBEDDING_BATCH_WINDOW_MS <= 0:
+        return None
+    with _batchers_lock:
+        batcher = _batchers.get(deployment)
+        if batcher is None:
+            batcher = _batchers[deployment] = EmbeddingBatcher(embed_fn)
+        return batcher
+
+
+def get_async_embedding_batcher(
+    deployment: str, embed_fn: Callable[[List[str]], Awaitable[List[List[float]]]]
+) -> Optional[AsyncEmbeddingBatcher]:
+    """Batcher for a deployment on the running event loop, or None when batching is disabled."""
+    if EMBEDDING_BATCH_WINDOW_MS <= 0:
+        return None
+    loop = asyncio.get_running_loop()
+    with _batchers_lock:
+        batchers = _async_batchers.setdefault(loop, {})
+        batcher = batchers.get(deployment)
+        if batcher is None:
+            batcher = batchers[deployment] = AsyncEmbeddingBatcher(embed_fn)
+        return batcher
+
+
+def get_batcher_stats() -> Dict[str, Dict[str, float]]:
+    with _batchers_lock:
+        batchers = dict(_batchers)
+        async_batchers = [b for loop_batchers in _async_batchers.values() for b in loop_batchers.items()]
+    stats = {name: b.stats() for name, b in batchers.items()}
+    for i, (name, batcher) in enumerate(async_batchers):
+        stats[f"{name} (async {i})"] = batcher.stats()
+    return stats
@@ -0,0 +1,207 @@
+"""
+Persistent on-disk embedding store shared by every worker on a host.
+
+Layout per embedding deployment, under EMBEDDING_STORE_DIR:
+
+- ``<deployment>.sqlite``: key -> row index (plus the original text, so the hot
+  query set can be inspected or re-embedded offline)
+- ``<deployment>.f32``: append-only float32 matrix, one row per embedding
+
+Readers memory-map the matrix read-only, so vectors live once in the OS page
+cache no matter how many gunicorn workers read them. Writers allocate rows
+inside a SQLite ``BEGIN IMMEDIATE`` transaction, which serialises appends
+across processes; the vector is written before its key is committed, so a
+visible key always points at complete data.
+
+The store is a cache: nothing touches the disk until the first read or
+write, and any SQLite or filesystem error (a locked database while workers
+start, an unwritable directory) is logged and counted, then the lookup is a
+miss and the write is skipped.
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import EMBEDDING_STORE_DIR, EMBEDDING_STORE_MAX_ROWS
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    """SQLite key index plus a memory-mapped float32 matrix."""
+
+    def __init__(self, directory: str, name: str, max_rows: int = EMBEDDING_STORE_MAX_ROWS) -> None:
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", name or "default")
+        self.directory = directory
+        self.db_path = os.path.join(directory, f"{safe_name}.sqlite")
+        self.matrix_path = os.path.join(directory, f"{safe_name}.f32")
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+        self._dim = None
+        self._mm = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self.full = False
+
+    # ───────────── connection handling ─────────────
+    def _connection(self) -> sqlite3.Connection:
+        # connections must not cross a fork (gunicorn preload_app)
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings "
+                    "(key TEXT PRIMARY KEY, row INTEGER NOT NULL, text TEXT)"
+                )
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v INTEGER)")
+            except sqlite3.Error:
+                # retried on the next call, e.g. once a starting worker released the lock
+                conn.close()
+                raise
+            self._conn, self._pid, self._mm = conn, os.getpid(), None
+        return self._conn
+
+    def _dimension(self, conn: sqlite3.Connection) -> Optional[int]:
+        if self._dim is None:
+            row = conn.execute("SELECT v FROM meta WHERE k = 'dim'").fetchone()
+            self._dim = row[0] if row else None
+        return self._dim
+
+    def _row_vector(self, row: int, dim: int) -> Optional[np.ndarray]:
+        if self._mm is None or row >= self._mm.shape[0]:
+            # the matrix grew since we mapped it (or we never mapped it)
+            rows = os.path.getsize(self.matrix_path) // (dim * 4)
+            if row >= rows:
+                return None
+            self._mm = np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(rows, dim))
+        return self._mm[row]
+
+    @staticmethod
+    def key_for(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    # ───────────── public API ─────────────
+    def get(self, text: str) -> Optional[List[float]]:
+        """Return the stored vector for normalized ``text`` or None."""
+        key = self.key_for(text)
+        with self._lock:
+            try:
+                conn = self._connection()
+                found = conn.execute("SELECT row FROM embeddings WHERE key = ?", (key,)).fetchone()
+                dim = self._dimension(conn) if found else None
+                vector = self._row_vector(found[0], dim) if found and dim else None
+            except (sqlite3.Error, OSError, ValueError) as exc:
+                logger.warning("Embedding store read failed: %s", exc)
+                self.errors += 1
+                vector = None
+            if vector is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return vector.tolist()
+
+    def put(self, text: str, embedding: Sequence[float]) -> bool:
+        """Persist a vector. Returns False if it was not written."""
+        if self.full:
+            return False
+        key = self.key_for(text)
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            try:
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if conn.execute("SELECT 1 FROM embeddings WHERE key = ?", (key,)).fetchone():
+                        conn.execute("COMMIT")
+                        return False
+                    dim = self._dimension(conn)
+                    if dim is None:
+                        dim = self._dim = int(vector.shape[0])
+                        conn.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (dim,))
+                        conn.execute("INSERT OR REPLACE INTO meta VALUES ('rows', 0)")
+                    if vector.shape[0] != dim:
+                        raise ValueError(f"expected {dim}-d vector, got {vector.shape[0]}")
+                    rows = conn.execute("SELECT v FROM meta WHERE k = 'rows'").fetchone()[0]
+                    if rows >= self.max_rows:
+                        self.full = True
+                        conn.execute("COMMIT")
+                        logger.warning("Embedding store %s is full (%d rows)", self.matrix_path, rows)
+                        return False
+                    fd = os.open(self.matrix_path, os.O_RDWR | os.O_CREAT, 0o644)
+                    try:
+                        os.pwrite(fd, vector.tobytes(), rows * dim * 4)
+                    finally:
+                        os.close(fd)
+                    conn.execute("INSERT INTO embeddings VALUES (?, ?, ?)", (key, rows, text))
+                    conn.execute("UPDATE meta SET v = ? WHERE k = 'rows'", (rows + 1,))
+                    conn.execute("COMMIT")
+                except BaseException:
+                    try:
+                        conn.execute("ROLLBACK")
+                    except sqlite3.Error:
+                        pass
+                    raise
+            except (sqlite3.Error, OSError, ValueError) as exc:
+                logger.warning("Embedding store write failed: %s", exc)
+                self.errors += 1
+                return False
+            self.writes += 1
+            return True
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            try:
+                rows = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            except (sqlite3.Error, OSError):
+                rows = None
+            return {
+                "path": self.matrix_path,
+                "rows": rows,
+                "max_rows": self.max_rows,
+                "dim": self._dim,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "errors": self.errors,
+                "full": self.full,
+            }
+
+
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(deployment: str) -> Optional[EmbeddingStore]:
+    """Store for this embedding deployment, or None when EMBEDDING_STORE_DIR is unset."""
+    if not EMBEDDING_STORE_DIR:
+        return None
+    name = deployment or "default"
+    with _stores_lock:
+        store = _stores.get(name)
+        if store is None:
+            try:
+                store = _stores[name] = EmbeddingStore(EMBEDDING_STORE_DIR, name)
+            except (sqlite3.Error, OSError) as exc:
+                logger.warning("Embedding store %s unavailable: %s", name, exc)
+                return None
+        return store
+
+
+def get_store_stats() -> Dict[str, Dict[str, object]]:
+    with _stores_lock:
+        stores = dict(_stores)
+    return {name: store.stats() for name, store in stores.items()}
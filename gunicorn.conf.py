@@ -0,0 +1,45 @@
+"""
+Gunicorn settings for the Flask app: gunicorn -c gunicorn.conf.py main:app
+
+Sync workers serve one request per process, so each /api/stream_query
+connection holds a whole worker for the full generation. gthread workers hold
+one thread per stream instead, while the worker's main thread keeps answering
+the arbiter's heartbeat, so `timeout` no longer has to cover the longest
+stream. Every setting can be overridden from the environment.
+
+gevent (GUNICORN_WORKER_CLASS=gevent) is also supported when the gevent
+package is installed; it scales to more idle streams per worker but needs
+GUNICORN_PRELOAD=false so the SDKs are imported after monkey-patching.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count() * 2 + 1, 4))))
+# Concurrent requests (streams) per gthread worker; keep at or below HTTP_POOL_MAXSIZE
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+# Concurrent connections per gevent worker
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# Load the app once in the master so workers share its memory copy-on-write.
+# Clients, caches and stores connect lazily and are reset after fork.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# Heartbeat timeout for a stuck worker (not a request limit for gthread/gevent)
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# Let in-flight streams finish on deploy/restart before workers are killed
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "120"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+accesslog = os.getenv("GUNICORN_ACCESSLOG", "-")
+
+
+def post_fork(server, worker):
+    # Nothing should have connected in the master, but never share sockets
+    # inherited from it between workers.
+    from clients import reset_clients
+
+    reset_clients()
+    server.log.info("Worker %s ready (%s, %s threads)", worker.pid, worker_class, threads)
@@ -49,7 +49,7 @@ def summarize_results(results, system_prompt=None, llm_settings=None):
     prompt = (system_prompt or DEFAULT_SUMMARY_PROMPT).format(results_json=results_json)
 
     assistant = FlaskRAGAssistant(settings=llm_settings or {})
-    answer, *_ = assistant.generate_rag_response(prompt)
+    answer = assistant.complete(prompt)
     return answer
 
 def developer_evaluate_job(query, prompt, parameters, result, llm_settings=None):
@@ -74,7 +74,7 @@ def developer_evaluate_job(query, prompt, parameters, result, llm_settings=None)
         result=result
     )
     assistant = FlaskRAGAssistant(settings=llm_settings or {})
-    suggestions, *_ = assistant.generate_rag_response(meta_prompt)
+    suggestions = assistant.complete(meta_prompt)
     return suggestions
 
 def generate_markdown_report(data):
@@ -88,7 +88,8 @@ def generate_markdown_report(data):
             - parameters: dict
             - result: str
             - sources: list
-            - developer_evaluation: str
+            - developer_evaluation: str, or None when it failed
+            - developer_evaluation_error: str (optional)
             
     Returns:
         str: Markdown formatted report
@@ -140,7 +141,10 @@ def generate_markdown_report(data):
     
     # Developer evaluation section
     md.append("## Developer Evaluation")
-    md.append(data['developer_evaluation'])
+    if data.get('developer_evaluation') is not None:
+        md.append(data['developer_evaluation'])
+    else:
+        md.append(f"Failed: {data.get('developer_evaluation_error') or 'no evaluation returned'}")
     
     # Join all sections with newlines
     return "\n".join(md)
@@ -148,7 +148,7 @@ Provide your analysis structured explicitly as follows:
     })
     
     try:
-        answer, *_ = assistant.generate_rag_response(prompt)
+        answer = assistant.complete(prompt)
         return answer
     except Exception as e:
         return f"Error generating summary: {str(e)}"
@@ -0,0 +1,225 @@
+"""
+Concurrent-stream load test for /api/stream_query.
+
+Starts a local stand-in for Azure OpenAI (embeddings + streamed chat) and
+Azure Search, runs the real app under gunicorn twice, and opens N concurrent
+streams against each:
+
+- before: ``gunicorn main:app`` with default sync workers (the old Procfile)
+- after:  ``gunicorn -c gunicorn.conf.py main:app``
+
+Both get the same number of worker processes (--workers). The stand-in streams
+--tokens chunks --token-ms apart, so a stream lasts about tokens * token_ms.
+
+    python loadtest_stream.py
+    python loadtest_stream.py --streams 64 --workers 2 --tokens 40 --token-ms 50
+    python loadtest_stream.py --url http://localhost:8000 --streams 32   # existing server
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+
+class _Upstream(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, tokens, token_ms):
+        super().__init__(("127.0.0.1", 0), _UpstreamHandler)
+        self.tokens = tokens
+        self.token_ms = token_ms
+        self.lock = threading.Lock()
+        self.active_streams = 0
+        self.peak_streams = 0
+
+    def stream_started(self):
+        with self.lock:
+            self.active_streams += 1
+            self.peak_streams = max(self.peak_streams, self.active_streams)
+
+    def stream_finished(self):
+        with self.lock:
+            self.active_streams -= 1
+
+
+class _UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if "/embeddings" in self.path:
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            self._json({
+                "object": "list",
+                "data": [{"object": "embedding", "index": i, "embedding": [0.1] * 8}
+                         for i in range(len(inputs))],
+                "model": "stand-in",
+                "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+            })
+        elif "/docs/search" in self.path:
+            self._json({"value": [
+                {"chunk": f"Stand-in passage {i} about the query.", "title": f"Doc {i}",
+                 "@search.score": 1.0 / (i + 1)}
+                for i in range(body.get("top", 10))
+            ]})
+        elif "/chat/completions" in self.path:
+            self._stream_chat()
+        else:
+            self.send_error(404)
+
+    def _stream_chat(self):
+        server = self.server
+        server.stream_started()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(server.tokens + 1):
+                done = i == server.tokens
+                chunk = {
+                    "id": "chatcmpl-standin", "object": "chat.completion.chunk",
+                    "created": int(time.time()), "model": "stand-in",
+                    "choices": [{"index": 0, "delta": {} if done else {"content": f"tok{i} "},
+                                 "finish_reason": "stop" if done else None}],
+                }
+                self._chunk(f"data: {json.dumps(chunk)}\n\n")
+                if not done:
+                    time.sleep(server.token_ms / 1000.0)
+            self._chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        finally:
+            server.stream_finished()
+
+    def _chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_app(args, upstream_url, tuned, workdir):
+    port = _free_port()
+    env = {
+        **os.environ,
+        "OPENAI_ENDPOINT": upstream_url, "OPENAI_KEY": "stand-in", "OPENAI_API_VERSION": "2024-02-01",
+        "EMBEDDING_DEPLOYMENT": "emb", "CHAT_DEPLOYMENT": "chat",
+        "SEARCH_ENDPOINT": upstream_url, "SEARCH_INDEX": "stand-in", "SEARCH_KEY": "stand-in",
+        "VECTOR_FIELD": "vector", "EMBEDDING_STORE_DIR": "", "CACHE_BACKEND": "memory",
+        "PORT": str(port), "WEB_CONCURRENCY": str(args.workers), "PYTHONPATH": REPO,
+    }
+    if tuned:
+        cmd = ["gunicorn", "-c", os.path.join(REPO, "gunicorn.conf.py"), "main:app"]
+    else:
+        cmd = ["gunicorn", "main:app", "--bind", f"127.0.0.1:{port}", "--workers", str(args.workers)]
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{url}/api/metrics", timeout=1).read()
+            return proc, url
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"gunicorn did not start: {' '.join(cmd)}")
+
+
+def _one_stream(url, i, out):
+    payload = json.dumps({"query": f"load test question {i} {time.time()}", "settings": {}}).encode()
+    req = urllib.request.Request(f"{url}/api/stream_query", data=payload,
+                                 headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=300) as resp:
+            first = resp.read(1)
+            ttfb = time.perf_counter() - start
+            rest = resp.read()
+        ok = b"[[META]]" in first + rest
+        out[i] = (ttfb, time.perf_counter() - start, ok)
+    except Exception:
+        out[i] = (None, time.perf_counter() - start, False)
+
+
+def run_load(url, streams):
+    out = [None] * streams
+    threads = [threading.Thread(target=_one_stream, args=(url, i, out)) for i in range(streams)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    ttfbs = sorted(r[0] for r in out if r[0] is not None)
+    return {
+        "ok": sum(1 for r in out if r[2]),
+        "wall_s": wall,
+        "ttfb_p50_s": statistics.median(ttfbs) if ttfbs else float("nan"),
+        "ttfb_max_s": ttfbs[-1] if ttfbs else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /api/stream_query load test")
+    parser.add_argument("--streams", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--token-ms", type=float, default=50)
+    parser.add_argument("--url", help="load an already running server instead")
+    args = parser.parse_args()
+
+    if args.url:
+        print(run_load(args.url, args.streams))
+        return
+
+    upstream = _Upstream(args.tokens, args.token_ms)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    upstream_url = f"http://127.0.0.1:{upstream.server_address[1]}"
+    stream_s = args.tokens * args.token_ms / 1000
+    print(f"{args.streams} concurrent streams, {args.workers} workers, ~{stream_s:.1f}s per stream")
+    print(f"{'config':<8} {'ok':>5} {'wall s':>8} {'ttfb p50 s':>11} {'ttfb max s':>11} {'peak upstream':>14}")
+
+    with tempfile.TemporaryDirectory() as workdir:  # app.log lands here
+        for label, tuned in (("before", False), ("after", True)):
+            proc, url = _start_app(args, upstream_url, tuned, workdir)
+            try:
+                upstream.peak_streams = 0
+                r = run_load(url, args.streams)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+            print(f"{label:<8} {r['ok']:>5} {r['wall_s']:>8.2f} {r['ttfb_p50_s']:>11.2f} "
+                  f"{r['ttfb_max_s']:>11.2f} {upstream.peak_streams:>14}")
+    upstream.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,7 @@
+import functools
+import hmac
 import traceback
+from contextlib import closing
 from flask import Flask, request, jsonify, render_template_string, Response, send_from_directory
 import json
 import logging
@@ -6,8 +9,20 @@ import sys
 import os
 
 # Import directly from the current directory
-from rag_assistant import FlaskRAGAssistant
+from rag_assistant import (
+    FlaskRAGAssistant, semantic_cache, invalidate_retrieval_cache, invalidate_semantic_cache, retrieval_cache
+)
+from cache import get_cache_stats
 from llm_summary_compact import summarize_batch_comparison
+from clients import get_client_stats
+from embedding_store import get_store_stats
+from embedding_batcher import get_batcher_stats
+from resilience import get_resilience_stats
+from rate_governor import get_governor_stats
+from scheduler import lane, get_scheduler_stats
+from admission import admit, busy_response, detach_admission, get_admission_stats, get_controller
+from streaming import get_stream_stats, start_event_stream, get_event_buffer, parse_event_id, sse_response, coalesce
+from config import ADMIN_TOKEN
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -34,6 +49,21 @@ logger.info("Flask RAG application starting up")
 
 app = Flask(__name__)
 
+# One assistant per process: clients are shared and settings are passed per call
+shared_assistant = FlaskRAGAssistant()
+
+
+def admin_only(view):
+    """Require the X-Admin-Token header to match ADMIN_TOKEN (route disabled when unset)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get("X-Admin-Token", "")
+        if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            logger.warning(f"Rejected unauthorized {request.path} request")
+            return jsonify({"success": False, "error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
 # HTML template with Tailwind CSS
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -435,6 +465,7 @@ HTML_TEMPLATE = """
       // Add to chat
       chatMessages.appendChild(messageDiv);
       chatMessages.scrollTop = chatMessages.scrollHeight;
+      return messageDiv;
     }
     
     // Add typing indicator
@@ -473,7 +504,133 @@ HTML_TEMPLATE = """
       });
     }
     
-    // Standard query submission (will be overridden by unifiedDevEval.js)
+    // Show sources in the sources panel; only cited sources carry the
+    // [n] numbers the answer uses
+    function renderSources(sources, cited) {
+      const sourcesContainer = document.getElementById('sources-container');
+      const sourcesDiv = document.getElementById('sources');
+
+      if (sourcesContainer && sourcesDiv) {
+        sourcesDiv.innerHTML = '';
+        sources.forEach((source, index) => {
+          const sourceItem = document.createElement('div');
+          sourceItem.className = 'source-item mb-1 p-1 bg-gray-50 rounded text-sm';
+          sourceItem.id = `source-${index + 1}`;
+
+          // Handle different source formats
+          let sourceTitle = '';
+          let sourceContent = '';
+
+          if (typeof source === 'string') {
+            // For string sources, use the first 100 chars as title and the rest as content
+            if (source.length > 100) {
+              sourceTitle = source.substring(0, 100) + '...';
+              sourceContent = source;
+            } else {
+              sourceTitle = source;
+              sourceContent = '';
+            }
+          } else if (typeof source === 'object') {
+            // Extract title and content from source object
+            sourceTitle = source.title || source.id || `Source ${index + 1}`;
+            sourceContent = source.content || '';
+          }
+
+          // Truncate content if it's too long (more than 150 chars)
+          const isLongContent = sourceContent.length > 150;
+          const truncatedContent = isLongContent ? 
+            sourceContent.substring(0, 150) + '...' : 
+            sourceContent;
+
+          // Create HTML with collapsible content
+          sourceItem.innerHTML = `
+            <div>
+             <p class="text-sm text-black font-bold"> ${cited ? `[${index + 1}] ` : ''}${sourceTitle}</p>
+              <div class="source-content">${truncatedContent}</div>
+              ${isLongContent ? 
+                `<div class="source-full-content hidden">${sourceContent}</div>
+                 <button class="toggle-source-btn text-blue-600 text-xs mt-1 hover:underline">Show more</button>` 
+                : ''}
+            </div>
+          `;
+
+          // Add event listener for toggle button
+          if (isLongContent) {
+            setTimeout(() => {
+              const toggleBtn = sourceItem.querySelector('.toggle-source-btn');
+              if (toggleBtn) {
+                toggleBtn.addEventListener('click', function() {
+                  const truncatedEl = this.parentNode.querySelector('.source-content');
+                  const fullEl = this.parentNode.querySelector('.source-full-content');
+
+                  if (truncatedEl.classList.contains('hidden')) {
+                    // Show truncated, hide full
+                    truncatedEl.classList.remove('hidden');
+                    fullEl.classList.add('hidden');
+                    this.textContent = 'Show more';
+                  } else {
+                    // Show full, hide truncated
+                    truncatedEl.classList.add('hidden');
+                    fullEl.classList.remove('hidden');
+                    this.textContent = 'Show less';
+                  }
+                });
+              }
+            }, 100);
+          }
+          sourcesDiv.appendChild(sourceItem);
+        });
+
+        // Add click event for citation links (once per link; sources are
+        // rendered more than once per answer)
+        document.querySelectorAll('.citation-link').forEach(link => {
+            if (link.dataset.bound) return;
+            link.dataset.bound = '1';
+            link.addEventListener('click', function(e) {
+              e.preventDefault();
+              // Expand sources panel on citation click
+              const sourcesBody = document.getElementById('sources-body');
+              const sourcesChevron = document.getElementById('sources-chevron');
+              if (sourcesBody && sourcesBody.classList.contains('hidden')) {
+                sourcesBody.classList.remove('hidden');
+                sourcesChevron.classList.add('rotate-180');
+              }
+            const sourceId = this.getAttribute('data-source-id');
+            const sourceElement = document.getElementById(`source-${sourceId}`);
+            if (sourceElement) {
+              sourceElement.scrollIntoView({ behavior: 'smooth' });
+              sourceElement.classList.add('bg-yellow-100');
+              setTimeout(() => {
+                sourceElement.classList.remove('bg-yellow-100');
+              }, 2000);
+            }
+          });
+        });
+
+        // Position sources panel below the latest bot response
+        if (sourcesContainer && sourcesDiv) {
+          const lastMsg = chatMessages.querySelector('.bot-message:last-of-type');
+          if (lastMsg) {
+            lastMsg.insertAdjacentElement('afterend', sourcesContainer);
+          }
+          sourcesContainer.classList.remove('hidden');
+          const sourcesHeader = document.getElementById('sources-header');
+          const sourcesBody = document.getElementById('sources-body');
+          const sourcesChevron = document.getElementById('sources-chevron');
+          if (sourcesHeader && !sourcesHeader.dataset.bound) {
+            sourcesHeader.dataset.bound = '1';
+            sourcesHeader.addEventListener('click', function() {
+              sourcesBody.classList.toggle('hidden');
+              sourcesChevron.classList.toggle('rotate-180');
+            });
+          }
+        }
+      }
+    }
+
+    // Standard query submission (will be overridden by unifiedDevEval.js).
+    // The answer streams as Server-Sent Events: the retrieved sources show
+    // first, then the answer as it is generated, then the cited sources
     function submitQuery() {
       const query = queryInput.value.trim();
       if (!query) return;
@@ -483,143 +640,70 @@ HTML_TEMPLATE = """
       
       // Show typing indicator
       const typingIndicator = addTypingIndicator();
+      let bubble = null;
+      let answer = '';
       
-      // Call API to get response
-      fetch('/api/query', {
+      function showAnswer() {
+        if (typingIndicator) typingIndicator.remove();
+        if (!bubble) {
+          bubble = addBotMessage('').querySelector('.bot-bubble');
+        }
+        bubble.innerHTML = formatMessage(answer);
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+      }
+      
+      function handleEvent(event, data) {
+        if (event === 'token') {
+          answer += data.text;
+          showAnswer();
+        } else if (event === 'sources') {
+          renderSources(data.sources || [], data.stage === 'cited');
+        } else if (event === 'error') {
+          answer += (answer ? '\\n\\n' : '') + 'Error: ' + data.error;
+          showAnswer();
+        }
+      }
+      
+      // EventSource cannot POST, so the event stream is parsed by hand
+      fetch('/api/stream_query', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ query: query })
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+        body: JSON.stringify({ query: query, format: 'sse' })
       })
-      .then(response => response.json())
-      .then(data => {
-        // Remove typing indicator
-        if (typingIndicator) typingIndicator.remove();
-        
-        // Show response
-        if (data.error) {
-          addBotMessage('Error: ' + data.error);
-        } else {
-          addBotMessage(data.answer);
-          
-          // Show sources if available
-          if (data.sources && data.sources.length > 0) {
-            const sourcesContainer = document.getElementById('sources-container');
-            const sourcesDiv = document.getElementById('sources');
-            
-            if (sourcesContainer && sourcesDiv) {
-              sourcesDiv.innerHTML = '';
-              data.sources.forEach((source, index) => {
-                const sourceItem = document.createElement('div');
-                sourceItem.className = 'source-item mb-1 p-1 bg-gray-50 rounded text-sm';
-                sourceItem.id = `source-${index + 1}`;
-                
-                // Handle different source formats
-                let sourceTitle = '';
-                let sourceContent = '';
-                
-                if (typeof source === 'string') {
-                  // For string sources, use the first 100 chars as title and the rest as content
-                  if (source.length > 100) {
-                    sourceTitle = source.substring(0, 100) + '...';
-                    sourceContent = source;
-                  } else {
-                    sourceTitle = source;
-                    sourceContent = '';
-                  }
-                } else if (typeof source === 'object') {
-                  // Extract title and content from source object
-                  sourceTitle = source.title || source.id || `Source ${index + 1}`;
-                  sourceContent = source.content || '';
-                }
-                
-                // Truncate content if it's too long (more than 150 chars)
-                const isLongContent = sourceContent.length > 150;
-                const truncatedContent = isLongContent ? 
-                  sourceContent.substring(0, 150) + '...' : 
-                  sourceContent;
-                
-                // Create HTML with collapsible content
-                sourceItem.innerHTML = `
-                  <div>
-                   <p class="text-sm text-black font-bold"> [${index + 1}] ${sourceTitle}</p>
-                    <div class="source-content">${truncatedContent}</div>
-                    ${isLongContent ? 
-                      `<div class="source-full-content hidden">${sourceContent}</div>
-                       <button class="toggle-source-btn text-blue-600 text-xs mt-1 hover:underline">Show more</button>` 
-                      : ''}
-                  </div>
-                `;
-                
-                // Add event listener for toggle button
-                if (isLongContent) {
-                  setTimeout(() => {
-                    const toggleBtn = sourceItem.querySelector('.toggle-source-btn');
-                    if (toggleBtn) {
-                      toggleBtn.addEventListener('click', function() {
-                        const truncatedEl = this.parentNode.querySelector('.source-content');
-                        const fullEl = this.parentNode.querySelector('.source-full-content');
-                        
-                        if (truncatedEl.classList.contains('hidden')) {
-                          // Show truncated, hide full
-                          truncatedEl.classList.remove('hidden');
-                          fullEl.classList.add('hidden');
-                          this.textContent = 'Show more';
-                        } else {
-                          // Show full, hide truncated
-                          truncatedEl.classList.add('hidden');
-                          fullEl.classList.remove('hidden');
-                          this.textContent = 'Show less';
-                        }
-                      });
-                    }
-                  }, 100);
-                }
-                sourcesDiv.appendChild(sourceItem);
-              });
-              
-              // Add click event for citation links
-              document.querySelectorAll('.citation-link').forEach(link => {
-                  link.addEventListener('click', function(e) {
-                    e.preventDefault();
-                    // Expand sources panel on citation click
-                    const sourcesBody = document.getElementById('sources-body');
-                    const sourcesChevron = document.getElementById('sources-chevron');
-                    if (sourcesBody && sourcesBody.classList.contains('hidden')) {
-                      sourcesBody.classList.remove('hidden');
-                      sourcesChevron.classList.add('rotate-180');
-                    }
-                  const sourceId = this.getAttribute('data-source-id');
-                  const sourceElement = document.getElementById(`source-${sourceId}`);
-                  if (sourceElement) {
-                    sourceElement.scrollIntoView({ behavior: 'smooth' });
-                    sourceElement.classList.add('bg-yellow-100');
-                    setTimeout(() => {
-                      sourceElement.classList.remove('bg-yellow-100');
-                    }, 2000);
-                  }
-                });
+      .then(response => {
+        if (!response.ok) {
+          // e.g. 503 with Retry-After when the server is busy
+          return response.json().then(data => {
+            answer = 'Error: ' + (data.error || `HTTP error! Status: ${response.status}`);
+            showAnswer();
+          });
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let pending = '';
+        function read() {
+          return reader.read().then(({ done, value }) => {
+            if (done) return;
+            pending += decoder.decode(value, { stream: true });
+            const frames = pending.split('\\n\\n');
+            pending = frames.pop();
+            frames.forEach(frame => {
+              let event = 'message';
+              let data = '';
+              frame.split('\\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
               });
-              
-              // Position sources panel below the latest bot response
-              if (sourcesContainer && sourcesDiv) {
-                const lastMsg = chatMessages.querySelector('.bot-message:last-of-type');
-                if (lastMsg) {
-                  lastMsg.insertAdjacentElement('afterend', sourcesContainer);
-                }
-                sourcesContainer.classList.remove('hidden');
-                const sourcesHeader = document.getElementById('sources-header');
-                const sourcesBody = document.getElementById('sources-body');
-                const sourcesChevron = document.getElementById('sources-chevron');
-                if (sourcesHeader) {
-                  sourcesHeader.addEventListener('click', function() {
-                    sourcesBody.classList.toggle('hidden');
-                    sourcesChevron.classList.toggle('rotate-180');
-                  });
-                }
-              }
-            }
-          }
+              // "retry:" and ": ping" frames carry no data
+              if (data) handleEvent(event, JSON.parse(data));
+            });
+            return read();
+          });
         }
+        return read();
+      })
+      .then(() => {
+        if (!bubble) showAnswer();
       })
       .catch(error => {
         // Remove typing indicator
@@ -764,6 +848,7 @@ def index():
     return render_template_string(HTML_TEMPLATE, file_executed=file_executed)
 
 @app.route("/api/query", methods=["POST"])
+@admit("query")
 def api_query():
     data = request.get_json()
     logger.info("DEBUG - Incoming /api/query payload: %s", json.dumps(data))
@@ -775,24 +860,25 @@ def api_query():
     logger.info(f"DEBUG - Request settings: {json.dumps(settings)}")
     
     try:
-        # Initialize the RAG assistant with settings if provided
-        rag_assistant = FlaskRAGAssistant(settings=settings)
-        logger.info(f"DEBUG - Using model: {rag_assistant.deployment_name}")
-        logger.info(f"DEBUG - Temperature: {rag_assistant.temperature}")
-        logger.info(f"DEBUG - Max tokens: {rag_assistant.max_tokens}")
-        logger.info(f"DEBUG - Top P: {rag_assistant.top_p}")
-        logger.info(f"DEBUG - Presence penalty: {rag_assistant.presence_penalty}")
-        logger.info(f"DEBUG - Frequency penalty: {rag_assistant.frequency_penalty}")
+        # Resolve the effective settings for this request
+        cfg = shared_assistant.resolve_settings(settings)
+        logger.info(f"DEBUG - Using model: {cfg['deployment_name']}")
+        logger.info(f"DEBUG - Temperature: {cfg['temperature']}")
+        logger.info(f"DEBUG - Max tokens: {cfg['max_tokens']}")
+        logger.info(f"DEBUG - Top P: {cfg['top_p']}")
+        logger.info(f"DEBUG - Presence penalty: {cfg['presence_penalty']}")
+        logger.info(f"DEBUG - Frequency penalty: {cfg['frequency_penalty']}")
         
-        answer, cited_sources, _, evaluation, context = rag_assistant.generate_rag_response(user_query)
+        result = shared_assistant.generate_rag_result(user_query, settings)
         logger.info(f"API query response generated for: {user_query}")
-        logger.info(f"DEBUG - Response length: {len(answer)}")
-        logger.info(f"DEBUG - Number of cited sources: {len(cited_sources)}")
+        logger.info(f"DEBUG - Response length: {len(result['answer'])}")
+        logger.info(f"DEBUG - Number of cited sources: {len(result['sources'])}")
         
         return jsonify({
-            "answer": answer,
-            "sources": cited_sources,
-            "evaluation": evaluation
+            "answer": result["answer"],
+            "sources": result["sources"],
+            "evaluation": result["evaluation"],
+            "metadata": result["metadata"]
         })
     except Exception as e:
         logger.error(f"Error in api_query: {str(e)}")
@@ -802,6 +888,7 @@ def api_query():
         }), 500
 
 @app.route("/api/stream_query", methods=["POST"])
+@admit("stream")
 def api_stream_query():
     data = request.get_json()
     user_query = data.get("query", "")
@@ -811,29 +898,51 @@ def api_stream_query():
     # Extract any settings from the request
     settings = data.get("settings", {})
     logger.info(f"DEBUG - Request settings: {json.dumps(settings)}")
+
+    # Server-Sent Events on request, raw text with a [[META]] trailer otherwise
+    if data.get("format") == "sse" or request.accept_mimetypes.best == "text/event-stream":
+        # the producer thread outlives this response; it keeps the "stream"
+        # slot until the answer is done
+        release = detach_admission()
+        buffer = start_event_stream(_sse_events(user_query, settings), on_finish=release)
+        if buffer is None:
+            if release is not None:
+                release()
+            logger.warning("Rejected SSE stream, too many producers running")
+            return busy_response(get_controller("stream").retry_after())
+        return sse_response(buffer)
     
     def generate():
         try:
-            # Initialize the RAG assistant with settings if provided
-            rag_assistant = FlaskRAGAssistant(settings=settings)
+            # Resolve the effective settings for this request
+            cfg = shared_assistant.resolve_settings(settings)
             logger.info(f"Starting stream response for: {user_query}")
-            logger.info(f"DEBUG - Using model: {rag_assistant.deployment_name}")
-            logger.info(f"DEBUG - Temperature: {rag_assistant.temperature}")
-            logger.info(f"DEBUG - Max tokens: {rag_assistant.max_tokens}")
-            logger.info(f"DEBUG - Top P: {rag_assistant.top_p}")
-            logger.info(f"DEBUG - Presence penalty: {rag_assistant.presence_penalty}")
-            logger.info(f"DEBUG - Frequency penalty: {rag_assistant.frequency_penalty}")
+            logger.info(f"DEBUG - Using model: {cfg['deployment_name']}")
+            logger.info(f"DEBUG - Temperature: {cfg['temperature']}")
+            logger.info(f"DEBUG - Max tokens: {cfg['max_tokens']}")
+            logger.info(f"DEBUG - Top P: {cfg['top_p']}")
+            logger.info(f"DEBUG - Presence penalty: {cfg['presence_penalty']}")
+            logger.info(f"DEBUG - Frequency penalty: {cfg['frequency_penalty']}")
             
-            # Use streaming method
-            for chunk in rag_assistant.stream_rag_response(user_query):
-                logger.info("DEBUG - AI stream chunk: %s", chunk)
-                if isinstance(chunk, str):
-                    yield chunk
-                else:
-                    yield f"\n[[META]]{json.dumps(chunk)}"
+            # Use streaming method; closing it on a client disconnect closes
+            # the upstream completion as well (coalesce owns it and closes it).
+            # Tokens go out in coalesced frames
+            frames = chars = 0
+            with closing(coalesce(shared_assistant.stream_rag_response(user_query, settings))) as chunks:
+                for chunk in chunks:
+                    if isinstance(chunk, str):
+                        frames += 1
+                        chars += len(chunk)
+                        yield chunk
+                    else:
+                        yield f"\n[[META]]{json.dumps(chunk)}"
             
-            logger.info(f"Completed stream response for: {user_query}")
+            logger.info(f"Completed stream response for: {user_query} ({frames} frames, {chars} chars)")
                 
+        except GeneratorExit:
+            # the WSGI server closes the response when a write to the client fails
+            logger.info(f"Client disconnected, stream cancelled for: {user_query}")
+            raise
         except Exception as e:
             logger.error(f"Error in stream_query: {str(e)}")
             logger.error(f"Traceback: {traceback.format_exc()}")
@@ -842,6 +951,82 @@ def api_stream_query():
     
     return Response(generate(), mimetype="text/plain")
 
+def _sse_events(user_query, settings):
+    """stream_rag_response output as (event, data) pairs for the SSE mode"""
+    try:
+        chunks = shared_assistant.stream_rag_response(user_query, settings, candidates=True)
+        with closing(chunks):
+            # the event buffer groups the tokens into frames
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    yield "token", {"text": chunk}
+                    continue
+                if "candidates" in chunk:
+                    # retrieved sources, before the first token
+                    yield "sources", {"stage": "candidates", "sources": chunk["candidates"]}
+                    continue
+                yield "sources", {"stage": "cited", "sources": chunk.get("sources", [])}
+                yield "metrics", {"evaluation": chunk.get("evaluation", {}), "metadata": chunk.get("metadata", {})}
+                if "error" in chunk:
+                    yield "error", {"error": chunk["error"], "retry_after": chunk.get("retry_after")}
+        logger.info(f"Completed SSE stream for: {user_query}")
+    except Exception as e:
+        logger.error(f"Error in SSE stream_query: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        yield "error", {"error": str(e)}
+
+@app.route("/api/stream_query/<stream_id>", methods=["GET"])
+@admit("resume")
+def api_stream_resume(stream_id):
+    """Resume an SSE stream after the Last-Event-ID the client saw"""
+    buffer = get_event_buffer(stream_id)
+    if buffer is None:
+        return jsonify({"error": "Unknown or expired stream, please send the query again."}), 404
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    logger.info(f"Resuming SSE stream {stream_id} after {last_event_id}")
+    return sse_response(buffer, parse_event_id(stream_id, last_event_id), resumed=True)
+
+@app.route("/api/metrics", methods=["GET"])
+def api_metrics():
+    """Process-level performance counters (clients, caches, ...)"""
+    return jsonify({
+        "pid": os.getpid(),
+        "clients": get_client_stats(),
+        "caches": get_cache_stats(),
+        "embedding_store": get_store_stats(),
+        "embedding_batcher": get_batcher_stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "resilience": get_resilience_stats(),
+        "rate_governor": get_governor_stats(),
+        "scheduler": get_scheduler_stats(),
+        "admission": get_admission_stats(),
+        "streaming": get_stream_stats()
+    })
+
+@app.route("/api/cache/invalidate", methods=["POST"])
+@admin_only
+def api_cache_invalidate():
+    """
+    Drop cached retrieval results and the semantic answers built from them,
+    e.g. after the search index is rebuilt.
+    Expects JSON: { "index": "..." } (optional; omit to clear every index)
+    and the X-Admin-Token header.
+    Returns: { "success": ..., "removed": <retrieval entries>,
+               "semantic_removed": <answers>, "failed": {...} }
+    """
+    data = request.get_json(silent=True) or {}
+    index = data.get("index")
+    removed = invalidate_retrieval_cache(index)
+    semantic_removed = invalidate_semantic_cache(index)
+    if removed is None:
+        return jsonify({
+            "success": False,
+            "removed": 0,
+            "semantic_removed": semantic_removed,
+            "failed": {"retrieval": retrieval_cache.backend},
+        }), 503
+    return jsonify({"success": True, "removed": removed, "semantic_removed": semantic_removed, "failed": {}})
+
 @app.route("/api/feedback", methods=["POST"])
 def api_feedback():
     data = request.get_json()
@@ -877,14 +1062,27 @@ def serve_static(filename):
     # If not found in either location, return 404
     return "File not found", 404
 
+def _developer_evaluation(**job):
+    """
+    Run developer_evaluate_job; returns (suggestions, error). A failed
+    evaluation must not lose the answer it was asked about.
+    """
+    from llm_summary import developer_evaluate_job
+    try:
+        return developer_evaluate_job(**job), None
+    except Exception as e:
+        logger.error(f"Developer evaluation failed: {str(e)}")
+        return None, str(e)
+
 @app.route("/api/dev_eval", methods=["POST"])
+@admit("eval")
 def api_dev_eval():
     """
     Developer Evaluation API endpoint.
     Expects JSON: { "query": ..., "prompt": ..., "parameters": { "temperature": ..., "top_p": ..., "max_tokens": ... } }
-    Returns: { "result": ..., "developer_evaluation": ..., "download_url_json": ..., "download_url_md": ..., "markdown_report": ... }
+    Returns: { "result": ..., "developer_evaluation": ..., "developer_evaluation_error": ..., "download_url_json": ..., "download_url_md": ..., "markdown_report": ... }
     """
-    from llm_summary import developer_evaluate_job, generate_markdown_report
+    from llm_summary import generate_markdown_report
     import uuid
 
     data = request.get_json()
@@ -905,9 +1103,8 @@ def api_dev_eval():
         settings["system_prompt_mode"] = "Override"
 
     try:
-        rag_assistant = FlaskRAGAssistant(settings=settings)
-        answer, sources, _, evaluation, context = rag_assistant.generate_rag_response(query)
-        dev_eval = developer_evaluate_job(
+        answer, sources, _, evaluation, context = shared_assistant.generate_rag_response(query, settings)
+        dev_eval, dev_eval_error = _developer_evaluation(
             query=query,
             prompt=prompt,
             parameters=params,
@@ -920,7 +1117,8 @@ def api_dev_eval():
             "parameters": params,
             "result": answer,
             "sources": sources,
-            "developer_evaluation": dev_eval
+            "developer_evaluation": dev_eval,
+            "developer_evaluation_error": dev_eval_error
         }
         
         # Generate markdown report
@@ -952,6 +1150,7 @@ def api_dev_eval():
             "result": answer,
             "sources": sources,
             "developer_evaluation": dev_eval,
+            "developer_evaluation_error": dev_eval_error,
             "download_url_json": json_url,
             "download_url_md": md_url,
             "markdown_report": markdown_report
@@ -965,6 +1164,7 @@ def api_dev_eval():
 # Add these routes to your main.py file
 
 @app.route('/api/dev_eval', methods=['POST'])
+@admit("eval")
 def dev_eval():
     """Handle developer evaluation mode requests"""
     data = request.json
@@ -989,14 +1189,12 @@ def dev_eval():
         settings["system_prompt_mode"] = "Override"
     
     try:
-        assistant = FlaskRAGAssistant(settings=settings)
-        answer, sources, _, evaluation, context = assistant.generate_rag_response(query)
+        answer, sources, _, evaluation, context = shared_assistant.generate_rag_response(query, settings)
         
         # Try to get developer evaluation if llm_summary module is available
-        developer_evaluation = None
+        developer_evaluation = developer_evaluation_error = None
         try:
-            from llm_summary import developer_evaluate_job
-            developer_evaluation = developer_evaluate_job(
+            developer_evaluation, developer_evaluation_error = _developer_evaluation(
                 query=query,
                 prompt=prompt,
                 parameters=parameters,
@@ -1020,7 +1218,8 @@ def dev_eval():
             "parameters": parameters,
             "result": answer,
             "sources": sources,
-            "developer_evaluation": developer_evaluation
+            "developer_evaluation": developer_evaluation,
+            "developer_evaluation_error": developer_evaluation_error
         }
         
         with open(json_file, 'w', encoding='utf-8') as f:
@@ -1045,12 +1244,15 @@ def dev_eval():
                 f.write("\n")
             if developer_evaluation:
                 f.write(f"## Developer Evaluation\n\n{developer_evaluation}\n\n")
+            elif developer_evaluation_error:
+                f.write(f"## Developer Evaluation\n\nFailed: {developer_evaluation_error}\n\n")
         
         # Return response
         return jsonify({
             "result": answer,
             "sources": sources,
             "developer_evaluation": developer_evaluation,
+            "developer_evaluation_error": developer_evaluation_error,
             "download_url_json": f"/static/dev_eval_reports/dev_eval_{eval_id}.json",
             "download_url_md": f"/static/dev_eval_reports/dev_eval_{eval_id}.md",
             "markdown_report": open(md_file, 'r', encoding='utf-8').read()
@@ -1062,6 +1264,8 @@ def dev_eval():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/dev_eval_batch', methods=['POST'])
+@admit("eval")
+@lane("batch")
 def dev_eval_batch():
     """Handle batch evaluation mode requests"""
     data = request.json
@@ -1075,11 +1279,14 @@ def dev_eval_batch():
     # Log the request
     logger.info(f"Batch evaluation request: query={query}, prompt={prompt}, parameters={parameters}, runs={runs}")
     
-    # Use your existing RAG assistant
+    # Use your existing RAG assistant; every run must reach the model, so
+    # answer caches are bypassed to keep run-to-run variance visible
     settings = {
         "temperature": parameters.get('temperature', 0.3),
         "top_p": parameters.get('top_p', 1.0),
-        "max_tokens": parameters.get('max_tokens', 1000)
+        "max_tokens": parameters.get('max_tokens', 1000),
+        "semantic_cache": False,
+        "response_cache": False
     }
     
     if prompt:
@@ -1088,17 +1295,17 @@ def dev_eval_batch():
     
     try:
         results = []
-        assistant = FlaskRAGAssistant(settings=settings)
         
         for i in range(runs):
             try:
-                answer, sources, _, evaluation, context = assistant.generate_rag_response(query)
+                result = shared_assistant.generate_rag_result(query, settings)
                 results.append({
                     "run": i+1,
-                    "answer": answer,
-                    "sources": sources,
-                    "evaluation": evaluation,
-                    "context": context
+                    "answer": result["answer"],
+                    "sources": result["sources"],
+                    "evaluation": result["evaluation"],
+                    "context": result["context"],
+                    "metadata": result["metadata"]
                 })
             except Exception as e:
                 logger.error(f"Error on run {i+1}: {str(e)}")
@@ -1186,6 +1393,8 @@ def dev_eval_batch():
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/dev_eval_compare", methods=["POST"])
+@admit("eval")
+@lane("batch")
 def api_dev_eval_compare():
     """
     Developer Evaluation Compare API endpoint.
@@ -1212,7 +1421,7 @@ def api_dev_eval_compare():
         "llm_analysis": "..." (if requested)
     }
     """
-    from llm_summary import developer_evaluate_job, generate_markdown_report
+    from llm_summary import generate_markdown_report
     import uuid
 
     data = request.get_json()
@@ -1247,20 +1456,23 @@ def api_dev_eval_compare():
             settings1 = {
                 "temperature": temperature1,
                 "top_p": top_p1,
-                "max_tokens": max_tokens1
+                "max_tokens": max_tokens1,
+                # each run must reach the model
+                "semantic_cache": False,
+                "response_cache": False
             }
             if prompt1:
                 settings1["system_prompt"] = prompt1
                 settings1["system_prompt_mode"] = "Override"
             
-            rag_assistant1 = FlaskRAGAssistant(settings=settings1)
-            answer1, sources1, _, evaluation1, context1 = rag_assistant1.generate_rag_response(query)
+            result1 = shared_assistant.generate_rag_result(query, settings1)
             
             batch1_results.append({
                 "run": i+1,
-                "answer": answer1,
-                "sources": sources1,
-                "evaluation": evaluation1
+                "answer": result1["answer"],
+                "sources": result1["sources"],
+                "evaluation": result1["evaluation"],
+                "metadata": result1["metadata"]
             })
         
         # Process batch 2
@@ -1269,24 +1481,27 @@ def api_dev_eval_compare():
             settings2 = {
                 "temperature": temperature2,
                 "top_p": top_p2,
-                "max_tokens": max_tokens2
+                "max_tokens": max_tokens2,
+                # each run must reach the model
+                "semantic_cache": False,
+                "response_cache": False
             }
             if prompt2:
                 settings2["system_prompt"] = prompt2
                 settings2["system_prompt_mode"] = "Override"
             
-            rag_assistant2 = FlaskRAGAssistant(settings=settings2)
-            answer2, sources2, _, evaluation2, context2 = rag_assistant2.generate_rag_response(query)
+            result2 = shared_assistant.generate_rag_result(query, settings2)
             
             batch2_results.append({
                 "run": i+1,
-                "answer": answer2,
-                "sources": sources2,
-                "evaluation": evaluation2
+                "answer": result2["answer"],
+                "sources": result2["sources"],
+                "evaluation": result2["evaluation"],
+                "metadata": result2["metadata"]
             })
         
         # Generate developer evaluation for the comparison
-        dev_eval = developer_evaluate_job(
+        dev_eval, dev_eval_error = _developer_evaluation(
             query=query,
             prompt=f"Batch 1: {prompt1}\nBatch 2: {prompt2}",
             parameters={
@@ -1386,6 +1601,7 @@ def api_dev_eval_compare():
                 "results": batch2_results
             },
             "developer_evaluation": dev_eval,
+            "developer_evaluation_error": dev_eval_error,
             "llm_analysis": llm_analysis
         }
         
@@ -1422,6 +1638,7 @@ def api_dev_eval_compare():
             "batch1_results": batch1_results,
             "batch2_results": batch2_results,
             "developer_evaluation": dev_eval,
+            "developer_evaluation_error": dev_eval_error,
             "download_url_json": json_url,
             "download_url_md": md_url,
             "markdown_report": markdown_report
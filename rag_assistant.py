@@ -1,17 +1,37 @@
 """
 Flask-compatible version of the RAG assistant without Streamlit dependencies
 """
+import copy
+import hashlib
+import json
 import logging
-from typing import List, Dict, Tuple, Optional, Any, Generator, Union
+import time
+import threading
+from typing import List, Dict, Tuple, Optional, Any, Callable, Generator, Union
 import traceback
+import numpy as np
 from openai import AzureOpenAI
-from azure.search.documents import SearchClient
 from azure.search.documents.models import VectorizedQuery
-from azure.core.credentials import AzureKeyCredential
 import re
+import sqlite3
 import sys
 import os
 
+from clients import get_openai_client, get_search_client
+from cache import get_cache, normalize_text
+from embedding_store import get_embedding_store
+from embedding_batcher import get_embedding_batcher
+from semantic_cache import SemanticCache, scope_key
+from rerank import rerank
+from dedup import dedup
+from compression import compress, split_sentences
+from token_utils import MESSAGE_TOKEN_OVERHEAD, count_tokens, truncate_to_tokens, tokenizer_name
+from resilience import dependency, client_retry_after
+from rate_governor import get_governor, estimate_chat_tokens, estimate_embedding_tokens
+from scheduler import scheduler
+from streaming import record_stream
+from citations import CitationRewriter, cite_sources
+
 # Import config but handle the case where it might import streamlit
 try:
     from config import (
@@ -24,6 +44,26 @@ try:
         SEARCH_INDEX,
         SEARCH_KEY,
         VECTOR_FIELD,
+        EMBEDDING_CACHE_BACKEND,
+        EMBEDDING_CACHE_SIZE,
+        EMBEDDING_CACHE_TTL,
+        EMBEDDING_BATCH_MAX_INPUTS,
+        EMBEDDING_BATCH_MAX_TOKENS,
+        RETRIEVAL_CACHE_BACKEND,
+        RETRIEVAL_CACHE_SIZE,
+        RETRIEVAL_CACHE_TTL,
+        RESPONSE_CACHE_BACKEND,
+        RESPONSE_CACHE_SIZE,
+        RESPONSE_CACHE_TTL,
+        RESPONSE_CACHE_DETERMINISTIC_ONLY,
+        RERANK_MODE,
+        RERANK_CANDIDATES,
+        RERANK_TOP_K,
+        CONTEXT_TOKEN_BUDGET,
+        CONTEXT_MIN_CHUNK_TOKENS,
+        DEDUP_ENABLED,
+        COMPRESSION_ENABLED,
+        STREAM_DEADLINE,
     )
 except ImportError as e:
     if 'streamlit' in str(e):
@@ -37,11 +77,83 @@ except ImportError as e:
         SEARCH_INDEX = os.environ.get("SEARCH_INDEX")
         SEARCH_KEY = os.environ.get("SEARCH_KEY")
         VECTOR_FIELD = os.environ.get("VECTOR_FIELD")
+        EMBEDDING_CACHE_BACKEND = os.environ.get("EMBEDDING_CACHE_BACKEND", os.environ.get("CACHE_BACKEND", "memory"))
+        EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096"))
+        EMBEDDING_CACHE_TTL = float(os.environ.get("EMBEDDING_CACHE_TTL", "86400"))
+        EMBEDDING_BATCH_MAX_INPUTS = int(os.environ.get("EMBEDDING_BATCH_MAX_INPUTS", "256"))
+        EMBEDDING_BATCH_MAX_TOKENS = int(os.environ.get("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+        RETRIEVAL_CACHE_BACKEND = os.environ.get("RETRIEVAL_CACHE_BACKEND", os.environ.get("CACHE_BACKEND", "memory"))
+        RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "1024"))
+        RETRIEVAL_CACHE_TTL = float(os.environ.get("RETRIEVAL_CACHE_TTL", "600"))
+        RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", os.environ.get("CACHE_BACKEND", "memory"))
+        RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "2048"))
+        RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+        RESPONSE_CACHE_DETERMINISTIC_ONLY = os.environ.get("RESPONSE_CACHE_DETERMINISTIC_ONLY", "true").lower() in ("1", "true", "yes")
+        RERANK_MODE = os.environ.get("RERANK_MODE", "off").lower()
+        RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "30"))
+        RERANK_TOP_K = int(os.environ.get("RERANK_TOP_K", "5"))
+        CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "6000"))
+        CONTEXT_MIN_CHUNK_TOKENS = int(os.environ.get("CONTEXT_MIN_CHUNK_TOKENS", "64"))
+        DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+        COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "false").lower() in ("1", "true", "yes")
+        STREAM_DEADLINE = float(os.environ.get("STREAM_DEADLINE", "120"))
     else:
         raise
 
 logger = logging.getLogger(__name__)
 
+# Cache namespaces (backend per namespace, see cache.py)
+# "<deployment>:<sha1 of normalized text>" -> vector
+embedding_cache = get_cache(
+    "embeddings", EMBEDDING_CACHE_BACKEND, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL,
+    serializer="float32",
+)
+# "<index>:<sha1 of (normalized query, top, fields)>" -> [results, created_at]
+retrieval_cache = get_cache(
+    "retrieval", RETRIEVAL_CACHE_BACKEND, RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL
+)
+
+
+# Answers to near-duplicate questions, scoped by prompt/model/sampling settings
+semantic_cache = SemanticCache()
+
+# Exact-match answers keyed on a hash of the full chat completion request
+response_cache = get_cache(
+    "responses", RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+)
+
+
+def _hash_key(*parts: Any) -> str:
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def invalidate_retrieval_cache(index: Optional[str] = None) -> Optional[int]:
+    """
+    Drop cached search results, e.g. after an index rebuild.
+
+    With ``index`` only that index's entries are dropped. Returns the number
+    of entries removed, or None when the cache backend failed.
+    """
+    if index is None:
+        count = retrieval_cache.clear()
+    else:
+        count = retrieval_cache.delete_prefix(f"{index}:")
+    if count is not None:
+        logger.info("Invalidated %d retrieval cache entries (index=%s)", count, index or "*")
+    return count
+
+
+def invalidate_semantic_cache(index: Optional[str] = None) -> int:
+    """
+    Drop cached answers, e.g. after an index rebuild: they were built from
+    the old index. With ``index`` only answers from that index are dropped.
+    Returns the number of answers removed (this process only; the semantic
+    cache lives in each worker's memory).
+    """
+    count = semantic_cache.clear(None if index is None else f"{index}:")
+    logger.info("Invalidated %d semantic cache entries (index=%s)", count, index or "*")
+    return count
+
 
 class FactCheckerStub:
     """No-op evaluator so we still return a dict in the tuple."""
@@ -93,23 +205,43 @@ class FlaskRAGAssistant:
     </user_query>
     """
 
+    # Request settings that map onto per-call model/search parameters
+    SETTING_KEYS = {
+        "model": "deployment_name",
+        "temperature": "temperature",
+        "top_p": "top_p",
+        "max_tokens": "max_tokens",
+        "search_index": "search_index",
+        "rerank": "rerank_mode",
+        "rerank_top_k": "rerank_top_k",
+        "context_token_budget": "context_token_budget",
+        "deadline": "stream_deadline",
+    }
+
+    # Hybrid search shape; part of the retrieval cache key
+    SEARCH_TOP = 10
+    SEARCH_FIELDS = ["chunk", "title"]
+
     # ───────────────────────── setup ─────────────────────────
     def __init__(self, settings=None) -> None:
         self._init_cfg()
-        self.openai_client = AzureOpenAI(
-            azure_endpoint=self.openai_endpoint,
-            api_key=self.openai_key,
-            api_version=self.openai_api_version or "2023-05-15",
-        )
         self.fact_checker = FactCheckerStub()
-        
+
         # Model parameters with defaults
         self.temperature = 0.3
         self.top_p = 1.0
         self.max_tokens = 1000
         self.presence_penalty = 0.6
         self.frequency_penalty = 0.6
-        
+
+        # Local rerank stage (see rerank.py)
+        self.rerank_mode = RERANK_MODE
+        self.rerank_top_k = RERANK_TOP_K
+        self.context_token_budget = CONTEXT_TOKEN_BUDGET
+
+        # Seconds a streamed answer may run; 0 disables
+        self.stream_deadline = STREAM_DEADLINE
+
         # Load settings if provided
         self.settings = settings or {}
         self._load_settings()
@@ -124,405 +256,997 @@ class FlaskRAGAssistant:
         self.search_index         = SEARCH_INDEX
         self.search_key           = SEARCH_KEY
         self.vector_field         = VECTOR_FIELD
-        
+
     def _load_settings(self) -> None:
         """Load settings from provided settings dict"""
-        settings = self.settings
-        
-        # Update model parameters
-        if "model" in settings:
-            self.deployment_name = settings["model"]
-        if "temperature" in settings:
-            self.temperature = settings["temperature"]
-        if "top_p" in settings:
-            self.top_p = settings["top_p"]
-        if "max_tokens" in settings:
-            self.max_tokens = settings["max_tokens"]
-        
-        # Update search configuration
-        if "search_index" in settings:
-            self.search_index = settings["search_index"]
+        for key, attr in self.SETTING_KEYS.items():
+            if key in self.settings:
+                setattr(self, attr, self.settings[key])
+
+    @property
+    def openai_client(self) -> AzureOpenAI:
+        """Process-wide AzureOpenAI client with pooled keep-alive connections."""
+        return get_openai_client(
+            self.openai_endpoint,
+            self.openai_key,
+            self.openai_api_version or "2023-05-15",
+        )
+
+    def resolve_settings(self, settings: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        Effective parameters for a single call.
+
+        Per-call ``settings`` are overlaid on the instance defaults without
+        mutating the instance, so one assistant can be shared across threads.
+        """
+        cfg = {
+            "settings":          self.settings,
+            "deployment_name":   self.deployment_name,
+            "temperature":       self.temperature,
+            "top_p":             self.top_p,
+            "max_tokens":        self.max_tokens,
+            "presence_penalty":  self.presence_penalty,
+            "frequency_penalty": self.frequency_penalty,
+            "search_index":      self.search_index,
+            "rerank_mode":       self.rerank_mode,
+            "rerank_top_k":      self.rerank_top_k,
+            "context_token_budget": self.context_token_budget,
+            "stream_deadline":   self.stream_deadline,
+        }
+        if settings:
+            cfg["settings"] = {**self.settings, **settings}
+            for key, attr in self.SETTING_KEYS.items():
+                if key in settings:
+                    cfg[attr] = settings[key]
+        return cfg
 
     # ───────────── embeddings ─────────────
-    def generate_embedding(self, text: str) -> Optional[List[float]]:
-        if not text:
+    def _cached_embedding(self, normalized: str, persistent: bool = True) -> Optional[List[float]]:
+        """Embedding cache first, then (for ``persistent`` texts) the on-disk store shared by all workers."""
+        key = f"{self.embedding_deployment}:{_hash_key(normalized)}"
+        cached = embedding_cache.get(key)
+        if cached is not None:
+            return np.asarray(cached, dtype=np.float32).tolist()
+        if not persistent:
             return None
         try:
-            resp = self.openai_client.embeddings.create(
-                model=self.embedding_deployment,
-                input=text.strip(),
-            )
-            return resp.data[0].embedding
-            
-        
-        except Exception as exc:
-            logger.error("Embedding error: %s", exc)
+            store = get_embedding_store(self.embedding_deployment)
+            # not copied into the LRU: the store exists so that every worker
+            # does not keep its own copy of the warmed vectors
+            return store.get(normalized) if store is not None else None
+        except (sqlite3.Error, OSError) as exc:
+            # a cache failure is a miss, never a failed request
+            logger.warning("Embedding store lookup failed: %s", exc)
+            return None
+
+    def _remember_embedding(self, normalized: str, embedding: List[float], persist: bool = True) -> None:
+        # float32 arrays: ~6 KB per 1536-d vector instead of ~49 KB as a tuple of floats
+        embedding_cache.set(
+            f"{self.embedding_deployment}:{_hash_key(normalized)}", np.asarray(embedding, dtype=np.float32)
+        )
+        if not persist:
+            return
+        try:
+            store = get_embedding_store(self.embedding_deployment)
+            if store is not None:
+                store.put(normalized, embedding)
+        except (sqlite3.Error, OSError) as exc:
+            logger.warning("Embedding store write skipped: %s", exc)
+
+    def _openai_call(self, deployment: str, tokens: int, fn: Callable, **kwargs: Any) -> Any:
+        """
+        One OpenAI request, with retries: each attempt waits for a slot in the
+        caller's lane (scheduler.py), then for a rate governor permit.
+        """
+        return dependency(f"openai:{deployment}").call(
+            scheduler.run, get_governor(deployment).run, tokens, fn, **kwargs
+        )
+
+    def _chat_completion(self, messages: List[Dict[str, str]], cfg: Dict[str, Any], stream: bool = False) -> Any:
+        return self._openai_call(
+            cfg["deployment_name"],
+            estimate_chat_tokens(messages, cfg["max_tokens"]),
+            self.openai_client.chat.completions.create,
+            messages=messages,
+            stream=stream,
+            **self._completion_params(cfg),
+        )
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """One embeddings API call; vectors are returned in input order."""
+        resp = self._openai_call(
+            self.embedding_deployment,
+            estimate_embedding_tokens(texts),
+            self.openai_client.embeddings.create,
+            model=self.embedding_deployment,
+            input=texts,
+        )
+        return [item.embedding for item in sorted(resp.data, key=lambda d: d.index)]
+
+    def generate_embedding(self, text: str, use_cache: bool = True) -> Optional[List[float]]:
+        """
+        Embed ``text``. Repeated texts are served from the in-process cache,
+        then from the on-disk store shared by all workers; pass
+        ``use_cache=False`` (or the ``embedding_cache: false`` request
+        setting) to always call the API. API errors that outlast the retries
+        are raised.
+        """
+        if not text:
             return None
+        normalized = normalize_text(text)
+        if use_cache:
+            cached = self._cached_embedding(normalized)
+            if cached is not None:
+                return cached
+        # concurrent requests within the batching window share one API call
+        batcher = get_embedding_batcher(self.embedding_deployment, self._embed_batch)
+        if batcher is not None:
+            embedding = batcher.embed(normalized)
+        else:
+            embedding = self._embed_batch([normalized])[0]
+        if use_cache:
+            self._remember_embedding(normalized, embedding)
+        return embedding
+
+    def generate_embeddings(
+        self, texts: List[str], use_cache: bool = True, persist: bool = True, refresh: bool = False
+    ) -> List[Optional[List[float]]]:
+        """
+        Embed many texts in as few API calls as possible.
+
+        Identical texts (after normalization) are embedded once, cached texts
+        are not sent at all, and the rest are packed into requests of at most
+        EMBEDDING_BATCH_MAX_INPUTS inputs / EMBEDDING_BATCH_MAX_TOKENS
+        estimated tokens. The result is aligned with ``texts``; empty texts
+        map to None. With ``persist=False`` (chunks and sentences) only the
+        bounded in-process cache is used, never the on-disk store, which is
+        kept for query vectors. ``refresh=True`` skips the cache lookups but
+        still writes the new vectors to the caches.
+        """
+        normalized = [normalize_text(t) if t else "" for t in texts]
+        vectors: Dict[str, Optional[List[float]]] = {}
+        pending: List[str] = []
+        for text in normalized:
+            if not text or text in vectors:
+                continue
+            vectors[text] = self._cached_embedding(text, persist) if use_cache and not refresh else None
+            if vectors[text] is None:
+                pending.append(text)
+
+        for batch in self._embedding_batches(pending):
+            try:
+                for text, embedding in zip(batch, self._embed_batch(batch)):
+                    vectors[text] = embedding
+                    if use_cache:
+                        self._remember_embedding(text, embedding, persist)
+            except Exception as exc:
+                logger.error("Batch embedding error (%d inputs): %s", len(batch), exc)
+
+        return [vectors.get(text) if text else None for text in normalized]
+
+    @staticmethod
+    def _embedding_batches(texts: List[str]) -> Generator[List[str], None, None]:
+        batch: List[str] = []
+        batch_tokens = 0
+        for text in texts:
+            tokens = len(text) // 4 + 1
+            if batch and (len(batch) >= EMBEDDING_BATCH_MAX_INPUTS
+                          or batch_tokens + tokens > EMBEDDING_BATCH_MAX_TOKENS):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch
 
     @staticmethod
     def cosine_similarity(a: List[float], b: List[float]) -> float:
-        dot = sum(x * y for x, y in zip(a, b))
-        mag = (sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5)
-        return 0.0 if mag == 0 else dot / mag
+        va = np.asarray(a, dtype=np.float32)
+        vb = np.asarray(b, dtype=np.float32)
+        mag = float(np.linalg.norm(va) * np.linalg.norm(vb))
+        return 0.0 if mag == 0 else float(va @ vb) / mag
+
+    # ───────────── semantic answer cache ─────────────
+    def _semantic_scope(self, cfg: Dict[str, Any]) -> str:
+        """Everything besides the question that an answer depends on, prefixed with the index."""
+        settings = cfg["settings"]
+        return f"{cfg['search_index']}:" + scope_key({
+            "system_prompt":      settings.get("system_prompt", ""),
+            "system_prompt_mode": settings.get("system_prompt_mode", "Append"),
+            "custom_prompt":      settings.get("custom_prompt", ""),
+            "search_index":       cfg["search_index"],
+            "rerank_mode":        cfg["rerank_mode"],
+            "rerank_top_k":       cfg["rerank_top_k"],
+            "context_token_budget": cfg["context_token_budget"],
+            "dedup":              settings.get("dedup", True),
+            "compression":        settings.get("compression", COMPRESSION_ENABLED),
+            **self._completion_params(cfg),
+        })
+
+    def _semantic_lookup(
+        self, query: str, cfg: Dict[str, Any], metadata: Dict[str, Any]
+    ) -> Tuple[Optional[List[float]], Optional[Dict[str, Any]]]:
+        """
+        Embed the query and look for a stored answer to a near-duplicate.
+        Returns (query vector, hit); both are None when the cache is off or
+        bypassed with the ``semantic_cache: false`` request setting.
+        """
+        if not self._semantic_enabled(cfg, metadata):
+            return None, None
+        q_vec = self.generate_embedding(
+            query, use_cache=cfg["settings"].get("embedding_cache", True)
+        )
+        return q_vec, self._semantic_match(query, cfg, q_vec, metadata)
+
+    @staticmethod
+    def _semantic_enabled(cfg: Dict[str, Any], metadata: Dict[str, Any]) -> bool:
+        if not (semantic_cache.enabled and cfg["settings"].get("semantic_cache", True)):
+            metadata["semantic_cache"] = {"status": "bypass"}
+            return False
+        return True
+
+    def _semantic_match(
+        self, query: str, cfg: Dict[str, Any], q_vec: Optional[List[float]], metadata: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        hit = semantic_cache.lookup(self._semantic_scope(cfg), q_vec) if q_vec else None
+        if hit is None:
+            metadata["semantic_cache"] = {"status": "miss"}
+            return None
+        logger.info("Semantic cache hit (%.4f) for %r via %r", hit["similarity"], query, hit["query"])
+        metadata["semantic_cache"] = {
+            "status": "hit",
+            "similarity": hit["similarity"],
+            "matched_query": hit["query"],
+        }
+        return hit
+
+    def _semantic_store(
+        self, q_vec: Optional[List[float]], cfg: Dict[str, Any],
+        query: str, answer: str, sources: List[Dict], context: str
+    ) -> None:
+        if q_vec:
+            semantic_cache.store(self._semantic_scope(cfg), q_vec, {
+                "query": query,
+                "answer": answer,
+                "sources": copy.deepcopy(sources),
+                "context": context,
+            })
 
     # ───────────── Azure Search ───────────
-    def search_knowledge_base(self, query: str) -> List[Dict]:
-        try:
-            client = SearchClient(
-                endpoint=f"https://{self.search_endpoint}.search.windows.net",
-                index_name=self.search_index,
-                credential=AzureKeyCredential(self.search_key),
+    def search_knowledge_base(self, query: str, settings: Optional[Dict] = None) -> List[Dict]:
+        results, _ = self._retrieve(query, settings)
+        return results
+
+    def _retrieve(
+        self, query: str, settings: Optional[Dict] = None, q_vec: Optional[List[float]] = None
+    ) -> Tuple[List[Dict], Dict[str, Any]]:
+        """
+        Hybrid search behind the retrieval cache, then the local rerank stage.
+
+        Returns the results plus retrieval metadata (index, cache status and
+        age, rerank) for the response. The ``retrieval_cache: false`` request
+        setting bypasses the cache. ``q_vec`` skips embedding the query again.
+        Embedding and search errors that outlast the retries are raised.
+        """
+        cfg = self.resolve_settings(settings)
+        key, top, meta = self._retrieval_plan(query, cfg)
+        results = self._cached_results(key, cfg, meta)
+        if results is None:
+            client = get_search_client(
+                self.search_endpoint, cfg["search_index"], self.search_key
             )
-            q_vec = self.generate_embedding(query)
+            if q_vec is None:
+                q_vec = self.generate_embedding(
+                    query, use_cache=cfg["settings"].get("embedding_cache", True)
+                )
             if not q_vec:
-                return []
+                return [], meta
+            kwargs = self._search_kwargs(query, q_vec, top)
+            # results are paged lazily, so the request happens while reading them
+            results = dependency("search").call(lambda: self._hit_dicts(client.search(**kwargs)))
+            self._store_results(key, results, cfg, meta)
+
+        meta["results"] = len(results)
+        if cfg["rerank_mode"] != "off" and results:
+            results = self._rerank(query, results, cfg, q_vec, meta)
+        return results, meta
+
+    def _retrieval_plan(self, query: str, cfg: Dict[str, Any]) -> Tuple[str, int, Dict[str, Any]]:
+        """Cache key, number of hits to fetch and initial metadata."""
+        # over-fetch candidates when reranking locally
+        top = self.SEARCH_TOP if cfg["rerank_mode"] == "off" else max(self.SEARCH_TOP, RERANK_CANDIDATES)
+        key = f"{cfg['search_index']}:" + _hash_key(normalize_text(query), top, self.SEARCH_FIELDS)
+        return key, top, {"index": cfg["search_index"], "cache": "bypass"}
+
+    @staticmethod
+    def _cached_results(key: str, cfg: Dict[str, Any], meta: Dict[str, Any]) -> Optional[List[Dict]]:
+        if not cfg["settings"].get("retrieval_cache", True):
+            return None
+        cached = retrieval_cache.get(key)
+        if cached is None:
+            meta["cache"] = "miss"
+            return None
+        results, created_at = cached
+        meta.update(cache="hit", age_seconds=round(time.time() - created_at, 1))
+        return copy.deepcopy(results)
 
-            vec_q = VectorizedQuery(
+    @staticmethod
+    def _store_results(key: str, results: List[Dict], cfg: Dict[str, Any], meta: Dict[str, Any]) -> None:
+        meta["age_seconds"] = 0.0
+        if results and cfg["settings"].get("retrieval_cache", True):
+            retrieval_cache.set(key, [copy.deepcopy(results), time.time()])
+
+    def _search_kwargs(self, query: str, q_vec: List[float], top: int) -> Dict[str, Any]:
+        return {
+            "search_text": query,
+            "vector_queries": [VectorizedQuery(
                 vector=q_vec,
-                k_nearest_neighbors=10,
+                k_nearest_neighbors=top,
                 fields=self.vector_field,
+            )],
+            "select": self.SEARCH_FIELDS,
+            "top": top,
+        }
+
+    @staticmethod
+    def _hit_dicts(hits) -> List[Dict]:
+        return [
+            {
+                "chunk": r.get("chunk", ""),
+                "title": r.get("title", "Untitled"),
+                "relevance": r.get("@search.score") or 0.0,
+            }
+            for r in hits
+        ]
+
+    def _rerank(
+        self, query: str, results: List[Dict], cfg: Dict[str, Any],
+        q_vec: Optional[List[float]], meta: Dict[str, Any]
+    ) -> List[Dict]:
+        """Reorder over-fetched candidates locally and keep ``rerank_top_k``."""
+        start = time.perf_counter()
+        doc_vecs = None
+        if cfg["rerank_mode"] in ("mmr", "both"):
+            # chunk vectors come through the in-process embedding cache, so
+            # repeat candidates cost no API calls; they are not persisted
+            use_cache = cfg["settings"].get("embedding_cache", True)
+            if q_vec is None:
+                q_vec = self.generate_embedding(query, use_cache=use_cache)
+            doc_vecs = self.generate_embeddings(
+                [r["chunk"] for r in results], use_cache=use_cache, persist=False
             )
-            results = client.search(
-                search_text=query,
-                vector_queries=[vec_q],
-                select=["chunk", "title"],
-                top=10,
-            )
-            return [
-                {
-                    "chunk": r.get("chunk", ""),
-                    "title": r.get("title", "Untitled"),
-                    "relevance": 1.0,
-                }
-                for r in results
-            ]
+        return self._apply_rerank(query, results, cfg, q_vec, doc_vecs, meta, start)
+
+    @staticmethod
+    def _apply_rerank(
+        query: str, results: List[Dict], cfg: Dict[str, Any], q_vec: Optional[List[float]],
+        doc_vecs: Optional[List[Optional[List[float]]]], meta: Dict[str, Any], start: float
+    ) -> List[Dict]:
+        mode, k = cfg["rerank_mode"], int(cfg["rerank_top_k"])
+        if not q_vec or doc_vecs is None or any(v is None for v in doc_vecs):
+            doc_vecs = None
+        try:
+            ranked = rerank(query, results, mode, k, q_vec, doc_vecs)
         except Exception as exc:
-            logger.error("Search error: %s", exc)
-            return []
+            logger.error("Rerank error: %s", exc)
+            ranked = results[:k]
+        meta["rerank"] = {
+            "mode": mode,
+            "candidates": len(results),
+            "kept": len(ranked),
+            "vectors": doc_vecs is not None,
+            "ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+        return ranked
 
     # ───────── context & citations ────────
-    def _prepare_context(self, results: List[Dict]) -> Tuple[str, Dict]:
+    def _prepare_context(
+        self, results: List[Dict], limit: int = 5, budget: Optional[int] = None
+    ) -> Tuple[str, Dict, Dict[str, Any]]:
+        """
+        Number the top ``limit`` chunks as <source> entries.
+
+        With a token ``budget`` the chunks are packed in rank order: a chunk
+        that does not fit is trimmed to the remaining budget, or dropped when
+        less than CONTEXT_MIN_CHUNK_TOKENS would be left of it. Returns the
+        context, the source map and packing stats.
+        """
         entries, src_map = [], {}
+        stats: Dict[str, Any] = {"chunks": 0, "trimmed": 0, "dropped": 0, "context_tokens": 0}
+        remaining = budget
         sid = 1
-        for res in results[:5]:
+        for res in results[:limit]:
             chunk = res["chunk"].strip()
             if not chunk:
                 continue
+            if remaining is not None:
+                wrapper = count_tokens(f'<source id="{sid}"></source>\n\n')
+                tokens = count_tokens(chunk)
+                if wrapper + tokens > remaining:
+                    room = remaining - wrapper
+                    if room < CONTEXT_MIN_CHUNK_TOKENS:
+                        stats["dropped"] += 1
+                        continue
+                    chunk = truncate_to_tokens(chunk, room)
+                    tokens = count_tokens(chunk)
+                    stats["trimmed"] += 1
+                remaining -= wrapper + tokens
+                stats["context_tokens"] += wrapper + tokens
             entries.append(f'<source id="{sid}">{chunk}</source>')
             src_map[str(sid)] = {
                 "title":    res["title"],
                 "content":  chunk
             }
+            if res.get("merged_titles"):
+                src_map[str(sid)]["merged_titles"] = res["merged_titles"]
             sid += 1
-        return "\n\n".join(entries), src_map
+        stats["chunks"] = len(entries)
+        return "\n\n".join(entries), src_map, stats
 
-    def _chat_answer(self, query: str, context: str, src_map: Dict) -> str:
-        # Get system prompt from settings if available
-        system_prompt = self.DEFAULT_SYSTEM_PROMPT
-        
-        # Check if custom system prompt is available in settings
-        settings = self.settings
+    def _pack_context(
+        self, query: str, results: List[Dict], cfg: Dict[str, Any]
+    ) -> Tuple[str, Dict, Dict[str, Any]]:
+        """
+        Collapse near-duplicate chunks, optionally compress the top ones to
+        their query-relevant sentences, then fit them into what the prompt
+        budget leaves after the system prompt and query. The ``dedup`` and
+        ``compression`` request settings toggle those stages.
+        """
+        results, removed = self._dedup(results, cfg)
+        compression = None
+        if cfg["settings"].get("compression", COMPRESSION_ENABLED):
+            results, compression = self._compress(query, results[:int(cfg["rerank_top_k"])], cfg)
+        return self._fit_context(query, results, cfg, removed, compression)
+
+    @staticmethod
+    def _dedup(results: List[Dict], cfg: Dict[str, Any]) -> Tuple[List[Dict], int]:
+        if DEDUP_ENABLED and cfg["settings"].get("dedup", True):
+            return dedup(results)
+        return results, 0
+
+    def _fit_context(
+        self, query: str, results: List[Dict], cfg: Dict[str, Any],
+        removed: int, compression: Optional[Dict[str, Any]]
+    ) -> Tuple[str, Dict, Dict[str, Any]]:
+        limit = int(cfg["rerank_top_k"])
+        total = int(cfg["context_token_budget"] or 0)
+        if total <= 0:
+            context, src_map, stats = self._prepare_context(results, limit)
+            stats.update(context_tokens=count_tokens(context), duplicates_removed=removed)
+            if compression:
+                stats["compression"] = compression
+            return context, src_map, stats
+
+        system_prompt, user_query = self._prompt_parts(query, cfg)
+        overhead = (
+            count_tokens(system_prompt)
+            + count_tokens(self._user_content("", user_query))
+            + 2 * MESSAGE_TOKEN_OVERHEAD
+        )
+        budget = total - overhead
+        # room for the top chunk, trimmed; below that nothing would be sent
+        floor = count_tokens('<source id="1"></source>\n\n') + CONTEXT_MIN_CHUNK_TOKENS
+        if budget < floor:
+            logger.warning(
+                "Prompt overhead of %d tokens leaves %d of the %d-token context budget; "
+                "sending only the top chunk, trimmed to fit %d tokens",
+                overhead, max(budget, 0), total, floor,
+            )
+            budget = floor
+        context, src_map, stats = self._prepare_context(results, limit, budget)
+        if compression:
+            stats["compression"] = compression
+        stats.update(
+            duplicates_removed=removed,
+            budget=total,
+            prompt_overhead_tokens=overhead,
+            prompt_tokens=overhead + stats["context_tokens"],
+            tokenizer=tokenizer_name(),
+        )
+        if stats["trimmed"] or stats["dropped"] or removed:
+            logger.info("Packed context: %s", stats)
+        return context, src_map, stats
+
+    def _compress(
+        self, query: str, results: List[Dict], cfg: Dict[str, Any]
+    ) -> Tuple[List[Dict], Optional[Dict[str, Any]]]:
+        """Keep the sentences of each chunk closest to the query (see compression.py)."""
+        start = time.perf_counter()
+        use_cache = cfg["settings"].get("embedding_cache", True)
+        split = [split_sentences(r["chunk"]) for r in results]
+        sentences = [s for chunk in split for s in chunk]
+        if not sentences:
+            return results, None
+        try:
+            q_vec = self.generate_embedding(query, use_cache=use_cache)
+            vectors = self.generate_embeddings(sentences, use_cache=use_cache, persist=False)
+        except Exception as exc:
+            logger.error("Compression error: %s", exc)
+            return results, None
+        return self._apply_compression(results, split, q_vec, vectors, start)
+
+    @staticmethod
+    def _apply_compression(
+        results: List[Dict], split: List[List[str]], q_vec: Optional[List[float]],
+        vectors: List[Optional[List[float]]], start: float
+    ) -> Tuple[List[Dict], Optional[Dict[str, Any]]]:
+        if not q_vec or any(v is None for v in vectors):
+            return results, None
+        try:
+            results, stats = compress(results, split, q_vec, vectors)
+        except Exception as exc:
+            logger.error("Compression error: %s", exc)
+            return results, None
+        stats["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return results, stats
+
+    def _prompt_parts(self, query: str, cfg: Dict[str, Any]) -> Tuple[str, str]:
+        """System prompt and user query after custom prompt and Override/Append handling."""
+        settings = cfg["settings"]
         custom_prompt = settings.get("custom_prompt", "")
         system_prompt_override = settings.get("system_prompt", "")
         system_prompt_mode = settings.get("system_prompt_mode", "Append")
-        
-        # Apply custom prompt to query if available
+
         if custom_prompt:
             query = f"{custom_prompt}\n\n{query}"
-            logger.info(f"DEBUG - Applied custom prompt to query: {custom_prompt[:100]}...")
-        
-        # Apply system prompt based on mode
+        system_prompt = self.DEFAULT_SYSTEM_PROMPT
         if system_prompt_override:
             if system_prompt_mode == "Override":
                 system_prompt = system_prompt_override
-                logger.info(f"OVERRIDE MODE ACTIVE - Using override prompt: {system_prompt[:100]}...")
             else:  # Append
                 # Prepend custom prompt to give it priority over default
                 system_prompt = f"{system_prompt_override}\n\n{self.DEFAULT_SYSTEM_PROMPT}"
+        return system_prompt.strip(), query
+
+    @staticmethod
+    def _user_content(context: str, query: str) -> str:
+        return f"<context>\n{context}\n</context>\n<user_query>\n{query}\n</user_query>"
+
+    def _build_messages(self, query: str, context: str, cfg: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Apply custom prompt and Override/Append system prompt handling."""
+        settings = cfg["settings"]
+        custom_prompt = settings.get("custom_prompt", "")
+        system_prompt_override = settings.get("system_prompt", "")
+        system_prompt_mode = settings.get("system_prompt_mode", "Append")
+        processed_system_prompt, query = self._prompt_parts(query, cfg)
+
+        if custom_prompt:
+            logger.info(f"DEBUG - Applied custom prompt to query: {custom_prompt[:100]}...")
+        if system_prompt_override:
+            if system_prompt_mode == "Override":
+                logger.info(f"OVERRIDE MODE ACTIVE - Using override prompt: {processed_system_prompt[:100]}...")
+            else:
                 logger.info(f"APPEND MODE ACTIVE - Prepended custom prompt: {system_prompt_override[:100]}...")
         else:
             logger.info("No system_prompt_override provided in settings")
 
         # Prepare the actual content that will be sent
-        processed_system_prompt = system_prompt.strip()
-        processed_user_content = f"<context>\n{context}\n</context>\n<user_query>\n{query}\n</user_query>"
-        
+        processed_user_content = self._user_content(context, query)
+
         messages = [
             {"role": "system", "content": processed_system_prompt},
             {"role": "user", "content": processed_user_content}
         ]
-        
+
         # Log detailed payload information
         logger.info("========== OPENAI API REQUEST DETAILS ==========")
-        logger.info(f"Model deployment: {self.deployment_name}")
-        logger.info(f"Temperature: {self.temperature}")
-        logger.info(f"Max tokens: {self.max_tokens}")
-        logger.info(f"Top P: {self.top_p}")
-        logger.info(f"Presence penalty: {self.presence_penalty}")
-        logger.info(f"Frequency penalty: {self.frequency_penalty}")
-        
+        logger.info(f"Model deployment: {cfg['deployment_name']}")
+        logger.info(f"Temperature: {cfg['temperature']}")
+        logger.info(f"Max tokens: {cfg['max_tokens']}")
+        logger.info(f"Top P: {cfg['top_p']}")
+        logger.info(f"Presence penalty: {cfg['presence_penalty']}")
+        logger.info(f"Frequency penalty: {cfg['frequency_penalty']}")
+
         # Log the complete system prompt
         logger.info("========== SYSTEM PROMPT ==========")
         logger.info(processed_system_prompt)
-        
+
         # Log the user query with context
         logger.info("========== USER CONTENT ==========")
         logger.info(processed_user_content)
-        
+
         # Log the complete messages array for debugging
         logger.info("========== MESSAGES ARRAY ==========")
         for i, msg in enumerate(messages):
             logger.info(f"Message {i+1} - Role: {msg['role']}")
             logger.info(f"Content: {msg['content']}")
-        # Log the exact JSON payload sent to OpenAI
-        import json
-        payload = {
-            "model": self.deployment_name,
-            "messages÷": messages,
-            "max_tokens": self.max_tokens,
-            "temperature": self.temperature,
-            "top_p": self.top_p,
-            "presence_penalty": self.presence_penalty,
-            "frequency_penalty": self.frequency_penalty,
+        return messages
+
+    @staticmethod
+    def _completion_params(cfg: Dict[str, Any]) -> Dict[str, Any]:
+        """Sampling parameters sent with every chat completion."""
+        return {
+            "model": cfg["deployment_name"],
+            "max_tokens": cfg["max_tokens"],
+            "temperature": cfg["temperature"],
+            "top_p": cfg["top_p"],
+            "presence_penalty": cfg["presence_penalty"],
+            "frequency_penalty": cfg["frequency_penalty"],
         }
+
+    def _response_cache_key(self, messages: List[Dict[str, str]], cfg: Dict[str, Any]) -> Optional[str]:
+        """
+        Stable hash of the full effective request (final system prompt, user
+        content with context, sampling params), or None when the request must
+        not be cached: the ``response_cache: false`` setting, or a non-zero
+        temperature while RESPONSE_CACHE_DETERMINISTIC_ONLY is set.
+        """
+        if not cfg["settings"].get("response_cache", True) or not response_cache.enabled:
+            return None
+        try:
+            deterministic = float(cfg["temperature"]) == 0.0
+        except (TypeError, ValueError):
+            deterministic = False
+        if RESPONSE_CACHE_DETERMINISTIC_ONLY and not deterministic:
+            return None
+        payload = json.dumps({"messages": messages, **self._completion_params(cfg)}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _replay_chunks(answer: str, words: int = 3) -> Generator[str, None, None]:
+        """Split a cached answer into small pieces so it can be pseudo-streamed."""
+        pieces = re.findall(r"\s*\S+", answer)
+        for i in range(0, len(pieces), words):
+            yield "".join(pieces[i:i + words])
+        tail = answer[len(answer.rstrip()):]
+        if tail:
+            yield tail
+
+    @staticmethod
+    def _deadline(cfg: Dict[str, Any]) -> Optional[float]:
+        """Monotonic time by which a stream started now must stop, or None."""
+        try:
+            seconds = float(cfg["stream_deadline"] or 0)
+        except (TypeError, ValueError):
+            seconds = 0.0
+        return time.monotonic() + seconds if seconds > 0 else None
+
+    @staticmethod
+    def _stream_text(
+        stream: Any, cfg: Dict[str, Any], collected: List[str], deadline: Optional[float]
+    ) -> Generator[str, None, Optional[str]]:
+        """
+        Yield the text deltas of an upstream chat stream, appending them to
+        ``collected``. The upstream stream is closed as soon as the consumer
+        goes away (GeneratorExit on client disconnect) or ``deadline``
+        passes; returns "deadline" in that case, else None.
+
+        The deadline does not depend on the upstream sending text: a timer
+        closes the stream when it passes, which ends a read that is blocked
+        on a stalled upstream and frees the stream's permits.
+        """
+        outcome = "completed"
+        expired = threading.Event()
+        timer = None
+        if deadline is not None:
+            def expire() -> None:
+                expired.set()
+                stream.close()
+
+            timer = threading.Timer(max(0.0, deadline - time.monotonic()), expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    collected.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+                if expired.is_set() or (deadline is not None and time.monotonic() >= deadline):
+                    outcome = "deadline"
+                    break
+            if expired.is_set():
+                outcome = "deadline"
+        except GeneratorExit:
+            outcome = "disconnect"
+            raise
+        except Exception:
+            # a read cut off by the deadline timer fails; that is the deadline
+            if not expired.is_set():
+                outcome = "error"
+                raise
+            outcome = "deadline"
+        finally:
+            if timer is not None:
+                timer.cancel()
+            stream.close()
+            record_stream(collected, outcome, cfg["max_tokens"])
+        return "deadline" if outcome == "deadline" else None
+
+    def _cached_answer(
+        self, messages: List[Dict[str, str]], cfg: Dict[str, Any], metadata: Dict[str, Any]
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """(cache key, cached answer); the key is None when the request is not cacheable."""
+        cache_key = self._response_cache_key(messages, cfg)
+        cached = response_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            metadata["response_cache"] = {"status": "hit"}
+            logger.info("Response cache hit for %s", cache_key[:12])
+        else:
+            metadata["response_cache"] = {"status": "miss" if cache_key else "bypass"}
+        return cache_key, cached
+
+    def _chat_answer(
+        self, query: str, context: str, src_map: Dict,
+        settings: Optional[Dict] = None, metadata: Optional[Dict[str, Any]] = None
+    ) -> str:
+        cfg = self.resolve_settings(settings)
+        messages = self._build_messages(query, context, cfg)
+        params = self._completion_params(cfg)
+        metadata = {} if metadata is None else metadata
+
+        cache_key, cached = self._cached_answer(messages, cfg, metadata)
+        if cached is not None:
+            return cached
+
+        # Log the exact JSON payload sent to OpenAI
         logger.info("========== OPENAI RAW PAYLOAD ==========")
-        logger.info(json.dumps(payload, indent=2))
-        resp = self.openai_client.chat.completions.create(
-            model=self.deployment_name,
-            messages=messages,
-            max_tokens=self.max_tokens,
-            temperature=self.temperature,
-            top_p=self.top_p,
-            presence_penalty=self.presence_penalty,
-            frequency_penalty=self.frequency_penalty
-        )
-        
+        logger.info(json.dumps({**params, "messages": messages}, indent=2))
+        resp = self._chat_completion(messages, cfg)
+
         answer = resp.choices[0].message.content
         logger.info("DEBUG - OpenAI response content: %s", answer)
+        if cache_key is not None and answer:
+            response_cache.set(cache_key, answer)
         return answer
 
-    def _filter_cited(self, answer: str, src_map: Dict) -> List[Dict]:
-        cited_sources = []
-        for sid, sinfo in src_map.items():
-            if f"[{sid}]" in answer:
-                # carry over id, title, and content
-                cited_sources.append({
-                    "id": sid,
-                    "title": sinfo["title"],
-                    "content": sinfo["content"],
-                    # include URL here if you have one in sinfo
-                    **({"url": sinfo["url"]} if "url" in sinfo else {})
-                })
-        return cited_sources
+    @staticmethod
+    def _cite_sources(answer: str, src_map: Dict) -> Tuple[str, List[Dict]]:
+        """Only the sources the answer cites, renumbered in cited order: 1, 2, 3…"""
+        return cite_sources(answer, src_map)
+
+    @staticmethod
+    def _candidate_sources(sources: Union[Dict, List[Dict]]) -> List[Dict[str, str]]:
+        """Ids and titles of a source map, or of a list of cited sources."""
+        if isinstance(sources, dict):
+            return [{"id": sid, "title": src["title"]} for sid, src in sources.items()]
+        return [{"id": src["id"], "title": src["title"]} for src in sources]
+
+    @staticmethod
+    def _error_metadata(exc: Exception) -> Dict[str, Any]:
+        """The error, plus ``retry_after`` seconds when resubmitting later can succeed."""
+        wait = client_retry_after(exc)
+        return {"error": str(exc), **({"retry_after": wait} if wait is not None else {})}
 
     # ─────────── public API ───────────────
     def generate_rag_response(
-        self, query: str
+        self, query: str, settings: Optional[Dict] = None
     ) -> Tuple[str, List[Dict], List[Dict], Dict[str, Any], str]:
         """
+        Args:
+            query: The user query
+            settings: Optional per-call settings overriding the instance settings
+
         Returns:
             answer, cited_sources, [], evaluation, context
         """
+        result = self.generate_rag_result(query, settings)
+        return result["answer"], result["sources"], [], result["evaluation"], result["context"]
+
+    def generate_rag_result(self, query: str, settings: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        Same as generate_rag_response, as a dict that also carries response
+        metadata (retrieval cache status, ...).
+
+        Returns:
+            {"answer", "sources", "evaluation", "context", "metadata"}
+        """
+        cfg = self.resolve_settings(settings)
+        metadata: Dict[str, Any] = {}
         try:
-            kb_results = self.search_knowledge_base(query)
+            q_vec, hit = self._semantic_lookup(query, cfg, metadata)
+            if hit is not None:
+                return {
+                    "answer": hit["answer"],
+                    "sources": copy.deepcopy(hit["sources"]),
+                    "evaluation": {},
+                    "context": hit["context"],
+                    "metadata": metadata,
+                }
+
+            kb_results, metadata["retrieval"] = self._retrieve(query, settings, q_vec)
             if not kb_results:
-                return (
-                    "No relevant information found in the knowledge base.",
-                    [],
-                    [],
-                    {},
-                    "",
-                )
+                return {
+                    "answer": "No relevant information found in the knowledge base.",
+                    "sources": [],
+                    "evaluation": {},
+                    "context": "",
+                    "metadata": metadata,
+                }
+
+            context, src_map, metadata["prompt"] = self._pack_context(query, kb_results, cfg)
+            answer = self._chat_answer(query, context, src_map, settings, metadata)
 
-            context, src_map = self._prepare_context(kb_results)
-            answer = self._chat_answer(query, context, src_map)
-
-            # collect only the sources actually cited
-            cited_raw = self._filter_cited(answer, src_map)
-
-            # renumber in cited order: 1, 2, 3…
-            renumber_map = {}
-            cited_sources = []
-            for new_id, src in enumerate(cited_raw, 1):
-                old_id = src["id"]
-                renumber_map[old_id] = str(new_id)
-                entry = {"id": str(new_id), "title": src["title"], "content": src["content"]}
-                if "url" in src:
-                    entry["url"] = src["url"]
-                cited_sources.append(entry)
-            for old, new in renumber_map.items():
-                answer = re.sub(rf"\[{old}\]", f"[{new}]", answer)
+            answer, cited_sources = self._cite_sources(answer, src_map)
 
             evaluation = self.fact_checker.evaluate_response(
                 query=query,
                 answer=answer,
                 context=context,
-                deployment=self.deployment_name,
+                deployment=cfg["deployment_name"],
             )
 
             # Add a visible marker to the answer to confirm use of rag_assistant3
             answer = "[RAG3] " + answer
-            return answer, cited_sources, [], evaluation, context
-        
+            self._semantic_store(q_vec, cfg, query, answer, cited_sources, context)
+            return {
+                "answer": answer,
+                "sources": cited_sources,
+                "evaluation": evaluation,
+                "context": context,
+                "metadata": metadata,
+            }
+
 
         except Exception as exc:
             logger.error("RAG generation error: %s", exc)
-            return (
-                "[RAG3] I encountered an error while generating the response.",
-                [],
-                [],
-                {},
-                "",
-            )
-            
-    def stream_rag_response(self, query: str) -> Generator[Union[str, Dict], None, None]:
+            return {
+                "answer": "[RAG3] I encountered an error while generating the response.",
+                "sources": [],
+                "evaluation": {},
+                "context": "",
+                "metadata": {**metadata, **self._error_metadata(exc)},
+            }
+
+    # ─────────── direct completions (no retrieval) ───────────
+    @staticmethod
+    def _direct_messages(prompt: str, system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def complete(
+        self, prompt: str, system_prompt: Optional[str] = None, settings: Optional[Dict] = None
+    ) -> str:
+        """
+        Plain chat completion: no embedding, search, RAG system prompt or
+        citations. For summaries and evaluations whose prompt already holds
+        everything the model needs. Goes through the response cache.
+        """
+        cfg = self.resolve_settings(settings)
+        messages = self._direct_messages(prompt, system_prompt)
+        cache_key = self._response_cache_key(messages, cfg)
+        if cache_key is not None:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        resp = self._chat_completion(messages, cfg)
+        answer = resp.choices[0].message.content or ""
+        if cache_key is not None and answer:
+            response_cache.set(cache_key, answer)
+        return answer
+
+    def stream_complete(
+        self, prompt: str, system_prompt: Optional[str] = None, settings: Optional[Dict] = None
+    ) -> Generator[str, None, None]:
+        """Streaming variant of ``complete``; yields answer text as it arrives."""
+        cfg = self.resolve_settings(settings)
+        messages = self._direct_messages(prompt, system_prompt)
+        cache_key = self._response_cache_key(messages, cfg)
+        cached = response_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            yield from self._replay_chunks(cached)
+            return
+
+        stream = self._chat_completion(messages, cfg, stream=True)
+        collected: List[str] = []
+        cancelled = yield from self._stream_text(stream, cfg, collected, self._deadline(cfg))
+        if cache_key is not None and collected and cancelled is None:
+            response_cache.set(cache_key, "".join(collected))
+
+    def stream_rag_response(
+        self, query: str, settings: Optional[Dict] = None, candidates: bool = False
+    ) -> Generator[Union[str, Dict], None, None]:
         """
         Stream the RAG response generation.
-        
+
         Args:
             query: The user query
-            
+            settings: Optional per-call settings overriding the instance settings
+            candidates: Also yield ``{"candidates": [{"id", "title"}, ...]}``,
+                the sources in the prompt, before the first answer chunk
+
         Yields:
             Either string chunks of the answer or a dictionary with metadata
         """
+        cfg = self.resolve_settings(settings)
+        deadline = self._deadline(cfg)
+        metadata: Dict[str, Any] = {}
         try:
             logger.info(f"========== STARTING STREAM RAG RESPONSE ==========")
             logger.info(f"Original query: {query}")
-            
-            kb_results = self.search_knowledge_base(query)
+
+            q_vec, hit = self._semantic_lookup(query, cfg, metadata)
+            if hit is not None:
+                if candidates:
+                    yield {"candidates": self._candidate_sources(hit["sources"])}
+                # stored with the [RAG3] marker, which live streams only add
+                # to the final answer
+                yield hit["answer"].removeprefix("[RAG3] ")
+                yield {
+                    "sources": copy.deepcopy(hit["sources"]),
+                    "evaluation": {},
+                    "metadata": metadata
+                }
+                return
+
+            kb_results, metadata["retrieval"] = self._retrieve(query, settings, q_vec)
             if not kb_results:
                 logger.info("No relevant information found in knowledge base")
+                if candidates:
+                    yield {"candidates": []}
                 yield "No relevant information found in the knowledge base."
                 yield {
                     "sources": [],
-                    "evaluation": {}
+                    "evaluation": {},
+                    "metadata": metadata
                 }
                 return
 
-            context, src_map = self._prepare_context(kb_results)
+            context, src_map, metadata["prompt"] = self._pack_context(query, kb_results, cfg)
             logger.info(f"Retrieved {len(kb_results)} results from knowledge base")
-            
-            # Get system prompt from settings if available
-            system_prompt = self.DEFAULT_SYSTEM_PROMPT
-            
-            # Check if custom system prompt is available in settings
-            settings = self.settings
-            custom_prompt = settings.get("custom_prompt", "")
-            system_prompt_override = settings.get("system_prompt", "")
-            system_prompt_mode = settings.get("system_prompt_mode", "Append")
-            
-            # Apply custom prompt to query if available
-            if custom_prompt:
-                query = f"{custom_prompt}\n\n{query}"
-                logger.info(f"DEBUG - Applied custom prompt to query: {custom_prompt[:100]}...")
-            
-            # Apply system prompt based on mode
-            if system_prompt_override:
-                if system_prompt_mode == "Override":
-                    system_prompt = system_prompt_override
-                    logger.info(f"OVERRIDE MODE ACTIVE - Using override prompt: {system_prompt[:100]}...")
-                else:  # Append
-                    # Prepend custom prompt to give it priority over default
-                    system_prompt = f"{system_prompt_override}\n\n{self.DEFAULT_SYSTEM_PROMPT}"
-                    logger.info(f"APPEND MODE ACTIVE - Prepended custom prompt: {system_prompt_override[:100]}...")
+            if candidates:
+                # the UI can show these while the answer is generated
+                yield {"candidates": self._candidate_sources(src_map)}
+
+            messages = self._build_messages(query, context, cfg)
+
+            # Citations are renumbered as the answer streams, so the
+            # streamed text is the final answer
+            rewriter = CitationRewriter(src_map)
+            collected_chunks: List[str] = []
+            cancelled = None
+            cache_key, cached = self._cached_answer(messages, cfg, metadata)
+            if cached is not None:
+                # replay the cached answer as a fast pseudo-stream
+                collected_chunks.append(cached)
+                yield from rewriter.rewrite(self._replay_chunks(cached))
             else:
-                logger.info("No system_prompt_override provided in settings")
-
-            # Prepare the actual content that will be sent
-            processed_system_prompt = system_prompt.strip()
-            processed_user_content = f"<context>\n{context}\n</context>\n<user_query>\n{query}\n</user_query>"
-            
-            messages = [
-                {"role": "system", "content": processed_system_prompt},
-                {"role": "user", "content": processed_user_content}
-            ]
-            
-            # Log detailed payload information
-            logger.info("========== OPENAI API STREAM REQUEST DETAILS ==========")
-            logger.info(f"Model deployment: {self.deployment_name}")
-            logger.info(f"Temperature: {self.temperature}")
-            logger.info(f"Max tokens: {self.max_tokens}")
-            logger.info(f"Top P: {self.top_p}")
-            logger.info(f"Presence penalty: {self.presence_penalty}")
-            logger.info(f"Frequency penalty: {self.frequency_penalty}")
-            
-            # Log the complete system prompt
-            logger.info("========== SYSTEM PROMPT ==========")
-            logger.info(processed_system_prompt)
-            
-            # Log the user query with context
-            logger.info("========== USER CONTENT ==========")
-            logger.info(processed_user_content)
-            
-            # Log the complete messages array for debugging
-            logger.info("========== MESSAGES ARRAY ==========")
-            for i, msg in enumerate(messages):
-                logger.info(f"Message {i+1} - Role: {msg['role']}")
-                logger.info(f"Content: {msg['content']}")
-            
-            # Stream the response
-            stream = self.openai_client.chat.completions.create(
-                model=self.deployment_name,
-                messages=messages,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                top_p=self.top_p,
-                presence_penalty=self.presence_penalty,
-                frequency_penalty=self.frequency_penalty,
-                stream=True
-            )
-            
-            collected_chunks = []
-            collected_answer = ""
-            
-            # Process the streaming response
-            for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    collected_chunks.append(content)
-                    collected_answer += content
-                    yield content
-            
-            # Add the RAG3 marker
-            collected_answer = "[RAG3] " + collected_answer
-            
-            # Filter cited sources
-            cited_raw = self._filter_cited(collected_answer, src_map)
-            
-            # Renumber in cited order: 1, 2, 3…
-            renumber_map = {}
-            cited_sources = []
-            for new_id, src in enumerate(cited_raw, 1):
-                old_id = src["id"]
-                renumber_map[old_id] = str(new_id)
-                entry = {"id": str(new_id), "title": src["title"], "content": src["content"]}
-                if "url" in src:
-                    entry["url"] = src["url"]
-                cited_sources.append(entry)
-            
-            # Apply renumbering to the answer
-            for old, new in renumber_map.items():
-                collected_answer = re.sub(rf"\[{old}\]", f"[{new}]", collected_answer)
-            
+                # Stream the response; only opening the stream is retried.
+                # A client disconnect closes this generator, which closes
+                # the upstream stream too
+                stream = self._chat_completion(messages, cfg, stream=True)
+                cancelled = yield from rewriter.rewrite(
+                    self._stream_text(stream, cfg, collected_chunks, deadline)
+                )
+            tail = rewriter.flush()
+            if tail:
+                yield tail
+
+            collected_answer = "".join(collected_chunks)
+            if cancelled is not None:
+                logger.info("Stream stopped at the %ss deadline", cfg["stream_deadline"])
+                metadata["cancelled"] = cancelled
+            elif cache_key is not None and cached is None and collected_answer:
+                response_cache.set(cache_key, collected_answer)
+
+            # Add the RAG3 marker; only the cited sources are kept
+            collected_answer = "[RAG3] " + rewriter.text()
+            cited_sources = rewriter.sources()
+
             # Get evaluation
             evaluation = self.fact_checker.evaluate_response(
                 query=query,
                 answer=collected_answer,
                 context=context,
-                deployment=self.deployment_name,
+                deployment=cfg["deployment_name"],
             )
-            
+            if cancelled is None:
+                self._semantic_store(q_vec, cfg, query, collected_answer, cited_sources, context)
+
             # Yield the metadata
             yield {
                 "sources": cited_sources,
-                "evaluation": evaluation
+                "evaluation": evaluation,
+                "metadata": metadata
             }
-            
+
         except Exception as exc:
             logger.error("RAG streaming error: %s", exc)
             yield "[RAG3] I encountered an error while generating the response."
             yield {
                 "sources": [],
                 "evaluation": {},
-                "error": str(exc)
+                "metadata": metadata,
+                **self._error_metadata(exc)
             }
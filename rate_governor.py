@@ -0,0 +1,396 @@
+"""
+Client-side request and token rate governor for Azure OpenAI deployments.
+
+Every OpenAI call takes a permit from its deployment's governor before it is
+sent:
+
+- an RPM and a TPM token bucket (GOVERNOR_RPM / GOVERNOR_TPM, overridable per
+  deployment in GOVERNOR_LIMITS). Like Azure's own limiter, a chat call is
+  charged its prompt tokens plus ``max_tokens`` up front; when the call ends,
+  the part it did not use goes back to the TPM bucket. A stream's usage is
+  its prompt plus the completion tokens it actually streamed
+- an adaptive concurrency limit (AIMD): +1/limit per success up to
+  GOVERNOR_MAX_CONCURRENCY, times GOVERNOR_BACKOFF on a 429 (at most once per
+  second), and a 429's Retry-After pauses the whole deployment
+
+Limits are per process; with several gunicorn workers, give each worker its
+share of the quota. The governor sits inside the resilience.py retry loop,
+so every retry takes a new permit.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import types
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from config import (
+    GOVERNOR_ENABLED,
+    GOVERNOR_RPM,
+    GOVERNOR_TPM,
+    GOVERNOR_LIMITS,
+    GOVERNOR_MAX_CONCURRENCY,
+    GOVERNOR_MIN_CONCURRENCY,
+    GOVERNOR_BACKOFF,
+    GOVERNOR_MAX_WAIT,
+)
+from resilience import retry_after, status_code
+from token_utils import MESSAGE_TOKEN_OVERHEAD, count_tokens
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# poll interval while waiting for a concurrency slot on an event loop
+_ASYNC_POLL = 0.02
+
+try:
+    _LIMITS: Dict[str, Dict[str, float]] = json.loads(GOVERNOR_LIMITS or "{}")
+except ValueError:
+    logger.error("Ignoring invalid GOVERNOR_LIMITS: %r", GOVERNOR_LIMITS)
+    _LIMITS = {}
+
+
+class GovernorTimeout(Exception):
+    """No permit within GOVERNOR_MAX_WAIT; nothing was sent."""
+
+    def __init__(self, deployment: str, retry_after: float) -> None:
+        super().__init__(f"{deployment} is at its rate limit (retry in {retry_after:.1f}s)")
+        self.deployment = deployment
+        self.retry_after = retry_after
+
+
+def estimate_chat_tokens(messages: List[Dict[str, str]], max_tokens: Optional[int]) -> int:
+    prompt = sum(count_tokens(m.get("content") or "") + MESSAGE_TOKEN_OVERHEAD for m in messages)
+    return prompt + int(max_tokens or 0)
+
+
+def estimate_embedding_tokens(texts: List[str]) -> int:
+    return sum(count_tokens(t) for t in texts)
+
+
+class _Bucket:
+    """Per-minute token bucket that starts full."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        # a request larger than the bucket goes through once it is full
+        return max(min(amount, self.capacity) - self.level, 0.0) / self.rate
+
+
+class RateGovernor:
+    """RPM/TPM buckets and an adaptive concurrency limit for one deployment."""
+
+    def __init__(
+        self,
+        deployment: str,
+        rpm: int = GOVERNOR_RPM,
+        tpm: int = GOVERNOR_TPM,
+        max_concurrency: int = GOVERNOR_MAX_CONCURRENCY,
+        enabled: bool = GOVERNOR_ENABLED,
+    ) -> None:
+        self.deployment = deployment
+        self.enabled = enabled
+        self.requests = _Bucket(rpm) if rpm > 0 else None
+        self.tokens = _Bucket(tpm) if tpm > 0 else None
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.min_concurrency = max(min(GOVERNOR_MIN_CONCURRENCY, self.max_concurrency), 1)
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        # statistics
+        self.counters = {
+            "calls": 0,
+            "tokens_estimated": 0,
+            "tokens_used": 0,
+            "throttled": 0,
+            "waited": 0,
+            "wait_ms_total": 0.0,
+            "max_wait_ms": 0.0,
+            "timeouts": 0,
+        }
+
+    # ─── permits ───
+    def _try_acquire(self, tokens: int) -> Optional[float]:
+        """
+        Take a permit and return 0, or return how long the buckets need;
+        None means every slot is busy. Call with the lock held.
+        """
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        wait = 0.0
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_for(amount))
+        if wait > 0:
+            return wait
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.level -= min(amount, bucket.capacity)
+        self.in_flight += 1
+        self.counters["calls"] += 1
+        self.counters["tokens_estimated"] += tokens
+        return 0.0
+
+    def _record_wait(self, start: float) -> None:
+        waited = (time.monotonic() - start) * 1000
+        if waited >= 1:
+            self.counters["waited"] += 1
+            self.counters["wait_ms_total"] += waited
+            self.counters["max_wait_ms"] = max(self.counters["max_wait_ms"], waited)
+
+    def _timeout(self, wait: Optional[float]) -> GovernorTimeout:
+        self.counters["timeouts"] += 1
+        return GovernorTimeout(self.deployment, 1.0 if wait is None else wait)
+
+    def acquire(self, tokens: int) -> None:
+        start = time.monotonic()
+        deadline = start + GOVERNOR_MAX_WAIT
+        with self._cond:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait == 0:
+                    self._record_wait(start)
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (wait is not None and wait > remaining):
+                    raise self._timeout(wait)
+                # a release notifies; bucket refills are waited out
+                self._cond.wait(remaining if wait is None else wait)
+
+    async def aacquire(self, tokens: int) -> None:
+        start = time.monotonic()
+        deadline = start + GOVERNOR_MAX_WAIT
+        while True:
+            with self._cond:
+                wait = self._try_acquire(tokens)
+                if wait == 0:
+                    self._record_wait(start)
+                    return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (wait is not None and wait > remaining):
+                with self._cond:
+                    raise self._timeout(wait)
+            await asyncio.sleep(min(_ASYNC_POLL, remaining) if wait is None else wait)
+
+    def release(self, exc: Optional[BaseException] = None, usage: Any = None, charged: int = 0) -> None:
+        """
+        Return the permit and adapt the concurrency limit to the outcome;
+        ``charged`` tokens taken for the call are reconciled with ``usage``.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if usage is not None:
+                used = getattr(usage, "total_tokens", 0) or 0
+                self.counters["tokens_used"] += used
+                if self.tokens is not None and charged:
+                    self.tokens.refill(time.monotonic())
+                    unused = min(charged, self.tokens.capacity) - used
+                    if unused > 0:
+                        self.tokens.level = min(self.tokens.capacity, self.tokens.level + unused)
+            if exc is not None and status_code(exc) == 429:
+                self._on_throttle(exc)
+            elif exc is None:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def _on_throttle(self, exc: BaseException) -> None:
+        now = time.monotonic()
+        self.counters["throttled"] += 1
+        # many in-flight calls see the same 429 burst; back off once for it
+        if now - self._last_decrease >= 1.0:
+            self.limit = max(float(self.min_concurrency), self.limit * GOVERNOR_BACKOFF)
+            self._last_decrease = now
+            logger.warning("%s throttled, concurrency limit now %d", self.deployment, int(self.limit))
+        wait = retry_after(exc)
+        if wait:
+            self.paused_until = max(self.paused_until, now + wait)
+
+    # ─── calls ───
+    def run(self, tokens: int, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """``fn(*args, **kwargs)`` under a permit; a streamed response holds it until closed."""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        self.acquire(tokens)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            self.release(exc)
+            raise
+        if kwargs.get("stream"):
+            meter = _StreamMeter(tokens - int(kwargs.get("max_tokens") or 0))
+            return HeldStream(
+                result, lambda: self.release(usage=meter.usage(), charged=tokens), on_chunk=meter.observe
+            )
+        self.release(usage=getattr(result, "usage", None), charged=tokens)
+        return result
+
+    async def arun(self, tokens: int, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        if not self.enabled:
+            return await fn(*args, **kwargs)
+        await self.aacquire(tokens)
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as exc:
+            self.release(exc)
+            raise
+        if kwargs.get("stream"):
+            meter = _StreamMeter(tokens - int(kwargs.get("max_tokens") or 0))
+            return AsyncHeldStream(
+                result, lambda: self.release(usage=meter.usage(), charged=tokens), on_chunk=meter.observe
+            )
+        self.release(usage=getattr(result, "usage", None), charged=tokens)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+            return {
+                **self.counters,
+                "wait_ms_total": round(self.counters["wait_ms_total"], 1),
+                "max_wait_ms": round(self.counters["max_wait_ms"], 1),
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "rpm": int(self.requests.capacity) if self.requests else None,
+                "tpm": int(self.tokens.capacity) if self.tokens else None,
+                "requests_available": int(self.requests.level) if self.requests else None,
+                "tokens_available": int(self.tokens.level) if self.tokens else None,
+                "paused_for_s": round(max(self.paused_until - now, 0.0), 1),
+            }
+
+
+class _StreamMeter:
+    """Tokens used by a chat stream, counted from the chunks that pass through."""
+
+    def __init__(self, prompt_tokens: int) -> None:
+        self.prompt_tokens = max(prompt_tokens, 0)
+        self.pieces: List[str] = []
+        self.reported: Any = None
+
+    def observe(self, chunk: Any) -> None:
+        # the last chunk carries usage when stream_options include it
+        if getattr(chunk, "usage", None) is not None:
+            self.reported = chunk.usage
+        choices = getattr(chunk, "choices", None)
+        content = getattr(getattr(choices[0], "delta", None), "content", None) if choices else None
+        if content:
+            self.pieces.append(content)
+
+    def usage(self) -> Any:
+        if self.reported is not None:
+            return self.reported
+        return types.SimpleNamespace(total_tokens=self.prompt_tokens + count_tokens("".join(self.pieces)))
+
+
+class HeldStream:
+    """
+    A streamed response that keeps its permit until exhausted or closed;
+    ``first_chunk`` is called when the first chunk arrives and ``on_chunk``
+    with every chunk.
+    """
+
+    def __init__(
+        self,
+        stream: Any,
+        release: Callable[..., None],
+        first_chunk: Optional[Callable[[], None]] = None,
+        on_chunk: Optional[Callable[[Any], None]] = None,
+    ) -> None:
+        self._stream = stream
+        self._release = release
+        self._first_chunk = first_chunk
+        self._on_chunk = on_chunk
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                self._arrived(chunk)
+                yield chunk
+        finally:
+            self._done()
+
+    def _arrived(self, chunk: Any) -> None:
+        if self._on_chunk is not None:
+            self._on_chunk(chunk)
+        first_chunk, self._first_chunk = self._first_chunk, None
+        if first_chunk is not None:
+            first_chunk()
+
+    def _done(self) -> None:
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def close(self) -> None:
+        self._done()
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+    def __del__(self) -> None:
+        self._done()
+
+
+class AsyncHeldStream(HeldStream):
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                self._arrived(chunk)
+                yield chunk
+        finally:
+            self._done()
+
+    async def close(self) -> None:
+        self._done()
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            await close()
+
+
+_governors: Dict[str, RateGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(deployment: str) -> RateGovernor:
+    """Process-wide governor for a deployment."""
+    governor = _governors.get(deployment)
+    if governor is None:
+        with _governors_lock:
+            governor = _governors.get(deployment)
+            if governor is None:
+                limits = _LIMITS.get(deployment or "", {})
+                governor = _governors[deployment] = RateGovernor(
+                    deployment,
+                    rpm=int(limits.get("rpm", GOVERNOR_RPM)),
+                    tpm=int(limits.get("tpm", GOVERNOR_TPM)),
+                    max_concurrency=int(limits.get("concurrency", GOVERNOR_MAX_CONCURRENCY)),
+                )
+    return governor
+
+
+def get_governor_stats() -> Dict[str, Dict[str, Any]]:
+    with _governors_lock:
+        governors = dict(_governors)
+    return {str(name): g.stats() for name, g in governors.items()}
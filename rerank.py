@@ -0,0 +1,122 @@
+"""
+Local reranking of Azure Search candidates.
+
+When RERANK_MODE is not "off", search over-fetches RERANK_CANDIDATES hits and
+this module keeps the best RERANK_TOP_K of them for the prompt:
+
+- bm25: Okapi BM25 of the query against each candidate chunk, blended with
+  the min-max normalized ``@search.score``.
+- mmr:  maximal marginal relevance over chunk embeddings, trading similarity
+  to the query against similarity to the chunks already picked.
+- both: MMR that uses the BM25 blend as its relevance term.
+
+Scoring is vectorized with NumPy over the candidate set.
+"""
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import (
+    RERANK_MMR_LAMBDA,
+    RERANK_BM25_WEIGHT,
+    RERANK_BM25_K1,
+    RERANK_BM25_B,
+)
+
+MODES = ("off", "bm25", "mmr", "both")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _minmax(x: np.ndarray) -> np.ndarray:
+    span = float(x.max() - x.min()) if x.size else 0.0
+    return np.ones_like(x) if span == 0 else (x - x.min()) / span
+
+
+def bm25_scores(
+    query: str, docs: Sequence[str], k1: float = RERANK_BM25_K1, b: float = RERANK_BM25_B
+) -> np.ndarray:
+    """BM25 of ``query`` against ``docs``, with IDF taken from ``docs`` themselves."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not docs or not terms:
+        return np.zeros(len(docs), dtype=np.float64)
+    counts = [Counter(tokenize(d)) for d in docs]
+    tf = np.array([[c[t] for t in terms] for c in counts], dtype=np.float64)
+    dl = np.array([sum(c.values()) for c in counts], dtype=np.float64)
+    avgdl = dl.mean() or 1.0
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((len(docs) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * dl / avgdl)
+    return (idf * tf * (k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+def lexical_relevance(query: str, results: List[Dict], weight: float = RERANK_BM25_WEIGHT) -> np.ndarray:
+    """Blend of normalized search score and normalized BM25, in [0, 1]."""
+    search = _minmax(np.array([r.get("relevance") or 0.0 for r in results], dtype=np.float64))
+    lexical = _minmax(bm25_scores(query, [r["chunk"] for r in results]))
+    return (1 - weight) * search + weight * lexical
+
+
+def _unit_rows(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    m = np.asarray(vectors, dtype=np.float32)
+    return m / np.maximum(np.linalg.norm(m, axis=-1, keepdims=True), 1e-12)
+
+
+def mmr(doc_vecs: np.ndarray, relevance: np.ndarray, k: int, lam: float = RERANK_MMR_LAMBDA) -> List[int]:
+    """Greedy MMR over unit-length ``doc_vecs``; returns indices in pick order."""
+    pairwise = doc_vecs @ doc_vecs.T
+    n = len(doc_vecs)
+    picked: List[int] = []
+    # highest similarity of each candidate to anything already picked
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    for _ in range(min(k, n)):
+        score = lam * relevance if not picked else lam * relevance - (1 - lam) * redundancy
+        best = int(np.argmax(np.where(available, score, -np.inf)))
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+    return picked
+
+
+def rerank(
+    query: str,
+    results: List[Dict],
+    mode: str,
+    k: int,
+    query_vec: Optional[Sequence[float]] = None,
+    doc_vecs: Optional[Sequence[Sequence[float]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Top ``k`` of ``results`` under ``mode``, each with a ``rerank_score``.
+
+    "mmr" and "both" need ``query_vec`` and one vector per result in
+    ``doc_vecs``; without them they fall back to lexical ordering.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown rerank mode: {mode!r}")
+    if mode == "off" or not results:
+        return results[:k]
+    relevance = lexical_relevance(query, results) if mode in ("bm25", "both") else None
+    if mode in ("mmr", "both") and query_vec is not None and doc_vecs is not None:
+        docs = _unit_rows(doc_vecs)
+        if relevance is None:
+            relevance = docs @ _unit_rows(query_vec)
+        order = mmr(docs, relevance, k)
+    else:
+        if relevance is None:
+            relevance = lexical_relevance(query, results)
+        order = [int(i) for i in np.argsort(-relevance, kind="stable")[:k]]
+
+    ranked = []
+    for i in order:
+        entry = dict(results[i])
+        entry["rerank_score"] = round(float(relevance[i]), 4)
+        ranked.append(entry)
+    return ranked
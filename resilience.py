@@ -0,0 +1,313 @@
+"""
+Retries and circuit breaking for calls to Azure OpenAI and Azure Search.
+
+Every network call goes through a named ``Dependency`` (one per OpenAI
+deployment, one for Search) instead of the SDKs' built-in retries:
+
+- transient failures (429, 408, 5xx, connection errors and timeouts) are
+  retried up to RETRY_MAX_ATTEMPTS times with full-jitter exponential backoff;
+  a ``Retry-After`` header replaces the backoff, and a 429 asking for more
+  than RETRY_MAX_RETRY_AFTER seconds fails at once instead of holding the
+  worker
+- retries are paid from a per-dependency budget refilled by RETRY_BUDGET_RATIO
+  per call, so a throttled deployment sees at most that much extra traffic
+- BREAKER_FAILURE_THRESHOLD consecutive transient failures open the breaker:
+  calls fail fast with CircuitOpenError for BREAKER_RESET_TIMEOUT seconds,
+  then one probe call decides whether it closes again
+
+Client errors (400, 401, 404, content filter) are raised without a retry and
+do not count against the breaker. State and counters are in
+``get_resilience_stats()``.
+"""
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+import openai
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+
+from config import (
+    RETRY_MAX_ATTEMPTS,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    RETRY_MAX_RETRY_AFTER,
+    RETRY_BUDGET_RATIO,
+    RETRY_BUDGET_BURST,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_CONNECTION_ERRORS = (
+    openai.APIConnectionError,  # includes APITimeoutError
+    ServiceRequestError,
+    ServiceResponseError,
+    httpx.TransportError,
+)
+
+
+class CircuitOpenError(Exception):
+    """The dependency's breaker is open; nothing was sent."""
+
+    def __init__(self, name: str, retry_after: float) -> None:
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_after:.1f}s)")
+        self.dependency = name
+        self.retry_after = retry_after
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status of an OpenAI or Azure SDK error, if it carries one."""
+    code = getattr(exc, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Worth retrying, and a sign the dependency is unhealthy."""
+    if isinstance(exc, _CONNECTION_ERRORS):
+        return True
+    if isinstance(exc, (openai.APIStatusError, HttpResponseError)):
+        return status_code(exc) in RETRYABLE_STATUS
+    return False
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms / Retry-After), if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for name in ("retry-after-ms", "x-ms-retry-after-ms"):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(float(value) / 1000.0, 0.0)
+            except ValueError:
+                pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+class RetryBudget:
+    """Token bucket: each call deposits ``ratio`` tokens, each retry spends one."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, burst: int = RETRY_BUDGET_BURST) -> None:
+        self.ratio = ratio
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+
+    def deposit(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half_open -> closed."""
+
+    def __init__(
+        self, threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT
+    ) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self.times_opened = 0
+
+    def allow(self) -> Optional[float]:
+        """None when a call may go ahead, else the seconds until the next probe."""
+        if self.threshold <= 0 or self.state == "closed":
+            return None
+        now = time.monotonic()
+        if self.state == "open":
+            wait = self.opened_at + self.reset_timeout - now
+            if wait > 0:
+                return wait
+            self.state = "half_open"
+        elif now - self.probe_started < self.reset_timeout:
+            # one probe at a time; a probe that never reported back expires
+            return self.reset_timeout - (now - self.probe_started)
+        self.probe_started = now
+        return None
+
+    def success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or (self.threshold > 0 and self.failures >= self.threshold):
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class Dependency:
+    """Retry policy, retry budget and circuit breaker for one backend."""
+
+    def __init__(self, name: str, max_attempts: int = RETRY_MAX_ATTEMPTS) -> None:
+        self.name = name
+        self.max_attempts = max(max_attempts, 1)
+        self.breaker = CircuitBreaker()
+        self.budget = RetryBudget()
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "throttled": 0,
+            "short_circuited": 0,
+            "budget_exhausted": 0,
+        }
+
+    def call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """``fn(*args, **kwargs)`` with retries; raises the last error or CircuitOpenError."""
+        attempt = 0
+        while True:
+            self._before_attempt(attempt)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as exc:
+                delay = self._after_failure(exc, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._after_success()
+            return result
+
+    async def acall(self, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        """Async ``call`` for coroutine functions; backs off with asyncio.sleep."""
+        attempt = 0
+        while True:
+            self._before_attempt(attempt)
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as exc:
+                delay = self._after_failure(exc, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._after_success()
+            return result
+
+    def _before_attempt(self, attempt: int) -> None:
+        with self._lock:
+            wait = self.breaker.allow()
+            if wait is not None:
+                self.counters["short_circuited"] += 1
+                raise CircuitOpenError(self.name, wait)
+            if attempt == 0:
+                self.counters["calls"] += 1
+                self.budget.deposit()
+
+    def _after_success(self) -> None:
+        with self._lock:
+            self.counters["successes"] += 1
+            self.breaker.success()
+
+    def _after_failure(self, exc: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None to give up and raise."""
+        transient = is_transient(exc)
+        wait = retry_after(exc) if transient else None
+        with self._lock:
+            if not transient:
+                if status_code(exc) is not None:
+                    # the backend answered; the request itself was wrong
+                    self.breaker.success()
+                return None
+            self.counters["failures"] += 1
+            if status_code(exc) == 429:
+                self.counters["throttled"] += 1
+            self.breaker.failure()
+            if attempt + 1 >= self.max_attempts or self.breaker.state == "open":
+                return None
+            if wait is not None and wait > RETRY_MAX_RETRY_AFTER:
+                return None
+            if not self.budget.withdraw():
+                self.counters["budget_exhausted"] += 1
+                return None
+            self.counters["retries"] += 1
+        if wait is None:
+            wait = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+        else:
+            # spread out callers told to come back at the same moment
+            wait += random.uniform(0, RETRY_BASE_DELAY)
+        logger.warning(
+            "%s call failed (%s), retry %d/%d in %.2fs",
+            self.name, exc, attempt + 1, self.max_attempts - 1, wait,
+        )
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "times_opened": self.breaker.times_opened,
+                "retry_tokens": round(self.budget.tokens, 2),
+            }
+
+
+_dependencies: Dict[str, Dependency] = {}
+_dependencies_lock = threading.Lock()
+
+
+def dependency(name: str) -> Dependency:
+    """Process-wide Dependency for ``name`` (e.g. "openai:<deployment>", "search")."""
+    dep = _dependencies.get(name)
+    if dep is None:
+        with _dependencies_lock:
+            dep = _dependencies.setdefault(name, Dependency(name))
+    return dep
+
+
+def client_retry_after(exc: BaseException) -> Optional[float]:
+    """
+    Seconds our own client should wait before resubmitting a request that
+    failed with ``exc``, or None when resubmitting will not help.
+    """
+    wait = getattr(exc, "retry_after", None)
+    if isinstance(wait, (int, float)):
+        # CircuitOpenError, GovernorTimeout: nothing was sent
+        return round(wait, 1)
+    if is_transient(exc):
+        wait = retry_after(exc)
+        return round(wait, 1) if wait is not None else RETRY_MAX_DELAY
+    return None
+
+
+def get_resilience_stats() -> Dict[str, Dict[str, Any]]:
+    with _dependencies_lock:
+        deps = dict(_dependencies)
+    return {name: dep.stats() for name, dep in deps.items()}
@@ -0,0 +1,233 @@
+"""
+Priority lanes for upstream OpenAI calls.
+
+Interactive chat (/api/query, /api/stream_query) and batch evaluation
+(/api/dev_eval_batch, /api/dev_eval_compare) share the workers and the
+OpenAI quota. Every OpenAI call takes a slot in its lane first:
+
+- each lane has its own concurrency limit, and SCHEDULER_MAX_CONCURRENCY caps
+  both together
+- a freed slot always goes to a waiting interactive call before a batch call
+- while the p95 latency of interactive calls (queue wait plus time to the
+  response, or to the first chunk of a streamed response) is above
+  SCHEDULER_INTERACTIVE_P95_MS, the batch limit is halved every
+  SCHEDULER_ADJUST_INTERVAL seconds, down to 1; it grows back by one per
+  interval once p95 is under 80% of the target
+
+The lane comes from a context variable, interactive by default; wrap batch
+work in ``with lane("batch"):`` or decorate a view with ``@lane("batch")``.
+Asyncio tasks inherit the lane of the code that created them.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, TypeVar
+
+from config import (
+    SCHEDULER_MAX_CONCURRENCY,
+    SCHEDULER_INTERACTIVE_CONCURRENCY,
+    SCHEDULER_BATCH_CONCURRENCY,
+    SCHEDULER_INTERACTIVE_P95_MS,
+    SCHEDULER_ADJUST_INTERVAL,
+)
+from rate_governor import HeldStream, AsyncHeldStream
+
+T = TypeVar("T")
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)
+
+current_lane: contextvars.ContextVar[str] = contextvars.ContextVar("current_lane", default=INTERACTIVE)
+
+# poll interval while waiting for a slot on an event loop
+_ASYNC_POLL = 0.01
+
+
+@contextmanager
+def lane(name: str) -> Iterator[None]:
+    """Run the enclosed calls in lane ``name``."""
+    if name not in LANES:
+        raise ValueError(f"Unknown lane {name!r}; expected one of {', '.join(LANES)}")
+    token = current_lane.set(name)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+def _percentile(samples: Deque[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)] if ordered else 0.0
+
+
+class _Lane:
+    def __init__(self, limit: int) -> None:
+        self.max_limit = max(limit, 1)
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.served = 0
+        self.waits: Deque[float] = deque(maxlen=1000)
+        self.latencies: Deque[float] = deque(maxlen=1000)
+        # latencies since the last batch limit adjustment
+        self.window: Deque[float] = deque(maxlen=1000)
+
+
+class Scheduler:
+    """Two-lane slot scheduler: interactive first, batch adaptively throttled."""
+
+    def __init__(
+        self,
+        max_concurrency: int = SCHEDULER_MAX_CONCURRENCY,
+        interactive: int = SCHEDULER_INTERACTIVE_CONCURRENCY,
+        batch: int = SCHEDULER_BATCH_CONCURRENCY,
+    ) -> None:
+        self.max_concurrency = max(max_concurrency, 1)
+        self.lanes = {INTERACTIVE: _Lane(interactive), BATCH: _Lane(batch)}
+        self._cond = threading.Condition()
+        self._next_adjust = time.monotonic() + SCHEDULER_ADJUST_INTERVAL
+        self.batch_throttled = 0
+
+    # ─── slots ───
+    def _try_acquire(self, name: str) -> bool:
+        lane_ = self.lanes[name]
+        total = sum(l.in_flight for l in self.lanes.values())
+        if total >= self.max_concurrency or lane_.in_flight >= lane_.limit:
+            return False
+        if name == BATCH and self.lanes[INTERACTIVE].waiting:
+            return False
+        lane_.in_flight += 1
+        lane_.served += 1
+        return True
+
+    def _enqueue(self, name: str) -> None:
+        lane_ = self.lanes[name]
+        lane_.waiting += 1
+        lane_.max_waiting = max(lane_.max_waiting, lane_.waiting)
+
+    def _dequeue(self, name: str, start: float) -> None:
+        lane_ = self.lanes[name]
+        lane_.waiting -= 1
+        lane_.waits.append(time.monotonic() - start)
+        # batch callers may have been holding back for this one
+        self._cond.notify_all()
+
+    def acquire(self, name: str) -> float:
+        """Block until lane ``name`` has a slot; returns the start time for ``release``."""
+        start = time.monotonic()
+        with self._cond:
+            self._enqueue(name)
+            try:
+                while not self._try_acquire(name):
+                    self._cond.wait()
+            finally:
+                self._dequeue(name, start)
+        return start
+
+    async def aacquire(self, name: str) -> float:
+        start = time.monotonic()
+        with self._cond:
+            self._enqueue(name)
+        try:
+            while True:
+                with self._cond:
+                    if self._try_acquire(name):
+                        return start
+                await asyncio.sleep(_ASYNC_POLL)
+        finally:
+            with self._cond:
+                self._dequeue(name, start)
+
+    def release(self, name: str) -> None:
+        with self._cond:
+            self.lanes[name].in_flight -= 1
+            self._cond.notify_all()
+
+    def _record_latency(self, name: str, start: float) -> None:
+        with self._cond:
+            latency = time.monotonic() - start
+            self.lanes[name].latencies.append(latency)
+            self.lanes[name].window.append(latency)
+            self._adjust()
+
+    def _adjust(self) -> None:
+        """AIMD on the batch limit, driven by interactive p95 (lock held)."""
+        now = time.monotonic()
+        if now < self._next_adjust:
+            return
+        self._next_adjust = now + SCHEDULER_ADJUST_INTERVAL
+        interactive, batch = self.lanes[INTERACTIVE], self.lanes[BATCH]
+        p95_ms = _percentile(interactive.window, 0.95) * 1000
+        if p95_ms > SCHEDULER_INTERACTIVE_P95_MS:
+            if batch.limit > 1:
+                batch.limit = max(batch.limit // 2, 1)
+                self.batch_throttled += 1
+        elif p95_ms < 0.8 * SCHEDULER_INTERACTIVE_P95_MS and batch.limit < batch.max_limit:
+            batch.limit += 1
+            self._cond.notify_all()
+        interactive.window.clear()
+
+    # ─── calls ───
+    def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """``fn(*args, **kwargs)`` in the current lane; a streamed response holds the slot until closed."""
+        name = current_lane.get()
+        start = self.acquire(name)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            self.release(name)
+            raise
+        if kwargs.get("stream"):
+            return HeldStream(result, lambda: self.release(name), lambda: self._record_latency(name, start))
+        self._record_latency(name, start)
+        self.release(name)
+        return result
+
+    async def arun(self, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        name = current_lane.get()
+        start = await self.aacquire(name)
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException:
+            self.release(name)
+            raise
+        if kwargs.get("stream"):
+            return AsyncHeldStream(result, lambda: self.release(name), lambda: self._record_latency(name, start))
+        self._record_latency(name, start)
+        self.release(name)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            lanes = {
+                name: {
+                    "limit": l.limit,
+                    "max_limit": l.max_limit,
+                    "in_flight": l.in_flight,
+                    "queue_depth": l.waiting,
+                    "max_queue_depth": l.max_waiting,
+                    "served": l.served,
+                    "wait_p50_ms": round(_percentile(l.waits, 0.5) * 1000, 1),
+                    "wait_p95_ms": round(_percentile(l.waits, 0.95) * 1000, 1),
+                    "latency_p95_ms": round(_percentile(l.latencies, 0.95) * 1000, 1),
+                }
+                for name, l in self.lanes.items()
+            }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "interactive_p95_target_ms": SCHEDULER_INTERACTIVE_P95_MS,
+                "batch_throttled": self.batch_throttled,
+                "lanes": lanes,
+            }
+
+
+scheduler = Scheduler()
+
+
+def get_scheduler_stats() -> Dict[str, Any]:
+    return scheduler.stats()
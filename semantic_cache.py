@@ -0,0 +1,167 @@
+"""
+Semantic answer cache for near-duplicate questions.
+
+Answers are stored with the (L2-normalized) embedding of the question that
+produced them. A new question whose cosine similarity to a stored question is
+at or above SEMANTIC_CACHE_THRESHOLD gets the stored answer and cited sources
+back, skipping retrieval and the chat completion.
+
+Entries are partitioned by scope (prompt, model, sampling settings, index), so
+a paraphrase only matches answers produced under the same settings. The
+assistant prefixes scope keys with the search index, so ``clear(prefix)``
+drops the answers built from one index. Each scope
+keeps its vectors in one float32 matrix and a lookup is a single
+matrix-vector product.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import (
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_MAX_SCOPES,
+    SEMANTIC_CACHE_TTL,
+)
+
+
+def scope_key(parts: Dict[str, Any]) -> str:
+    """Stable hash of the settings an answer depends on."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class _Scope:
+    def __init__(self, dim: int, capacity: int) -> None:
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.payloads: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+
+    def grow(self, capacity: int) -> None:
+        extra = capacity - self.vectors.shape[0]
+        self.vectors = np.vstack([self.vectors, np.zeros((extra, self.vectors.shape[1]), dtype=np.float32)])
+        self.payloads.extend([None] * extra)
+        self.created = np.concatenate([self.created, np.zeros(extra)])
+        self.last_used = np.concatenate([self.last_used, np.zeros(extra)])
+
+
+class SemanticCache:
+    """Per-scope NumPy similarity index with LRU eviction and TTL."""
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        max_scopes: int = SEMANTIC_CACHE_MAX_SCOPES,
+        ttl: Optional[float] = SEMANTIC_CACHE_TTL,
+        enabled: bool = SEMANTIC_CACHE_ENABLED,
+    ) -> None:
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self.ttl = ttl
+        self.enabled = enabled and max_entries > 0
+        self._scopes: Dict[str, _Scope] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stores = 0
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> Optional[np.ndarray]:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return None if norm == 0 else v / norm
+
+    def lookup(self, scope: str, vector: Sequence[float]) -> Optional[Dict[str, Any]]:
+        """
+        Best stored answer for ``vector`` in ``scope`` if its similarity clears
+        the threshold. The returned dict is the stored payload plus
+        ``similarity``.
+        """
+        q = self._unit(vector)
+        with self._lock:
+            self.lookups += 1
+            entry = self._scopes.get(scope)
+            if q is None or entry is None or entry.size == 0 or entry.vectors.shape[1] != q.shape[0]:
+                return None
+            n = entry.size
+            sims = entry.vectors[:n] @ q
+            if self.ttl:
+                sims[entry.created[:n] < time.time() - self.ttl] = -np.inf
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+            if similarity < self.threshold:
+                return None
+            entry.last_used[best] = time.time()
+            self.hits += 1
+            return {**entry.payloads[best], "similarity": round(similarity, 4)}
+
+    def store(self, scope: str, vector: Sequence[float], payload: Dict[str, Any]) -> None:
+        q = self._unit(vector)
+        if q is None or not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._scopes.get(scope)
+            if entry is None or entry.vectors.shape[1] != q.shape[0]:
+                if scope not in self._scopes and len(self._scopes) >= self.max_scopes:
+                    # drop the scope that was used least recently
+                    stale = min(self._scopes, key=lambda k: self._scopes[k].last_used.max())
+                    self.evictions += self._scopes.pop(stale).size
+                entry = self._scopes[scope] = _Scope(q.shape[0], min(64, self.max_entries))
+            n = entry.size
+            if n:
+                # refresh an existing near-identical entry instead of duplicating it
+                sims = entry.vectors[:n] @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= 0.999:
+                    entry.payloads[best] = payload
+                    entry.created[best] = entry.last_used[best] = now
+                    return
+            if n < self.max_entries:
+                if n == entry.vectors.shape[0]:
+                    entry.grow(min(2 * n, self.max_entries))
+                row = n
+                entry.size += 1
+            else:
+                expired = bool(self.ttl) and entry.created[:n].min() < now - self.ttl
+                row = int(np.argmin(entry.created[:n] if expired else entry.last_used[:n]))
+                if expired:
+                    self.expirations += 1
+                else:
+                    self.evictions += 1
+            entry.vectors[row] = q
+            entry.payloads[row] = payload
+            entry.created[row] = entry.last_used[row] = now
+            self.stores += 1
+
+    def clear(self, prefix: Optional[str] = None) -> int:
+        """Drop every scope, or those whose key starts with ``prefix``; returns the entries dropped."""
+        with self._lock:
+            stale = [k for k in self._scopes if prefix is None or k.startswith(prefix)]
+            return sum(self._scopes.pop(k).size for k in stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "scopes": len(self._scopes),
+                "entries": sum(s.size for s in self._scopes.values()),
+                "max_entries_per_scope": self.max_entries,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
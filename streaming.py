@@ -0,0 +1,423 @@
+"""
+Bookkeeping and Server-Sent Events transport for streamed answers.
+
+A stream ends in one of three ways: it completes, the client disconnects
+(the WSGI server closes the response generator, GeneratorExit reaches the
+assistant and the upstream completion is closed at once), or the request's
+deadline passes (the upstream completion is closed and the partial answer is
+finalized). Closing the upstream HTTP response stops generation, so tokens
+the model had not produced yet are neither billed nor waited for.
+
+In SSE mode a background thread runs the answer into an ``EventBuffer`` and
+the response only reads from it:
+
+- every event has the id ``<stream_id>:<seq>``; a comment heartbeat goes out
+  every SSE_HEARTBEAT seconds while nothing else does
+- a client that loses the connection resumes with
+  ``GET /api/stream_query/<stream_id>`` and ``Last-Event-ID``: it gets the
+  events it missed, then the live ones, without a second retrieval or
+  completion
+- with no client attached for SSE_RESUME_GRACE seconds the producer closes
+  the upstream completion, as on a plain disconnect
+- the producer thread holds the request's admission slot until the buffer is
+  finished, not just until the first client goes away; at most
+  SSE_MAX_PRODUCERS run at once per process
+
+Buffers are per process: a reconnect that reaches another gunicorn worker
+gets a 404 and has to send the query again.
+
+Answer text goes out in frames, one write (or token event) per
+STREAM_COALESCE_MS instead of one per model token, and held text is sent when
+its window ends even if no further token arrives: in SSE mode the buffer
+holds the text and the reading response flushes it on a timed wait; in text
+mode ``coalesce`` reads the answer on a helper thread and flushes on a timed
+queue read.
+"""
+import contextvars
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import Response
+
+from config import (
+    SSE_HEARTBEAT,
+    SSE_RESUME_GRACE,
+    SSE_RESUME_TTL,
+    SSE_RESUME_MAX_STREAMS,
+    SSE_MAX_PRODUCERS,
+    STREAM_COALESCE_MS,
+    STREAM_COALESCE_BYTES,
+)
+from token_utils import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# reconnection delay suggested to EventSource clients
+RECONNECT_MS = 2000
+HEARTBEAT_FRAME = ": ping\n\n"
+# what coalesce reads when the window of its held text is over
+_WINDOW_END = object()
+
+_lock = threading.Lock()
+_stats = {
+    "streams": 0,
+    "completed": 0,
+    "cancelled_disconnect": 0,
+    "cancelled_deadline": 0,
+    "errors": 0,
+    "tokens_streamed": 0,
+    "tokens_before_cancel": 0,
+    # max_tokens minus what was generated, summed over cancelled streams
+    "tokens_saved_max": 0,
+    "sse_streams": 0,
+    "sse_resumes": 0,
+    "sse_abandoned": 0,
+    "sse_rejected": 0,
+    # text pieces in, frames out of coalesce() and the SSE buffers
+    "pieces_coalesced": 0,
+    "frames_sent": 0,
+}
+
+
+def record_stream(pieces: List[str], outcome: str, max_tokens: Any) -> None:
+    """Count one upstream stream; ``outcome`` is "completed", "disconnect", "deadline" or "error"."""
+    tokens = count_tokens("".join(pieces))
+    with _lock:
+        _stats["streams"] += 1
+        _stats["tokens_streamed"] += tokens
+        if outcome in ("completed", "error"):
+            _stats["completed" if outcome == "completed" else "errors"] += 1
+            return
+        _stats[f"cancelled_{outcome}"] += 1
+        _stats["tokens_before_cancel"] += tokens
+        try:
+            _stats["tokens_saved_max"] += max(int(max_tokens) - tokens, 0)
+        except (TypeError, ValueError):
+            pass
+
+
+def _count(key: str) -> None:
+    with _lock:
+        _stats[key] += 1
+
+
+def coalesce(
+    chunks: Iterable[Any], window_ms: float = STREAM_COALESCE_MS, max_bytes: int = STREAM_COALESCE_BYTES
+) -> Iterator[Any]:
+    """
+    Group the text pieces of ``chunks`` into frames. The first piece goes out
+    at once; later ones are held until ``window_ms`` after the last frame, or
+    until ``max_bytes`` are held. Anything that is not text flushes the held
+    text and passes through as is.
+
+    ``chunks`` is read on a helper thread (in the caller's context) so held
+    text can go out when its window ends, not when the next piece arrives.
+    The helper owns ``chunks``: closing this generator makes it close them
+    after the piece it is waiting for, so callers must not close ``chunks``
+    themselves.
+    """
+    if window_ms <= 0:
+        yield from chunks
+        return
+    window = window_ms / 1000.0
+    # (finished, item): a chunk, or at the end None or the exception raised
+    items: "queue.Queue[Tuple[bool, Any]]" = queue.Queue()
+    stop = threading.Event()
+
+    def pump() -> None:
+        try:
+            for chunk in chunks:
+                items.put((False, chunk))
+                if stop.is_set():
+                    break
+        except BaseException as exc:
+            items.put((True, exc))
+        else:
+            items.put((True, None))
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(pump,), name="coalesce", daemon=True).start()
+    held: List[str] = []
+    size = pieces = frames = 0
+    last_frame = 0.0
+    try:
+        while True:
+            try:
+                finished, item = items.get(
+                    timeout=max(last_frame + window - time.monotonic(), 0) if held else None
+                )
+            except queue.Empty:
+                finished, item = False, _WINDOW_END
+            text = not finished and isinstance(item, str)
+            if text:
+                pieces += 1
+                held.append(item)
+                size += len(item.encode("utf-8"))
+            if held and (
+                not text or frames == 0 or time.monotonic() - last_frame >= window
+                or (max_bytes > 0 and size >= max_bytes)
+            ):
+                frames += 1
+                last_frame = time.monotonic()
+                yield "".join(held)
+                held, size = [], 0
+            if finished:
+                if item is not None:
+                    raise item
+                return
+            if not text and item is not _WINDOW_END:
+                yield item
+    finally:
+        stop.set()
+        with _lock:
+            _stats["pieces_coalesced"] += pieces
+            _stats["frames_sent"] += frames
+
+
+def format_event(event_id: str, event: str, data: Any) -> str:
+    """One SSE frame; ``data`` is sent as single-line JSON."""
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventBuffer:
+    """The events of one SSE stream, kept so a reconnecting client can replay them."""
+
+    def __init__(
+        self, stream_id: str, window_ms: float = STREAM_COALESCE_MS, max_bytes: int = STREAM_COALESCE_BYTES
+    ) -> None:
+        self.stream_id = stream_id
+        self.frames: List[str] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.consumers = 0
+        self.detached_at: Optional[float] = None
+        self.window = max(window_ms, 0) / 1000.0
+        self.max_bytes = max_bytes
+        # answer text not yet sent as a "token" event, and when the last one was
+        self._held: List[str] = []
+        self._held_bytes = 0
+        self._last_text: Optional[float] = None
+        self._cond = threading.Condition()
+
+    def _add(self, event: str, data: Any) -> None:
+        self.frames.append(format_event(f"{self.stream_id}:{len(self.frames) + 1}", event, data))
+
+    def _text_due(self) -> bool:
+        return (
+            self._last_text is None
+            or time.monotonic() - self._last_text >= self.window
+            or (self.max_bytes > 0 and self._held_bytes >= self.max_bytes)
+        )
+
+    def _flush_text(self) -> None:
+        """The held text as one "token" event (lock held)."""
+        if not self._held:
+            return
+        self._add("token", {"text": "".join(self._held)})
+        self._held, self._held_bytes = [], 0
+        self._last_text = time.monotonic()
+        _count("frames_sent")
+
+    def append(self, event: str, data: Any) -> None:
+        with self._cond:
+            self._flush_text()
+            self._add(event, data)
+            self._cond.notify_all()
+
+    def append_text(self, text: str) -> None:
+        """
+        Answer text, sent as "token" events: the first piece at once, later
+        ones grouped per coalescing window (or ``max_bytes``).
+        """
+        _count("pieces_coalesced")
+        with self._cond:
+            self._held.append(text)
+            self._held_bytes += len(text.encode("utf-8"))
+            if self._text_due():
+                self._flush_text()
+            # a reader waits out the rest of the window itself
+            self._cond.notify_all()
+
+    def finish(self) -> None:
+        with self._cond:
+            self._flush_text()
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._cond.notify_all()
+
+    def abandoned(self) -> bool:
+        """No client has been attached for SSE_RESUME_GRACE seconds."""
+        with self._cond:
+            return (
+                self.consumers == 0
+                and self.detached_at is not None
+                and time.monotonic() - self.detached_at > SSE_RESUME_GRACE
+            )
+
+    def read(self, after: int = 0) -> Iterator[str]:
+        """
+        Frames after sequence number ``after``, then live ones until the
+        stream is done. Held text is flushed when its window ends, so it goes
+        out even if the model sends nothing more for a while.
+        """
+        with self._cond:
+            self.consumers += 1
+            self.detached_at = None
+        try:
+            yield f"retry: {RECONNECT_MS}\n\n"
+            index = max(after, 0)
+            while True:
+                with self._cond:
+                    heartbeat_at = time.monotonic() + SSE_HEARTBEAT
+                    while len(self.frames) <= index and not self.done:
+                        if self._held and self._text_due():
+                            self._flush_text()
+                            break
+                        now = time.monotonic()
+                        if now >= heartbeat_at:
+                            break
+                        wait = heartbeat_at - now
+                        if self._held:
+                            wait = min(wait, self._last_text + self.window - now)
+                        self._cond.wait(max(wait, 0))
+                    frames, done = self.frames[index:], self.done
+                index += len(frames)
+                if frames:
+                    yield "".join(frames)
+                elif done:
+                    return
+                else:
+                    yield HEARTBEAT_FRAME
+        finally:
+            with self._cond:
+                self.consumers -= 1
+                if self.consumers == 0:
+                    self.detached_at = time.monotonic()
+
+
+_buffers: "OrderedDict[str, EventBuffer]" = OrderedDict()
+# producer threads running (guarded by _lock)
+_producers = 0
+
+
+def _expire_buffers() -> None:
+    """Drop expired streams, then the oldest ones beyond the cap (lock held)."""
+    now = time.monotonic()
+    for stream_id in [
+        sid for sid, b in _buffers.items()
+        if b.finished_at is not None and now - b.finished_at > SSE_RESUME_TTL
+    ]:
+        del _buffers[stream_id]
+    while len(_buffers) > max(SSE_RESUME_MAX_STREAMS, 1):
+        _buffers.popitem(last=False)
+
+
+def _produce(
+    buffer: EventBuffer, events: Iterator[Tuple[str, Any]], on_finish: Optional[Callable[[], None]]
+) -> None:
+    global _producers
+    try:
+        for event, data in events:
+            if event == "token":
+                buffer.append_text(data["text"])
+            else:
+                buffer.append(event, data)
+            if buffer.abandoned():
+                logger.info("SSE stream %s abandoned, cancelling it", buffer.stream_id)
+                _count("sse_abandoned")
+                break
+        else:
+            buffer.append("done", {})
+    except Exception as exc:
+        logger.error("SSE stream %s failed: %s", buffer.stream_id, exc)
+        buffer.append("error", {"error": str(exc)})
+        buffer.append("done", {})
+    finally:
+        try:
+            close = getattr(events, "close", None)
+            if close is not None:
+                close()
+            buffer.finish()
+        finally:
+            with _lock:
+                _producers -= 1
+            if on_finish is not None:
+                on_finish()
+
+
+def start_event_stream(
+    events: Iterator[Tuple[str, Any]], on_finish: Optional[Callable[[], None]] = None
+) -> Optional[EventBuffer]:
+    """
+    Run ``events`` ((event, data) pairs) into a new resumable buffer on a
+    background thread, which calls ``on_finish`` once the buffer is finished
+    (e.g. to release an admission slot). None, without starting anything,
+    when SSE_MAX_PRODUCERS are already running.
+    """
+    global _producers
+    buffer = EventBuffer(uuid.uuid4().hex)
+    with _lock:
+        if _producers >= max(SSE_MAX_PRODUCERS, 1):
+            _stats["sse_rejected"] += 1
+            return None
+        _producers += 1
+        _expire_buffers()
+        _buffers[buffer.stream_id] = buffer
+        _stats["sse_streams"] += 1
+    # the producer keeps the caller's context, e.g. its scheduler lane
+    context = contextvars.copy_context()
+    try:
+        threading.Thread(
+            target=context.run, args=(_produce, buffer, events, on_finish),
+            name=f"sse-{buffer.stream_id[:8]}", daemon=True,
+        ).start()
+    except BaseException:
+        with _lock:
+            _producers -= 1
+            _buffers.pop(buffer.stream_id, None)
+        raise
+    return buffer
+
+
+def get_event_buffer(stream_id: str) -> Optional[EventBuffer]:
+    with _lock:
+        _expire_buffers()
+        return _buffers.get(stream_id)
+
+
+def parse_event_id(stream_id: str, last_event_id: Optional[str]) -> int:
+    """Sequence number of ``last_event_id`` within ``stream_id``; 0 replays everything."""
+    sid, _, seq = (last_event_id or "").rpartition(":")
+    if sid != stream_id:
+        return 0
+    try:
+        return int(seq)
+    except ValueError:
+        return 0
+
+
+def sse_response(buffer: EventBuffer, after: int = 0, resumed: bool = False) -> Response:
+    """Streamed text/event-stream response for ``buffer``, with anti-buffering headers."""
+    if resumed:
+        _count("sse_resumes")
+    response = Response(buffer.read(after), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache, no-transform"
+    # nginx (and Render's proxy) would otherwise buffer the body
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["X-Stream-Id"] = buffer.stream_id
+    return response
+
+
+def get_stream_stats() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "sse_buffered": len(_buffers), "sse_producers": _producers}
@@ -0,0 +1,96 @@
+import pytest
+from flask import Flask, Response
+
+import admission
+from admission import AdmissionController, admit, detach_admission, get_controller
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(admission, "_controllers", {})
+    monkeypatch.setitem(admission.ROUTE_CLASSES, "test", {"concurrency": 1, "queue": 0, "timeout": 0})
+    app = Flask(__name__)
+    app.release = None
+
+    @app.route("/plain")
+    @admit("test")
+    def plain():
+        return "ok"
+
+    @app.route("/stream")
+    @admit("test")
+    def stream():
+        return Response(iter(["a", "b"]))
+
+    @app.route("/detached")
+    @admit("test")
+    def detached():
+        app.release = detach_admission()
+        return Response(iter(["a"]))
+
+    return app
+
+
+def test_controller_queues_then_times_out():
+    controller = AdmissionController("c", concurrency=1, queue=1, timeout=0.05)
+    admitted_at = controller.enter()
+    assert admitted_at is not None
+    assert controller.enter() is None
+    assert controller.counters["rejected_timeout"] == 1
+    controller.leave(admitted_at)
+    assert controller.enter() is not None
+
+
+def test_full_queue_rejects_at_once():
+    controller = AdmissionController("c", concurrency=1, queue=0, timeout=5)
+    controller.enter()
+    assert controller.enter() is None
+    assert controller.counters["rejected_full"] == 1
+    assert controller.retry_after() >= 1
+
+
+def test_rejection_is_503_with_retry_after(app):
+    controller = get_controller("test")
+    admitted_at = controller.enter()
+    response = app.test_client().get("/plain")
+    assert response.status_code == 503
+    wait = int(response.headers["Retry-After"])
+    assert wait >= 1
+    assert response.get_json()["retry_after"] == wait
+    controller.leave(admitted_at)
+    assert app.test_client().get("/plain").status_code == 200
+
+
+def test_plain_response_releases_its_slot(app):
+    client = app.test_client()
+    assert client.get("/plain").status_code == 200
+    assert get_controller("test").active == 0
+
+
+def test_streamed_response_holds_its_slot_until_closed(app):
+    client = app.test_client()
+    response = client.get("/stream", buffered=False)
+    assert get_controller("test").active == 1
+    assert client.get("/plain").status_code == 503
+    response.close()
+    assert get_controller("test").active == 0
+    assert client.get("/plain").status_code == 200
+
+
+def test_detached_slot_outlives_the_response(app):
+    client = app.test_client()
+    response = client.get("/detached", buffered=False)
+    response.get_data()
+    response.close()
+    controller = get_controller("test")
+    assert controller.active == 1
+    app.release()
+    app.release()
+    assert controller.active == 0
+
+
+def test_disabled_admission_runs_every_request(app, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", False)
+    get_controller("test").enter()
+    assert app.test_client().get("/plain").status_code == 200
@@ -0,0 +1,87 @@
+import asyncio
+import types
+
+import pytest
+
+import async_rag_assistant
+from async_rag_assistant import AsyncFlaskRAGAssistant, gather_rag_responses
+
+SETTINGS = {
+    "embedding_cache": False,
+    "retrieval_cache": False,
+    "semantic_cache": False,
+    "response_cache": False,
+    "compression": False,
+    "rerank": "off",
+}
+
+
+class FakeSearchClient:
+    def __init__(self) -> None:
+        self.active = self.max_active = 0
+
+    async def search(self, search_text, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            if search_text == "boom":
+                raise ConnectionError("search is down")
+        finally:
+            self.active -= 1
+
+        async def hits():
+            yield {"chunk": f"Notes on {search_text}.", "title": f"{search_text} guide", "@search.score": 1.0}
+
+        return hits()
+
+
+async def create_embeddings(model, input):
+    return types.SimpleNamespace(
+        data=[types.SimpleNamespace(index=i, embedding=[1.0, float(len(text))]) for i, text in enumerate(input)]
+    )
+
+
+async def create_completion(messages, stream=False, **kwargs):
+    query = messages[-1]["content"].rsplit("<user_query>", 1)[-1].strip().split()[0]
+    content = f"About {query}."
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    search = FakeSearchClient()
+    client = types.SimpleNamespace(
+        embeddings=types.SimpleNamespace(create=create_embeddings),
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create_completion)),
+    )
+
+    async def aclose():
+        pass
+
+    monkeypatch.setattr(async_rag_assistant, "get_async_search_client", lambda *args, **kwargs: search)
+    monkeypatch.setattr(async_rag_assistant, "aclose_async_clients", aclose)
+    monkeypatch.setattr(AsyncFlaskRAGAssistant, "async_openai_client", property(lambda self: client))
+    return search
+
+
+def test_gather_rag_responses_runs_every_query(fakes):
+    queries = ["alpha", "beta", "boom", "gamma", "delta"]
+    results = gather_rag_responses(queries, settings=SETTINGS, concurrency=2)
+
+    assert len(results) == len(queries)
+    for query, (answer, sources, _, evaluation, context) in zip(queries, results):
+        if query == "boom":
+            assert answer == "[RAG3] I encountered an error while generating the response."
+            assert sources == []
+        else:
+            assert answer == f"[RAG3] About {query}."
+            assert f"Notes on {query}." in context
+    assert fakes.max_active <= 2
+
+
+@pytest.mark.parametrize("name", ["_retrieve", "_rerank", "_compress", "_chat_answer", "_pack_context"])
+def test_inherited_sync_helpers_raise(name):
+    assistant = AsyncFlaskRAGAssistant()
+    with pytest.raises(TypeError, match=f"await _a{name[1:]}"):
+        getattr(assistant, name)("query", [], {})
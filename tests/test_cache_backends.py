@@ -0,0 +1,106 @@
+import socket
+import sqlite3
+import threading
+
+import pytest
+
+from bench_cache import _RespStandIn
+from cache import SERIALIZERS, RedisCache, SQLiteCache, get_cache
+
+
+@pytest.fixture
+def redis_url():
+    server = _RespStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "redis://127.0.0.1:%d/0" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def dead_redis_url():
+    # a port nothing listens on
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return "redis://127.0.0.1:%d/0" % port
+
+
+def test_sqlite_round_trip_prefix_delete_and_eviction(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), maxsize=3, namespace="test")
+    cache.set("docs:a", {"answer": [1, 2]})
+    cache.set("docs:b", "text")
+    cache.set("other:c", 3)
+    assert cache.get("docs:a") == {"answer": [1, 2]}
+    assert cache.delete_prefix("docs:") == 2
+    assert cache.get("docs:b") is None
+    cache.set("x", 1)
+    cache.set("y", 2)
+    cache.set("z", 3)
+    assert len(cache) == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_sqlite_float32_namespace_round_trip(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), namespace="embeddings", serializer=SERIALIZERS["float32"])
+    cache.set("k", [0.5, -1.25, 3.0])
+    assert cache.get("k") == (0.5, -1.25, 3.0)
+
+
+def test_sqlite_delete_errors_are_counted_not_raised(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), namespace="test")
+    cache.set("docs:a", 1)
+
+    def broken():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(cache, "_connection", broken)
+    assert cache.delete("docs:a") is False
+    assert cache.delete_prefix("docs:") is None
+    assert cache.clear() is None
+    assert cache.get("docs:a") is None
+    cache.set("docs:b", 2)
+    assert cache.stats()["errors"] == 5
+
+
+def test_redis_protocol_round_trip(redis_url):
+    cache = RedisCache(redis_url, namespace="test", ttl=60)
+    assert cache.get("missing") is None
+    cache.set("docs:a", {"answer": "x"})
+    cache.set("docs:b", [1, 2])
+    cache.set("other:c", 3)
+    assert cache.get("docs:a") == {"answer": "x"}
+    assert cache.delete("docs:a") is True
+    assert cache.delete("docs:a") is False
+    assert cache.delete_prefix("other:") == 1
+    assert cache.get("docs:b") == [1, 2]
+    assert cache.clear() == 1
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["sets"], stats["errors"]) == (2, 1, 3, 0)
+
+
+def test_redis_namespaces_do_not_collide(redis_url):
+    first = RedisCache(redis_url, namespace="one")
+    second = RedisCache(redis_url, namespace="two", serializer=SERIALIZERS["float32"])
+    first.set("k", "text")
+    second.set("k", [1.0, 2.0])
+    assert first.get("k") == "text"
+    assert second.get("k") == (1.0, 2.0)
+    assert first.clear() == 1
+    assert second.get("k") == (1.0, 2.0)
+
+
+def test_redis_errors_are_misses_and_failed_deletes(dead_redis_url):
+    cache = RedisCache(dead_redis_url, namespace="test", timeout=0.2)
+    assert cache.get("k", "default") == "default"
+    cache.set("k", 1)
+    assert cache.delete("k") is False
+    assert cache.delete_prefix("docs:") is None
+    assert cache.clear() is None
+    assert cache.stats()["errors"] == 5
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="Unknown cache backend"):
+        get_cache("test-unknown-backend", backend="memcached")
@@ -0,0 +1,68 @@
+import pytest
+
+import main
+import rag_assistant
+from semantic_cache import SemanticCache
+
+
+def test_clear_by_prefix_counts_entries():
+    cache = SemanticCache(threshold=0.9, max_entries=8, max_scopes=8, ttl=None, enabled=True)
+    cache.store("old:a", [1.0, 0.0], {"answer": "x"})
+    cache.store("old:a", [0.0, 1.0], {"answer": "y"})
+    cache.store("new:a", [1.0, 0.0], {"answer": "z"})
+    assert cache.clear("old:") == 2
+    assert cache.lookup("old:a", [1.0, 0.0]) is None
+    assert cache.lookup("new:a", [1.0, 0.0])["answer"] == "z"
+    assert cache.clear() == 1
+
+
+def test_semantic_scope_is_prefixed_with_the_index():
+    assistant = rag_assistant.FlaskRAGAssistant.__new__(rag_assistant.FlaskRAGAssistant)
+    for name in ("temperature", "top_p", "max_tokens", "presence_penalty", "frequency_penalty"):
+        setattr(assistant, name, 0)
+    assistant.deployment_name = "gpt"
+    cfg = {
+        "settings": {}, "search_index": "docs-v2", "rerank_mode": "off", "rerank_top_k": 5,
+        "context_token_budget": 0, "deployment_name": "gpt", "temperature": 0, "top_p": 1,
+        "max_tokens": 100, "presence_penalty": 0, "frequency_penalty": 0,
+    }
+    assert assistant._semantic_scope(cfg).startswith("docs-v2:")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(rag_assistant.semantic_cache, "enabled", True)
+    rag_assistant.semantic_cache.clear()
+    rag_assistant.semantic_cache.store("docs:scope", [1.0, 0.0], {"answer": "stale"})
+    rag_assistant.semantic_cache.store("other:scope", [1.0, 0.0], {"answer": "kept"})
+    yield main.app.test_client()
+    rag_assistant.semantic_cache.clear()
+
+
+def invalidate(client, **body):
+    return client.post("/api/cache/invalidate", json=body, headers={"X-Admin-Token": "secret"})
+
+
+def test_invalidation_clears_the_index_semantic_answers(client):
+    response = invalidate(client, index="docs")
+    assert response.status_code == 200
+    assert response.get_json()["semantic_removed"] == 1
+    assert rag_assistant.semantic_cache.lookup("docs:scope", [1.0, 0.0]) is None
+    assert rag_assistant.semantic_cache.lookup("other:scope", [1.0, 0.0])["answer"] == "kept"
+
+
+def test_invalidation_without_index_clears_every_answer(client):
+    assert invalidate(client).get_json()["semantic_removed"] == 2
+
+
+def test_semantic_answers_are_cleared_when_the_retrieval_backend_fails(client, monkeypatch):
+    monkeypatch.setattr(rag_assistant.retrieval_cache, "delete_prefix", lambda prefix: None)
+    response = invalidate(client, index="docs")
+    assert response.status_code == 503
+    body = response.get_json()
+    assert body["semantic_removed"] == 1 and "retrieval" in body["failed"]
+
+
+def test_invalidation_requires_the_admin_token(client):
+    assert client.post("/api/cache/invalidate", json={}).status_code == 403
@@ -0,0 +1,86 @@
+from citations import CitationRewriter, cite_sources
+
+SRC_MAP = {
+    "1": {"title": "Alpha", "content": "a"},
+    "2": {"title": "Beta", "content": "b", "url": "https://example.com/b"},
+    "12": {"title": "Twelve", "content": "l"},
+}
+
+
+def stream(pieces):
+    rewriter = CitationRewriter(SRC_MAP)
+    out = [rewriter.feed(piece) for piece in pieces]
+    out.append(rewriter.flush())
+    return out, rewriter
+
+
+def test_renumbers_in_first_cited_order():
+    answer, sources = cite_sources("See [2] and [1], again [2].", SRC_MAP)
+    assert answer == "See [1] and [2], again [1]."
+    assert [(s["id"], s["title"]) for s in sources] == [("1", "Beta"), ("2", "Alpha")]
+    assert sources[0]["url"] == "https://example.com/b"
+
+
+def test_unknown_ids_are_left_alone():
+    answer, sources = cite_sources("Nothing at [7], but [12].", SRC_MAP)
+    assert answer == "Nothing at [7], but [1]."
+    assert [s["title"] for s in sources] == ["Twelve"]
+
+
+def test_citation_split_across_chunks():
+    out, rewriter = stream(["Fact [1", "2] and [", "2", "]."])
+    assert out == ["Fact ", "[1] and ", "", "[2].", ""]
+    assert rewriter.text() == "Fact [1] and [2]."
+    assert [s["title"] for s in rewriter.sources()] == ["Twelve", "Beta"]
+
+
+def test_held_text_is_flushed_at_the_end():
+    out, rewriter = stream(["Unfinished [1"])
+    assert out == ["Unfinished ", "[1"]
+    assert rewriter.text() == "Unfinished [1"
+    assert rewriter.sources() == []
+
+
+def test_brackets_that_are_not_citations_pass_through():
+    out, rewriter = stream(["a [note] b [", "x] [12345]"])
+    assert rewriter.text() == "a [note] b [x] [12345]"
+
+
+def test_rewrite_closes_and_returns_the_source_value():
+    closed = []
+
+    def pieces():
+        try:
+            yield "One [2"
+            yield "] two"
+            return "meta"
+        finally:
+            closed.append(True)
+
+    rewriter = CitationRewriter(SRC_MAP)
+    gen = rewriter.rewrite(pieces())
+    out = []
+    try:
+        while True:
+            out.append(next(gen))
+    except StopIteration as stop:
+        value = stop.value
+    assert out == ["One ", "[1] two"]
+    assert value == "meta"
+    assert closed == [True]
+
+
+def test_closing_rewrite_closes_the_source():
+    closed = []
+
+    def pieces():
+        try:
+            while True:
+                yield "x"
+        finally:
+            closed.append(True)
+
+    gen = CitationRewriter(SRC_MAP).rewrite(pieces())
+    next(gen)
+    gen.close()
+    assert closed == [True]
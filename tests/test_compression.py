@@ -0,0 +1,60 @@
+import numpy as np
+
+import compression
+from compression import GAP, compress, join_kept, select_sentences, split_sentences
+from rag_assistant import FlaskRAGAssistant
+
+
+def test_split_sentences_on_ends_paragraphs_and_list_items():
+    text = "First point, e.g. this one. Second point! 3 items follow:\n- one\n- two\n\nNew paragraph"
+    assert split_sentences(text) == [
+        "First point, e.g. this one.", "Second point!", "3 items follow:", "- one", "- two", "New paragraph",
+    ]
+
+
+def test_select_keeps_the_best_sentence_with_its_neighbours_in_order():
+    sentences = ["Alpha beta gamma."] * 7
+    scores = np.array([0.1, 0.2, 0.3, 0.9, 0.2, 0.1, 0.0])
+    assert select_sentences(sentences, scores, budget=15, neighbors=1) == [2, 3, 4]
+    # without room for the neighbours the best sentence is kept alone
+    assert select_sentences(sentences, scores, budget=6, neighbors=1) == [3]
+
+
+def test_join_marks_every_gap():
+    sentences = ["A.", "B.", "C.", "D.", "E."]
+    assert join_kept(sentences, [1, 3]) == f"{GAP} B. {GAP} D. {GAP}"
+    assert join_kept(sentences, [0, 1]) == f"A. B. {GAP}"
+
+
+def test_compress_keeps_query_relevant_sentences_of_long_chunks(monkeypatch):
+    monkeypatch.setattr(compression, "COMPRESSION_MIN_SENTENCES", 2)
+    long_chunk = [f"Filler sentence number {i} about nothing much." for i in range(12)]
+    long_chunk[7] = "The warranty covers inverter faults for ten years."
+    short_chunk = ["Short and sweet."]
+    results = [{"chunk": " ".join(long_chunk), "title": "Long"}, {"chunk": short_chunk[0], "title": "Short"}]
+    vectors = [[0.0, 1.0]] * 12 + [[1.0, 1.0]]
+    vectors[7] = [1.0, 0.0]
+
+    out, stats = compress(results, [long_chunk, short_chunk], [1.0, 0.0], vectors, budget=40)
+
+    assert "The warranty covers inverter faults" in out[0]["chunk"]
+    assert out[0]["chunk"].startswith(GAP) and out[0]["chunk"].endswith(GAP)
+    assert stats["tokens_after"] < stats["tokens_before"]
+    assert stats["sentences_in"] == 13
+    assert out[1] is results[1]
+    assert results[0]["chunk"] == " ".join(long_chunk)
+
+
+def test_sentence_embeddings_are_not_persisted(monkeypatch):
+    assistant = FlaskRAGAssistant()
+    calls = []
+
+    def generate_embeddings(texts, use_cache=True, persist=True):
+        calls.append(persist)
+        return [[1.0, 0.0]] * len(texts)
+
+    monkeypatch.setattr(assistant, "generate_embedding", lambda text, use_cache=True: [1.0, 0.0])
+    monkeypatch.setattr(assistant, "generate_embeddings", generate_embeddings)
+    cfg = assistant.resolve_settings()
+    assistant._compress("query", [{"chunk": "One. Two. Three.", "title": "T"}], cfg)
+    assert calls == [False]
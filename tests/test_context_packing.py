@@ -0,0 +1,62 @@
+import pytest
+
+import rag_assistant
+from rag_assistant import FlaskRAGAssistant
+from token_utils import count_tokens, truncate_to_tokens
+
+SENTENCE = "Solar output depends on panel angle and cloud cover. "
+
+
+def hits(*chunks):
+    return [{"chunk": chunk, "title": f"Doc {i}"} for i, chunk in enumerate(chunks, 1)]
+
+
+@pytest.fixture
+def assistant(monkeypatch):
+    monkeypatch.setattr(rag_assistant, "CONTEXT_MIN_CHUNK_TOKENS", 20)
+    return FlaskRAGAssistant()
+
+
+def test_truncate_stays_within_the_budget_and_ends_on_a_break():
+    text = SENTENCE * 40
+    cut = truncate_to_tokens(text, 50)
+    assert count_tokens(cut) <= 50
+    assert cut.endswith(".")
+    assert text.startswith(cut)
+    assert truncate_to_tokens("short text", 50) == "short text"
+    assert truncate_to_tokens(text, 0) == ""
+
+
+def test_chunks_are_packed_in_rank_order_then_trimmed_then_dropped(assistant):
+    chunks = hits(SENTENCE * 4, SENTENCE * 20, SENTENCE * 4)
+    budget = count_tokens(chunks[0]["chunk"]) + 80
+    context, src_map, stats = assistant._prepare_context(chunks, limit=3, budget=budget)
+
+    assert (stats["chunks"], stats["trimmed"], stats["dropped"]) == (2, 1, 1)
+    assert stats["context_tokens"] <= budget
+    assert src_map["1"]["content"] == chunks[0]["chunk"].strip()
+    assert len(src_map["2"]["content"]) < len(chunks[1]["chunk"])
+    assert '<source id="3">' not in context
+
+
+def test_top_chunk_is_kept_when_the_prompt_fills_the_budget(assistant):
+    cfg = assistant.resolve_settings({
+        "context_token_budget": 100,
+        "system_prompt": "Answer carefully. " * 200,
+        "system_prompt_mode": "Override",
+    })
+    context, src_map, stats = assistant._fit_context("query", hits(SENTENCE * 20, SENTENCE), cfg, 0, None)
+
+    assert stats["prompt_overhead_tokens"] > 100
+    assert list(src_map) == ["1"]
+    assert stats["chunks"] == 1 and stats["trimmed"] == 1
+    assert context.startswith('<source id="1">Solar output')
+
+
+def test_zero_budget_disables_packing(assistant):
+    cfg = assistant.resolve_settings({"context_token_budget": 0, "rerank_top_k": 2})
+    chunks = hits(SENTENCE * 50, SENTENCE * 50, SENTENCE)
+    context, src_map, stats = assistant._fit_context("query", chunks, cfg, 0, None)
+    assert list(src_map) == ["1", "2"]
+    assert src_map["1"]["content"] == chunks[0]["chunk"].strip()
+    assert stats["context_tokens"] == count_tokens(context)
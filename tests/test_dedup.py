@@ -0,0 +1,40 @@
+from dedup import dedup, similarity_matrix
+
+PARAGRAPH = (
+    "The inverter converts direct current from the panels into alternating current "
+    "for the grid and shuts down when the grid voltage leaves its allowed range."
+)
+
+
+def hit(chunk, title):
+    return {"chunk": chunk, "title": title}
+
+
+def test_similarity_tracks_word_overlap():
+    sims = similarity_matrix([PARAGRAPH, PARAGRAPH + " It also logs faults.", "Batteries store surplus energy overnight."])
+    assert sims[0, 0] == 1.0
+    assert sims[0, 1] > 0.7
+    assert sims[0, 2] < 0.1
+
+
+def test_near_duplicates_collapse_into_the_higher_ranked_chunk():
+    results = [
+        hit(PARAGRAPH, "Manual"),
+        hit("Batteries store surplus energy overnight for use after sunset.", "Storage"),
+        hit(PARAGRAPH.upper() + " See section 4.", "Datasheet"),
+        hit(PARAGRAPH, "Manual"),
+    ]
+    kept, removed = dedup(results, threshold=0.7)
+
+    assert removed == 2
+    assert [r["title"] for r in kept] == ["Manual", "Storage"]
+    # the absorbed chunk's title is kept for citations, each title once
+    assert kept[0]["merged_titles"] == ["Datasheet"]
+    assert "merged_titles" not in kept[1]
+    assert "merged_titles" not in results[0]
+
+
+def test_distinct_chunks_are_all_kept():
+    results = [hit(PARAGRAPH, "A"), hit("Batteries store surplus energy overnight.", "B")]
+    assert dedup(results, threshold=0.7) == (results, 0)
+    assert dedup(results[:1]) == (results[:1], 0)
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+
+from embedding_batcher import AsyncEmbeddingBatcher, EmbeddingBatcher
+from scheduler import BATCH, INTERACTIVE, current_lane, lane
+
+
+class Recorder:
+    def __init__(self, gate: threading.Event = None) -> None:
+        self.calls = []
+        self.gate = gate
+
+    def __call__(self, texts):
+        self.calls.append((list(texts), current_lane.get()))
+        if self.gate is not None:
+            self.gate.wait(5)
+        return [[float(len(t))] for t in texts]
+
+
+def test_lone_caller_pays_no_window():
+    embed = Recorder()
+    batcher = EmbeddingBatcher(embed, window_ms=5000)
+    start = time.monotonic()
+    assert batcher.embed("abc") == [3.0]
+    assert time.monotonic() - start < 1
+    assert embed.calls == [(["abc"], INTERACTIVE)]
+
+
+def test_full_batch_is_sent_in_the_interactive_lane_when_any_member_is_interactive():
+    embed = Recorder()
+    batcher = EmbeddingBatcher(embed, window_ms=5000, max_batch=2)
+    batcher._in_flight = 1  # another request in flight: the leader opens a window
+    results = {}
+
+    def batch_caller():
+        with lane(BATCH):
+            results["batch"] = batcher.embed("a")
+
+    leader = threading.Thread(target=batch_caller)
+    leader.start()
+    while batcher._open is None:
+        time.sleep(0.001)
+    results["interactive"] = batcher.embed("bb")
+    leader.join(5)
+
+    assert results == {"batch": [1.0], "interactive": [2.0]}
+    assert embed.calls == [(["a", "bb"], INTERACTIVE)]
+
+
+def test_batch_only_members_stay_in_the_batch_lane():
+    embed = Recorder()
+    batcher = EmbeddingBatcher(embed, window_ms=0)
+    with lane(BATCH):
+        batcher.embed("a")
+    assert embed.calls == [(["a"], BATCH)]
+
+
+def test_second_leader_waits_its_window_while_a_batch_is_in_flight():
+    gate = threading.Event()
+    embed = Recorder(gate)
+    batcher = EmbeddingBatcher(embed, window_ms=50)
+    first = threading.Thread(target=batcher.embed, args=("first",))
+    first.start()
+    # the first batch is closed and in flight before embed_fn is even called
+    while not embed.calls:
+        time.sleep(0.001)
+    assert batcher._in_flight == 1
+
+    second = threading.Thread(target=batcher.embed, args=("second",))
+    second.start()
+    third = threading.Thread(target=batcher.embed, args=("third",))
+    time.sleep(0.01)
+    third.start()
+    gate.set()
+    for thread in (first, second, third):
+        thread.join(5)
+
+    assert [texts for texts, _ in embed.calls] == [["first"], ["second", "third"]]
+    assert batcher._in_flight == 0
+
+
+def test_follower_falls_back_to_a_direct_call_when_the_batch_stalls():
+    gate = threading.Event()
+    stalled = Recorder(gate)
+    batcher = EmbeddingBatcher(stalled, window_ms=5000, max_batch=2, wait_timeout=0.05)
+    batcher._in_flight = 1
+    leader = threading.Thread(target=batcher.embed, args=("a",))
+    leader.start()
+    while batcher._open is None:
+        time.sleep(0.001)
+
+    # the follower fills the batch, the leader sends it and the call hangs
+    assert batcher.embed("bb") == [2.0]
+    assert batcher.stats()["wait_timeouts"] == 1
+    assert [texts for texts, _ in stalled.calls] == [["a", "bb"], ["bb"]]
+    gate.set()
+    leader.join(5)
+
+
+def test_async_batch_runs_in_the_interactive_lane_when_any_member_is_interactive():
+    calls = []
+
+    async def embed(texts):
+        calls.append((list(texts), current_lane.get()))
+        return [[float(len(t))] for t in texts]
+
+    async def main():
+        batcher = AsyncEmbeddingBatcher(embed, window_ms=0)
+
+        async def in_batch_lane(text):
+            with lane(BATCH):
+                return await batcher.embed(text)
+
+        return await asyncio.gather(in_batch_lane("a"), batcher.embed("bb"))
+
+    assert asyncio.run(main()) == [[1.0], [2.0]]
+    assert calls == [(["a", "bb"], INTERACTIVE)]
+
+
+def test_async_caller_falls_back_when_the_batch_stalls():
+    release = None
+    calls = []
+
+    async def embed(texts):
+        calls.append(list(texts))
+        if len(calls) == 1:
+            await release.wait()
+        return [[float(len(t))] for t in texts]
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        batcher = AsyncEmbeddingBatcher(embed, window_ms=0, wait_timeout=0.05)
+        result = await batcher.embed("abc")
+        release.set()
+        await asyncio.sleep(0)
+        return result, batcher.stats()["wait_timeouts"]
+
+    assert asyncio.run(main()) == ([3.0], 1)
+    assert calls == [["abc"], ["abc"]]
@@ -0,0 +1,80 @@
+import types
+
+import numpy as np
+import pytest
+
+import cache
+import rag_assistant
+from cache import LRUCache, normalize_text
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def assistant(monkeypatch):
+    monkeypatch.setattr(rag_assistant, "embedding_cache", LRUCache(maxsize=8, namespace="embeddings"))
+    assistant = rag_assistant.FlaskRAGAssistant.__new__(rag_assistant.FlaskRAGAssistant)
+    assistant.embedding_deployment = "embedding-cache-test"
+    return assistant
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    lru = LRUCache(maxsize=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+    assert lru.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_their_ttl(clock):
+    lru = LRUCache(maxsize=4, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2, ttl=300)
+    clock.now += 61
+    assert lru.get("a") is None
+    assert lru.get("b") == 2
+    assert lru.stats()["expirations"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    lru = LRUCache(maxsize=0)
+    lru.set("a", 1)
+    assert lru.get("a") is None
+    assert len(lru) == 0
+
+
+def test_normalize_text_collapses_whitespace_and_unicode_forms():
+    assert normalize_text("  café\n\tlatte ") == normalize_text("café latte") == "café latte"
+
+
+def test_embeddings_are_cached_as_float32_arrays(assistant):
+    assistant._remember_embedding("query", [0.1, 0.2, 0.3], persist=False)
+
+    (stored,) = [value for value, _ in rag_assistant.embedding_cache._data.values()]
+    assert isinstance(stored, np.ndarray) and stored.dtype == np.float32
+    cached = assistant._cached_embedding("query", persistent=False)
+    assert isinstance(cached, list) and all(isinstance(x, float) for x in cached)
+    assert cached == pytest.approx([0.1, 0.2, 0.3], abs=1e-7)
+
+
+def test_cache_keys_include_the_deployment(assistant):
+    assistant._remember_embedding("query", [1.0], persist=False)
+    other = rag_assistant.FlaskRAGAssistant.__new__(rag_assistant.FlaskRAGAssistant)
+    other.embedding_deployment = "another-deployment"
+    assert other._cached_embedding("query", persistent=False) is None
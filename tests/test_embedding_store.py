@@ -0,0 +1,80 @@
+import sqlite3
+
+import numpy as np
+
+import rag_assistant
+from cache import LRUCache
+from embedding_store import EmbeddingStore
+
+
+def test_round_trip(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "dep")
+    assert store.get("hello") is None
+    assert store.put("hello", [0.5, 1.5, -2.0])
+    assert not store.put("hello", [9.0, 9.0, 9.0])
+    assert store.get("hello") == [0.5, 1.5, -2.0]
+    stats = store.stats()
+    assert (stats["rows"], stats["hits"], stats["writes"], stats["errors"]) == (1, 1, 1, 0)
+
+
+def test_constructor_does_not_touch_the_disk(tmp_path):
+    EmbeddingStore(str(tmp_path / "later"), "dep")
+    assert not (tmp_path / "later").exists()
+
+
+def test_unwritable_directory_is_a_miss_and_a_skipped_write(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("not a directory")
+    store = EmbeddingStore(str(blocker / "store"), "dep")
+    assert store.get("hello") is None
+    assert store.put("hello", [1.0, 2.0]) is False
+    assert store.stats()["errors"] == 2
+
+
+def test_corrupt_database_is_a_miss_and_a_skipped_write(tmp_path):
+    (tmp_path / "dep.sqlite").write_bytes(b"this is not a sqlite file" * 100)
+    store = EmbeddingStore(str(tmp_path), "dep")
+    assert store.get("hello") is None
+    assert store.put("hello", [1.0, 2.0]) is False
+    assert store.stats()["errors"] == 2
+
+
+def test_assistant_survives_a_failing_store(tmp_path, monkeypatch):
+    blocker = tmp_path / "file"
+    blocker.write_text("not a directory")
+    store = EmbeddingStore(str(blocker), "dep")
+    monkeypatch.setattr(rag_assistant, "get_embedding_store", lambda deployment: store)
+    assistant = rag_assistant.FlaskRAGAssistant.__new__(rag_assistant.FlaskRAGAssistant)
+    assistant.embedding_deployment = "store-failure-test"
+    assert assistant._cached_embedding("unseen text") is None
+    assistant._remember_embedding("unseen text", np.ones(3))
+    # still cached in memory
+    assert assistant._cached_embedding("unseen text") == [1.0, 1.0, 1.0]
+
+
+def test_assistant_survives_a_locked_database(monkeypatch):
+    def locked(deployment):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(rag_assistant, "get_embedding_store", locked)
+    assistant = rag_assistant.FlaskRAGAssistant.__new__(rag_assistant.FlaskRAGAssistant)
+    assistant.embedding_deployment = "store-locked-test"
+    assert assistant._cached_embedding("other text") is None
+    assistant._remember_embedding("other text", [2.0, 2.0])
+
+
+def test_store_hits_are_not_copied_into_the_worker_lru(tmp_path, monkeypatch):
+    store = EmbeddingStore(str(tmp_path), "dep")
+    store.put("warmed text", [0.25, 0.5])
+    lru = LRUCache(maxsize=8, namespace="embeddings")
+    monkeypatch.setattr(rag_assistant, "embedding_cache", lru)
+    monkeypatch.setattr(rag_assistant, "get_embedding_store", lambda deployment: store)
+    assistant = rag_assistant.FlaskRAGAssistant.__new__(rag_assistant.FlaskRAGAssistant)
+    assistant.embedding_deployment = "dep"
+
+    assert assistant._cached_embedding("warmed text") == [0.25, 0.5]
+    assert len(lru) == 0
+    # non-persistent texts (MMR chunks, compression sentences) skip the store
+    assert assistant._cached_embedding("warmed text", persistent=False) is None
+    assistant._remember_embedding("chunk text", [1.0], persist=False)
+    assert store.get("chunk text") is None
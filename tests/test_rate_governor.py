@@ -0,0 +1,192 @@
+import types
+
+import pytest
+
+import rate_governor
+from rate_governor import GovernorTimeout, RateGovernor, _Bucket
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_governor, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(rate_governor, "GOVERNOR_BACKOFF", 0.5)
+    monkeypatch.setattr(rate_governor, "GOVERNOR_MIN_CONCURRENCY", 1)
+    return clock
+
+
+class Throttled(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after=None) -> None:
+        super().__init__("429")
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = types.SimpleNamespace(headers=headers)
+
+
+def test_bucket_refills_per_minute(clock):
+    bucket = _Bucket(60)
+    bucket.level = 0
+    assert bucket.wait_for(1) == pytest.approx(1)
+    clock.now += 0.5
+    bucket.refill(clock.now)
+    assert bucket.level == pytest.approx(0.5)
+    clock.now += 600
+    bucket.refill(clock.now)
+    assert bucket.level == 60
+
+
+def test_oversized_request_waits_for_a_full_bucket(clock):
+    bucket = _Bucket(60)
+    assert bucket.wait_for(1000) == 0
+    bucket.level = 30
+    assert bucket.wait_for(1000) == pytest.approx(30)
+
+
+def test_rpm_bucket_limits_requests(clock):
+    governor = RateGovernor("d", rpm=2, tpm=0, max_concurrency=10, enabled=True)
+    assert governor._try_acquire(1) == 0
+    assert governor._try_acquire(1) == 0
+    assert governor._try_acquire(1) == pytest.approx(30)
+    clock.now += 30
+    assert governor._try_acquire(1) == 0
+
+
+def test_tpm_bucket_charges_estimated_tokens(clock):
+    governor = RateGovernor("d", rpm=0, tpm=600, max_concurrency=10, enabled=True)
+    assert governor._try_acquire(500) == 0
+    # 100 left, 200 more needed at 10 tokens/s
+    assert governor._try_acquire(300) == pytest.approx(20)
+    assert governor.stats()["tokens_available"] == 100
+
+
+def test_concurrency_limit_blocks_until_release(clock):
+    governor = RateGovernor("d", rpm=0, tpm=0, max_concurrency=1, enabled=True)
+    assert governor._try_acquire(1) == 0
+    assert governor._try_acquire(1) is None
+    governor.release()
+    assert governor._try_acquire(1) == 0
+
+
+def test_aimd_additive_increase(clock):
+    governor = RateGovernor("d", rpm=0, tpm=0, max_concurrency=8, enabled=True)
+    governor.limit = 4.0
+    for _ in range(4):
+        governor.in_flight += 1
+        governor.release()
+    # +1/limit per success: four successes at limit 4 add about one slot
+    assert 4.9 < governor.limit < 5.0
+    governor.limit = 8.0
+    governor.in_flight += 1
+    governor.release()
+    assert governor.limit == 8.0
+
+
+def test_aimd_multiplicative_decrease_once_per_burst(clock):
+    governor = RateGovernor("d", rpm=0, tpm=0, max_concurrency=16, enabled=True)
+    for _ in range(3):
+        governor.in_flight += 1
+        governor.release(Throttled())
+    assert governor.limit == 8.0
+    assert governor.counters["throttled"] == 3
+    clock.now += 1
+    governor.in_flight += 1
+    governor.release(Throttled())
+    assert governor.limit == 4.0
+
+
+def test_decrease_stops_at_min_concurrency(clock):
+    governor = RateGovernor("d", rpm=0, tpm=0, max_concurrency=2, enabled=True)
+    for _ in range(5):
+        governor.in_flight += 1
+        governor.release(Throttled())
+        clock.now += 1
+    assert governor.limit == 1.0
+
+
+def test_retry_after_pauses_the_deployment(clock):
+    governor = RateGovernor("d", rpm=0, tpm=0, max_concurrency=4, enabled=True)
+    governor.in_flight += 1
+    governor.release(Throttled(retry_after=5))
+    assert governor._try_acquire(1) == pytest.approx(5)
+    clock.now += 5
+    assert governor._try_acquire(1) == 0
+
+
+def test_acquire_times_out_past_max_wait(clock, monkeypatch):
+    monkeypatch.setattr(rate_governor, "GOVERNOR_MAX_WAIT", 10)
+    governor = RateGovernor("d", rpm=1, tpm=0, max_concurrency=4, enabled=True)
+    governor.acquire(1)
+    with pytest.raises(GovernorTimeout) as info:
+        governor.acquire(1)
+    assert info.value.retry_after == pytest.approx(60)
+
+
+def test_run_releases_with_usage_and_on_error(clock):
+    governor = RateGovernor("d", rpm=0, tpm=0, max_concurrency=4, enabled=True)
+    result = types.SimpleNamespace(usage=types.SimpleNamespace(total_tokens=42))
+    assert governor.run(10, lambda: result) is result
+    with pytest.raises(Throttled):
+        governor.run(10, lambda: (_ for _ in ()).throw(Throttled()))
+    stats = governor.stats()
+    assert stats["in_flight"] == 0
+    assert stats["tokens_used"] == 42
+    assert stats["throttled"] == 1
+
+
+def test_held_stream_keeps_the_permit_until_closed(clock):
+    governor = RateGovernor("d", rpm=0, tpm=0, max_concurrency=4, enabled=True)
+    stream = governor.run(10, lambda stream: iter(["a", "b"]), stream=True)
+    assert governor.in_flight == 1
+    assert list(stream) == ["a", "b"]
+    assert governor.in_flight == 0
+    stream.close()
+    assert governor.in_flight == 0
+
+
+def chunk(content=None, usage=None):
+    delta = types.SimpleNamespace(content=content)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=usage)
+
+
+def test_unused_max_tokens_go_back_to_the_tpm_bucket(clock):
+    governor = RateGovernor("d", rpm=0, tpm=1000, max_concurrency=4, enabled=True)
+    result = types.SimpleNamespace(usage=types.SimpleNamespace(total_tokens=150))
+    governor.run(400, lambda max_tokens: result, max_tokens=300)
+    assert governor.tokens.level == pytest.approx(850)
+    assert governor.stats()["tokens_used"] == 150
+
+
+def test_streamed_tokens_are_reconciled_when_the_stream_closes(clock):
+    governor = RateGovernor("d", rpm=0, tpm=1000, max_concurrency=4, enabled=True)
+    pieces = ["The inverter ", "shuts down ", "on grid faults."]
+    streamed = rate_governor.count_tokens("".join(pieces))
+
+    stream = governor.run(400, lambda **kw: iter([chunk(p) for p in pieces]), stream=True, max_tokens=300)
+    assert governor.tokens.level == pytest.approx(600)
+    list(stream)
+    assert governor.stats()["tokens_used"] == 100 + streamed
+    assert governor.tokens.level == pytest.approx(1000 - 100 - streamed)
+
+    # a client that disconnects is charged only for what was streamed
+    stream = governor.run(400, lambda **kw: iter([chunk(p) for p in pieces]), stream=True, max_tokens=300)
+    first = next(iter(stream))
+    stream.close()
+    assert governor.in_flight == 0
+    assert governor.stats()["tokens_used"] == 200 + streamed + rate_governor.count_tokens(first.choices[0].delta.content)
+
+
+def test_usage_reported_by_the_stream_wins_over_the_count(clock):
+    governor = RateGovernor("d", rpm=0, tpm=1000, max_concurrency=4, enabled=True)
+    chunks = [chunk("hello"), types.SimpleNamespace(choices=[], usage=types.SimpleNamespace(total_tokens=120))]
+    list(governor.run(400, lambda **kw: iter(chunks), stream=True, max_tokens=300))
+    assert governor.stats()["tokens_used"] == 120
+    assert governor.tokens.level == pytest.approx(880)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from rerank import bm25_scores, mmr, rerank
+
+
+def hit(chunk, relevance=1.0):
+    return {"chunk": chunk, "title": chunk[:10], "relevance": relevance}
+
+
+def test_bm25_prefers_rare_query_terms_and_shorter_documents():
+    docs = [
+        "the cat sat on the mat",
+        "the turbine blade cooling design",
+        "turbine blade cooling design notes and many other unrelated words about maintenance",
+    ]
+    scores = bm25_scores("turbine cooling", docs)
+    assert scores[0] == 0
+    assert scores[1] > scores[2] > 0
+
+
+def test_bm25_mode_reorders_by_lexical_match():
+    results = [hit("nothing relevant here", 3.0), hit("solar panel efficiency", 2.0), hit("panel", 1.0)]
+    ranked = rerank("solar panel efficiency", results, "bm25", k=2)
+    assert [r["chunk"] for r in ranked] == ["solar panel efficiency", "nothing relevant here"]
+    assert ranked[0]["rerank_score"] >= ranked[1]["rerank_score"]
+
+
+def test_mmr_skips_a_near_duplicate_of_the_first_pick():
+    docs = np.array([[1.0, 0.0], [0.99, 0.14], [0.6, 0.8]], dtype=np.float32)
+    docs /= np.linalg.norm(docs, axis=1, keepdims=True)
+    relevance = np.array([0.9, 0.89, 0.7])
+    assert mmr(docs, relevance, k=2, lam=0.5) == [0, 2]
+    # pure relevance ignores redundancy
+    assert mmr(docs, relevance, k=2, lam=1.0) == [0, 1]
+
+
+def test_mmr_mode_uses_the_query_vector():
+    results = [hit("a"), hit("b"), hit("c")]
+    ranked = rerank("q", results, "mmr", k=3, query_vec=[0.0, 1.0], doc_vecs=[[1, 0], [0, 1], [1, 1]])
+    assert ranked[0]["chunk"] == "b"
+    assert len(ranked) == 3
+
+
+def test_mmr_without_vectors_falls_back_to_lexical_order():
+    results = [hit("unrelated"), hit("wind farm output")]
+    ranked = rerank("wind farm", results, "mmr", k=1)
+    assert [r["chunk"] for r in ranked] == ["wind farm output"]
+
+
+def test_off_and_unknown_modes():
+    results = [hit("a"), hit("b")]
+    assert rerank("q", results, "off", k=1) == [results[0]]
+    with pytest.raises(ValueError):
+        rerank("q", results, "cross-encoder", k=1)
@@ -0,0 +1,134 @@
+import types
+
+import httpx
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, Dependency
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience, "time", types.SimpleNamespace(
+        monotonic=clock.monotonic, time=lambda: clock.now, sleep=lambda s: None,
+    ))
+    return clock
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+def transient():
+    return httpx.ConnectError("connection refused")
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.failure()
+    assert breaker.state == "closed" and breaker.allow() is None
+    breaker.failure()
+    assert breaker.state == "open"
+    assert breaker.allow() == pytest.approx(10)
+    clock.now += 4
+    assert breaker.allow() == pytest.approx(6)
+
+
+def test_half_open_allows_one_probe_then_closes(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+    breaker.failure()
+    clock.now += 10
+    assert breaker.allow() is None
+    assert breaker.state == "half_open"
+    # a second call waits for the probe's outcome
+    assert breaker.allow() == pytest.approx(10)
+    breaker.success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert breaker.allow() is None
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+    breaker.failure()
+    clock.now += 10
+    breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert breaker.times_opened == 2
+    assert breaker.allow() == pytest.approx(10)
+
+
+def test_lost_probe_expires(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+    breaker.failure()
+    clock.now += 10
+    breaker.allow()
+    clock.now += 10
+    assert breaker.allow() is None
+
+
+def test_disabled_breaker_never_opens(clock):
+    breaker = CircuitBreaker(threshold=0)
+    for _ in range(100):
+        breaker.failure()
+    assert breaker.allow() is None
+
+
+def test_dependency_retries_transient_errors(clock):
+    dep = Dependency("test", max_attempts=3)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise transient()
+        return "ok"
+
+    assert dep.call(flaky) == "ok"
+    stats = dep.stats()
+    assert (stats["calls"], stats["retries"], stats["failures"], stats["successes"]) == (1, 2, 2, 1)
+    assert stats["state"] == "closed"
+
+
+def test_dependency_does_not_retry_client_errors(clock):
+    dep = Dependency("test", max_attempts=3)
+    calls = []
+
+    def bad():
+        calls.append(1)
+        raise BadRequest()
+
+    with pytest.raises(BadRequest):
+        dep.call(bad)
+    assert len(calls) == 1
+    assert dep.stats()["failures"] == 0
+
+
+def test_dependency_fails_fast_while_open(clock):
+    dep = Dependency("test", max_attempts=1)
+    dep.breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+
+    def down():
+        raise transient()
+
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            dep.call(down)
+    with pytest.raises(CircuitOpenError) as info:
+        dep.call(lambda: "never sent")
+    assert info.value.retry_after == pytest.approx(30)
+    assert dep.stats()["short_circuited"] == 1
+
+    clock.now += 30
+    assert dep.call(lambda: "back") == "back"
+    assert dep.stats()["state"] == "closed"
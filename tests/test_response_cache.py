@@ -0,0 +1,65 @@
+import types
+
+import pytest
+
+import rag_assistant
+from cache import LRUCache
+from rag_assistant import FlaskRAGAssistant
+
+DETERMINISTIC = {"temperature": 0}
+
+
+def completion(content):
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def assistant(monkeypatch):
+    monkeypatch.setattr(rag_assistant, "response_cache", LRUCache(maxsize=16, namespace="responses"))
+    monkeypatch.setattr(rag_assistant, "RESPONSE_CACHE_DETERMINISTIC_ONLY", True)
+    assistant = FlaskRAGAssistant()
+    assistant.calls = []
+
+    def chat_completion(messages, cfg, stream=False):
+        assistant.calls.append(messages)
+        return completion(f"answer {len(assistant.calls)}")
+
+    monkeypatch.setattr(assistant, "_chat_completion", chat_completion)
+    return assistant
+
+
+def key(assistant, prompt="p", system_prompt=None, **settings):
+    cfg = assistant.resolve_settings(settings)
+    return assistant._response_cache_key(assistant._direct_messages(prompt, system_prompt), cfg)
+
+
+def test_only_deterministic_requests_are_cacheable(assistant):
+    assert key(assistant, temperature=0.3) is None
+    assert key(assistant, temperature=0) is not None
+    assert key(assistant, temperature=0, response_cache=False) is None
+
+
+def test_key_covers_the_whole_effective_request(assistant):
+    base = key(assistant, temperature=0)
+    assert key(assistant, temperature=0) == base
+    assert key(assistant, temperature=0, max_tokens=50) != base
+    assert key(assistant, system_prompt="be brief", temperature=0) != base
+    assert key(assistant, prompt="q", temperature=0) != base
+
+
+def test_repeat_completion_is_served_from_the_cache(assistant):
+    assert assistant.complete("summarize", settings=DETERMINISTIC) == "answer 1"
+    assert assistant.complete("summarize", settings=DETERMINISTIC) == "answer 1"
+    assert len(assistant.calls) == 1
+    # sampled requests always reach the model
+    assistant.complete("summarize", settings={"temperature": 0.7})
+    assistant.complete("summarize", settings={"temperature": 0.7})
+    assert len(assistant.calls) == 3
+
+
+def test_stream_complete_replays_a_cached_answer(assistant):
+    rag_assistant.response_cache.set(key(assistant, "summarize", temperature=0), "one two three four")
+    pieces = list(assistant.stream_complete("summarize", settings=DETERMINISTIC))
+    assert "".join(pieces) == "one two three four"
+    assert len(pieces) > 1
+    assert assistant.calls == []
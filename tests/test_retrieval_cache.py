@@ -0,0 +1,68 @@
+import pytest
+
+import rag_assistant
+from cache import LRUCache
+from rag_assistant import FlaskRAGAssistant, invalidate_retrieval_cache
+
+
+class FakeSearchClient:
+    def __init__(self) -> None:
+        self.calls = []
+
+    def search(self, search_text, **kwargs):
+        self.calls.append(search_text)
+        return [{"chunk": f"Notes on {search_text}.", "title": "Guide", "@search.score": 2.0}]
+
+
+@pytest.fixture
+def search(monkeypatch):
+    client = FakeSearchClient()
+    monkeypatch.setattr(rag_assistant, "retrieval_cache", LRUCache(maxsize=16, namespace="retrieval"))
+    monkeypatch.setattr(rag_assistant, "get_search_client", lambda endpoint, index, key: client)
+    return client
+
+
+@pytest.fixture
+def assistant(monkeypatch):
+    assistant = FlaskRAGAssistant(settings={"rerank": "off"})
+    monkeypatch.setattr(assistant, "generate_embedding", lambda text, use_cache=True: [1.0, 0.0])
+    return assistant
+
+
+def test_repeat_query_is_served_from_the_cache(search, assistant):
+    first, meta = assistant._retrieve("what is  RAG?", {"search_index": "docs"})
+    assert meta["cache"] == "miss"
+    second, meta = assistant._retrieve(" what is RAG? ", {"search_index": "docs"})
+    assert meta["cache"] == "hit"
+    assert second == first
+    assert len(search.calls) == 1
+
+
+def test_cache_key_includes_the_index(search, assistant):
+    assistant._retrieve("query", {"search_index": "docs"})
+    _, meta = assistant._retrieve("query", {"search_index": "other"})
+    assert meta == {"index": "other", "cache": "miss", "age_seconds": 0.0, "results": 1}
+    assert len(search.calls) == 2
+
+
+def test_request_setting_bypasses_the_cache(search, assistant):
+    assistant._retrieve("query", {"search_index": "docs"})
+    _, meta = assistant._retrieve("query", {"search_index": "docs", "retrieval_cache": False})
+    assert meta["cache"] == "bypass"
+    assert len(search.calls) == 2
+
+
+def test_callers_cannot_mutate_cached_results(search, assistant):
+    results, _ = assistant._retrieve("query", {"search_index": "docs"})
+    results[0]["chunk"] = "changed by a caller"
+    cached, _ = assistant._retrieve("query", {"search_index": "docs"})
+    assert cached[0]["chunk"] == "Notes on query."
+
+
+def test_invalidation_drops_only_the_given_index(search, assistant):
+    assistant._retrieve("query", {"search_index": "docs"})
+    assistant._retrieve("query", {"search_index": "other"})
+    assert invalidate_retrieval_cache("docs") == 1
+    assert assistant._retrieve("query", {"search_index": "docs"})[1]["cache"] == "miss"
+    assert assistant._retrieve("query", {"search_index": "other"})[1]["cache"] == "hit"
+    assert invalidate_retrieval_cache() == 2
@@ -0,0 +1,130 @@
+import threading
+import time
+import types
+
+import pytest
+
+import scheduler as scheduler_module
+from scheduler import BATCH, INTERACTIVE, Scheduler, current_lane, lane
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler_module, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_INTERACTIVE_P95_MS", 1000)
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_ADJUST_INTERVAL", 10)
+    return clock
+
+
+def wait_until(predicate) -> None:
+    for _ in range(500):
+        if predicate():
+            return
+        time.sleep(0.01)
+    raise AssertionError("condition never became true")
+
+
+def test_interactive_waiter_goes_before_queued_batch_waiters():
+    sched = Scheduler(max_concurrency=1, interactive=1, batch=1)
+    order = []
+
+    def call(name):
+        sched.acquire(name)
+        order.append(name)
+        sched.release(name)
+
+    sched.acquire(INTERACTIVE)
+    batch = threading.Thread(target=call, args=(BATCH,))
+    batch.start()
+    wait_until(lambda: sched.lanes[BATCH].waiting == 1)
+    interactive = threading.Thread(target=call, args=(INTERACTIVE,))
+    interactive.start()
+    wait_until(lambda: sched.lanes[INTERACTIVE].waiting == 1)
+
+    sched.release(INTERACTIVE)
+    batch.join(5)
+    interactive.join(5)
+    assert order == [INTERACTIVE, BATCH]
+
+
+def test_batch_lane_shrinks_while_interactive_p95_is_high_and_recovers(clock):
+    sched = Scheduler(max_concurrency=16, interactive=8, batch=8)
+    batch = sched.lanes[BATCH]
+
+    def interval(latency):
+        clock.now += 10
+        sched._record_latency(INTERACTIVE, clock.now - latency)
+
+    interval(2.0)
+    assert batch.limit == 4
+    interval(2.0)
+    interval(2.0)
+    interval(2.0)
+    assert batch.limit == 1
+    assert sched.batch_throttled == 3
+
+    # between 80% and 100% of the target: hold
+    interval(0.9)
+    assert batch.limit == 1
+    interval(0.1)
+    interval(0.1)
+    assert batch.limit == 3
+    for _ in range(10):
+        interval(0.1)
+    assert batch.limit == batch.max_limit == 8
+
+
+def test_latency_of_a_stream_is_taken_at_the_first_chunk(clock):
+    sched = Scheduler()
+
+    def open_stream(stream):
+        clock.now += 0.1
+        return iter(["a", "b"])
+
+    stream = sched.run(open_stream, stream=True)
+    assert not sched.lanes[INTERACTIVE].latencies
+    clock.now += 0.4
+    assert list(stream) == ["a", "b"]
+    assert list(sched.lanes[INTERACTIVE].latencies) == [pytest.approx(0.5)]
+    assert sched.lanes[INTERACTIVE].in_flight == 0
+
+
+def test_run_uses_the_lane_of_the_caller():
+    sched = Scheduler()
+    seen = []
+
+    def call():
+        seen.append((current_lane.get(), sched.lanes[BATCH].in_flight))
+
+    with lane(BATCH):
+        sched.run(call)
+    sched.run(call)
+    assert seen == [(BATCH, 1), (INTERACTIVE, 0)]
+    assert sched.lanes[BATCH].served == 1
+
+
+def test_batch_views_run_in_the_batch_lane(monkeypatch, tmp_path):
+    import main
+
+    seen = []
+
+    def generate_rag_result(query, settings):
+        seen.append(current_lane.get())
+        return {"answer": "a", "sources": [], "evaluation": {}, "context": "", "metadata": {}}
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.shared_assistant, "generate_rag_result", generate_rag_result)
+    response = main.app.test_client().post("/api/dev_eval_batch", json={"query": "q", "runs": 2})
+
+    assert response.status_code == 200
+    assert seen == [BATCH, BATCH]
+    assert current_lane.get() == INTERACTIVE
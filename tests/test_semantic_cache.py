@@ -0,0 +1,78 @@
+import types
+
+import pytest
+
+import semantic_cache
+from semantic_cache import SemanticCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(semantic_cache, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+def make_cache(**kwargs):
+    options = {"threshold": 0.95, "max_entries": 8, "max_scopes": 8, "ttl": None, "enabled": True}
+    return SemanticCache(**{**options, **kwargs})
+
+
+def test_paraphrase_above_the_threshold_hits():
+    cache = make_cache()
+    cache.store("s", [1.0, 0.0, 0.0], {"answer": "stored"})
+    hit = cache.lookup("s", [0.98, 0.1, 0.0])
+    assert hit["answer"] == "stored" and hit["similarity"] >= 0.95
+    assert cache.lookup("s", [0.7, 0.7, 0.0]) is None
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_scopes_and_dimensions_are_isolated():
+    cache = make_cache()
+    cache.store("s", [1.0, 0.0], {"answer": "a"})
+    assert cache.lookup("other", [1.0, 0.0]) is None
+    assert cache.lookup("s", [1.0, 0.0, 0.0]) is None
+    assert cache.lookup("s", [0.0, 0.0]) is None
+
+
+def test_storing_a_near_identical_question_replaces_the_answer():
+    cache = make_cache()
+    cache.store("s", [1.0, 0.0], {"answer": "old"})
+    cache.store("s", [1.0, 0.0001], {"answer": "new"})
+    assert cache.lookup("s", [1.0, 0.0])["answer"] == "new"
+    assert cache.stats()["entries"] == 1
+
+
+def test_full_scope_evicts_the_least_recently_used_entry(clock):
+    cache = make_cache(max_entries=2)
+    cache.store("s", [1.0, 0.0, 0.0], {"answer": "a"})
+    clock.now += 1
+    cache.store("s", [0.0, 1.0, 0.0], {"answer": "b"})
+    clock.now += 1
+    cache.lookup("s", [1.0, 0.0, 0.0])
+    clock.now += 1
+    cache.store("s", [0.0, 0.0, 1.0], {"answer": "c"})
+    assert cache.lookup("s", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("s", [1.0, 0.0, 0.0])["answer"] == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_answers_are_not_returned(clock):
+    cache = make_cache(ttl=60)
+    cache.store("s", [1.0, 0.0], {"answer": "a"})
+    clock.now += 61
+    assert cache.lookup("s", [1.0, 0.0]) is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = make_cache(enabled=False)
+    cache.store("s", [1.0, 0.0], {"answer": "a"})
+    assert cache.lookup("s", [1.0, 0.0]) is None
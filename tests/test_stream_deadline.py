@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+
+from async_rag_assistant import AsyncFlaskRAGAssistant
+from rag_assistant import FlaskRAGAssistant
+
+CFG = {"max_tokens": 100}
+
+
+def chunk(content):
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=content))])
+
+
+class BlockingStream:
+    """Upstream that sends ``chunks`` and then hangs until it is closed."""
+
+    def __init__(self, chunks) -> None:
+        self.chunks = chunks
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        yield from self.chunks
+        if not self.closed.wait(5):
+            raise AssertionError("stream was never closed")
+        raise ConnectionError("read on closed connection")
+
+    def close(self) -> None:
+        self.closed.set()
+
+
+def drain(gen):
+    pieces = []
+    try:
+        while True:
+            pieces.append(next(gen))
+    except StopIteration as stop:
+        return pieces, stop.value
+
+
+@pytest.mark.parametrize("chunks", [[], [chunk(None), chunk("")], [chunk("partial")]])
+def test_deadline_closes_a_stalled_upstream(chunks):
+    stream = BlockingStream(chunks)
+    collected = []
+    start = time.monotonic()
+    gen = FlaskRAGAssistant._stream_text(stream, CFG, collected, time.monotonic() + 0.1)
+    pieces, outcome = drain(gen)
+
+    assert outcome == "deadline"
+    assert time.monotonic() - start < 2
+    assert stream.closed.is_set()
+    assert pieces == collected == [c.choices[0].delta.content for c in chunks if c.choices[0].delta.content]
+
+
+class ListStream:
+    def __init__(self, chunks) -> None:
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_stream_without_deadline_completes():
+    stream = ListStream([chunk("a"), chunk(None), chunk("b")])
+    pieces, outcome = drain(FlaskRAGAssistant._stream_text(stream, CFG, [], None))
+    assert (pieces, outcome) == (["a", "b"], None)
+    assert stream.closed
+
+
+def test_upstream_error_before_the_deadline_is_raised():
+    class Broken(ListStream):
+        def __iter__(self):
+            raise ConnectionError("reset")
+
+    gen = FlaskRAGAssistant._stream_text(Broken([]), CFG, [], time.monotonic() + 5)
+    with pytest.raises(ConnectionError):
+        drain(gen)
+
+
+def test_async_deadline_closes_a_stalled_upstream():
+    class AsyncBlockingStream:
+        def __init__(self) -> None:
+            self.closed = False
+
+        async def __aiter__(self):
+            yield chunk(None)
+            await asyncio.sleep(5)
+            yield chunk("late")
+
+        async def close(self) -> None:
+            self.closed = True
+
+    async def main():
+        stream = AsyncBlockingStream()
+        state = {}
+        assistant = AsyncFlaskRAGAssistant.__new__(AsyncFlaskRAGAssistant)
+        start = time.monotonic()
+        pieces = [p async for p in assistant._astream_text(stream, CFG, [], time.monotonic() + 0.1, state)]
+        return pieces, state, stream.closed, time.monotonic() - start
+
+    pieces, state, closed, elapsed = asyncio.run(main())
+    assert pieces == []
+    assert state == {"cancelled": "deadline"}
+    assert closed
+    assert elapsed < 2
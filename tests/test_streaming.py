@@ -0,0 +1,199 @@
+import threading
+import time
+
+import pytest
+
+import streaming
+from streaming import EventBuffer, coalesce, parse_event_id, start_event_stream
+
+
+def events_of(frames):
+    """(id, event) pairs of the SSE frames in ``frames``."""
+    out = []
+    for frame in "".join(frames).split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.splitlines() if not line.startswith(":"))
+        if "event" in fields:
+            out.append((fields["id"], fields["event"]))
+    return out
+
+
+def finished_buffer():
+    buffer = EventBuffer("s1", window_ms=0)
+    buffer.append("sources", {"sources": []})
+    buffer.append_text("Hello")
+    buffer.append_text(" world")
+    buffer.append("done", {})
+    buffer.finish()
+    return buffer
+
+
+def test_read_replays_everything_with_ids():
+    frames = list(finished_buffer().read())
+    assert frames[0] == f"retry: {streaming.RECONNECT_MS}\n\n"
+    assert events_of(frames) == [
+        ("s1:1", "sources"), ("s1:2", "token"), ("s1:3", "token"), ("s1:4", "done"),
+    ]
+
+
+def test_resume_after_last_event_id():
+    buffer = finished_buffer()
+    after = parse_event_id("s1", "s1:2")
+    assert events_of(buffer.read(after)) == [("s1:3", "token"), ("s1:4", "done")]
+
+
+@pytest.mark.parametrize("last_event_id", [None, "", "other:3", "s1:x"])
+def test_foreign_or_bad_event_id_replays_from_start(last_event_id):
+    assert parse_event_id("s1", last_event_id) == 0
+
+
+def test_resumed_reader_gets_live_events():
+    buffer = EventBuffer("s2", window_ms=0)
+    buffer.append_text("a")
+    reader = buffer.read(1)
+    assert next(reader).startswith("retry:")
+    threading.Timer(0.05, lambda: (buffer.append("done", {}), buffer.finish())).start()
+    assert events_of(reader) == [("s2:2", "done")]
+
+
+def test_detached_buffer_is_abandoned_after_grace(monkeypatch):
+    monkeypatch.setattr(streaming, "SSE_RESUME_GRACE", 0)
+    buffer = EventBuffer("s3")
+    assert not buffer.abandoned()
+    reader = buffer.read()
+    next(reader)
+    assert not buffer.abandoned()
+    reader.close()
+    assert buffer.abandoned()
+
+
+def test_producer_releases_on_finish_and_buffer_is_resumable():
+    released = threading.Event()
+    gate = threading.Event()
+
+    def events():
+        yield "token", {"text": "hi"}
+        gate.wait(5)
+        yield "sources", {"sources": []}
+
+    buffer = start_event_stream(events(), on_finish=released.set)
+    assert streaming.get_event_buffer(buffer.stream_id) is buffer
+    assert not released.wait(0.05)
+    gate.set()
+    assert released.wait(5)
+    assert [event for _, event in events_of(buffer.read())] == ["token", "sources", "done"]
+
+
+def test_producer_cap(monkeypatch):
+    monkeypatch.setattr(streaming, "SSE_MAX_PRODUCERS", 1)
+    gate = threading.Event()
+
+    def events():
+        gate.wait(5)
+        yield "sources", {"sources": []}
+
+    first = start_event_stream(events())
+    assert first is not None
+    assert start_event_stream(iter(())) is None
+    gate.set()
+    list(first.read())
+
+
+def paced(*steps):
+    """Yield the strings in ``steps``, sleeping for the floats."""
+    for step in steps:
+        if isinstance(step, float):
+            time.sleep(step)
+        else:
+            yield step
+
+
+def timed(frames):
+    start = time.monotonic()
+    return [(frame, time.monotonic() - start) for frame in frames]
+
+
+def test_coalesce_groups_pieces_within_the_window():
+    frames = list(coalesce(paced("a", "b", "c", 0.15, "d"), window_ms=50))
+    assert frames == ["a", "bc", "d"]
+
+
+def test_coalesce_flushes_held_text_when_the_window_ends():
+    frames = timed(coalesce(paced("a", "b", 0.5, "c"), window_ms=50))
+    assert [f for f, _ in frames] == ["a", "b", "c"]
+    # "b" went out with its window, not with "c"
+    assert frames[1][1] < 0.3
+
+
+def test_coalesce_flushes_on_max_bytes_and_passes_other_items():
+    meta = {"sources": []}
+    frames = list(coalesce(iter(["a", "bb", "cc", "d", meta, "e"]), window_ms=10_000, max_bytes=4))
+    assert frames == ["a", "bbcc", "d", meta, "e"]
+
+
+def test_coalesce_disabled_passes_chunks_through():
+    assert list(coalesce(iter(["a", "b"]), window_ms=0)) == ["a", "b"]
+
+
+def test_coalesce_reraises_source_errors():
+    def failing():
+        yield "a"
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        list(coalesce(failing(), window_ms=50))
+
+
+def test_closing_coalesce_closes_the_source():
+    closed = threading.Event()
+
+    def endless():
+        try:
+            while True:
+                yield "x"
+                time.sleep(0.01)
+        finally:
+            closed.set()
+
+    frames = coalesce(endless(), window_ms=50)
+    assert next(frames) == "x"
+    frames.close()
+    assert closed.wait(2)
+
+
+def test_event_buffer_flushes_held_tokens_on_a_timer():
+    buffer = EventBuffer("s4", window_ms=50)
+    reader = buffer.read()
+    next(reader)
+    buffer.append_text("a")
+    buffer.append_text("b")
+    buffer.append_text("c")
+    start = time.monotonic()
+    first = next(reader)
+    second = next(reader)
+    # "bc" went out when its window ended, without a further token
+    assert time.monotonic() - start < 1
+    assert '"a"' in first and '"bc"' in second
+    buffer.finish()
+    assert list(reader) == []
+
+
+def test_sse_route_sends_candidates_before_the_answer(monkeypatch):
+    import main
+
+    def stream_rag_response(query, settings, candidates=False):
+        assert candidates
+        yield {"candidates": [{"id": "doc1", "title": "Doc 1"}]}
+        yield "Hello "
+        yield "[1]"
+        yield {"sources": [{"title": "Doc 1"}], "evaluation": {}, "metadata": {}}
+
+    monkeypatch.setattr(main.shared_assistant, "stream_rag_response", stream_rag_response)
+    response = main.app.test_client().post("/api/stream_query", json={"query": "q", "format": "sse"})
+    body = response.get_data(as_text=True)
+
+    assert response.mimetype == "text/event-stream"
+    events = [event for _, event in events_of([body])]
+    # the answer may go out in one or more token frames
+    runs = [event for i, event in enumerate(events) if i == 0 or event != events[i - 1]]
+    assert runs == ["sources", "token", "sources", "metrics", "done"]
+    assert body.index('"stage": "candidates"') < body.index('"text": "Hello ') < body.index('"stage": "cited"')
@@ -0,0 +1,77 @@
+"""
+Token counting for prompt budgeting.
+
+Uses tiktoken with TOKENIZER_ENCODING when it is installed. Without it,
+counts are estimated at CHARS_PER_TOKEN characters per token, which is
+close enough for English text to keep prompts within budget.
+"""
+import logging
+from functools import lru_cache
+from typing import Optional
+
+from config import TOKENIZER_ENCODING
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+# role and separator tokens the chat format adds around each message
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+@lru_cache(maxsize=4)
+def _encoding(name: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as exc:  # unknown name or encoding files unavailable offline
+        logger.warning("tiktoken encoding %s unavailable (%s); estimating tokens", name, exc)
+        return None
+
+
+def tokenizer_name(encoding: str = TOKENIZER_ENCODING) -> str:
+    return f"tiktoken:{encoding}" if _encoding(encoding) is not None else "estimate"
+
+
+def count_tokens(text: str, encoding: str = TOKENIZER_ENCODING) -> int:
+    if not text:
+        return 0
+    enc = _encoding(encoding)
+    if enc is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding: str = TOKENIZER_ENCODING) -> str:
+    """
+    Longest prefix of ``text`` within ``max_tokens``, cut back to the last
+    sentence end (or word break) so chunks don't end mid-word.
+    """
+    if max_tokens <= 0:
+        return ""
+    enc = _encoding(encoding)
+    if enc is None:
+        prefix = text[: max(0, (max_tokens - 1) * CHARS_PER_TOKEN)]
+    else:
+        ids = enc.encode(text, disallowed_special=())
+        if len(ids) <= max_tokens:
+            return text
+        prefix = enc.decode(ids[:max_tokens])
+    if len(prefix) >= len(text):
+        return text
+    cut = _last_break(prefix)
+    return prefix[:cut].rstrip() if cut else prefix.rstrip()
+
+
+def _last_break(text: str) -> Optional[int]:
+    # prefer a sentence end in the second half, then any whitespace
+    for marks in ((". ", "! ", "? ", ".\n", "\n"), (" ",)):
+        pos = max(text.rfind(m) for m in marks)
+        if pos >= len(text) // 2:
+            return pos + 1
+    return None